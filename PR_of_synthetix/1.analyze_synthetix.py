@@ -1,118 +1,170 @@
 import pandas as pd
-import requests
-import time
 import os
-import re
-import json
+import sys
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.detail_checkpoint import DetailCheckpoint
+from common.github_client import GitHubClient, fetch_pr_details, fetch_pull_pages, fetch_updated_pulls
+from common.github_graphql import fetch_merged_pulls_graphql, fetch_updated_pulls_graphql
+from common.http_cache import HttpCache
+from common.page_log import PageLog
+from common.pr_store import PrStore
+from common.pr_sync import get_high_water_mark, save_sync_state, sync_merged_prs
+from common import bug_fix_scoring
+
 # GitHub API相关参数
 REPO_OWNER = 'Synthetixio'  # 修改为Synthetixio
 REPO_NAME = 'synthetix'  # 修改为synthetix
-GITHUB_TOKEN = 'YOUR_GITHUB_TOKEN'
+SCORING_PROFILE = 'synthetix'  # common.bug_fix_scoring中的评分配置
+GITHUB_TOKEN = 'YOUR_GITHUB_TOKEN'  # 也可以是token列表，多个token按剩余配额分配请求
 
 # 输出路径
 OUTPUT_DIR = 'D:\\paper\\issues_of_synthetix'  # 修改为synthetix的目录
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, 'synthetix_merged_prs.xlsx')
-CACHE_FILE = os.path.join(OUTPUT_DIR, 'pr_cache.json')
+CACHE_DB = os.path.join(OUTPUT_DIR, 'pr_cache.db')  # PR缓存数据库
+CACHE_FILE = os.path.join(OUTPUT_DIR, 'pr_cache.json')  # 旧版JSON缓存，存在时导入数据库
+# 全量抓取的逐页日志，用于中断后继续；以.zst结尾时压缩存储（需要安装zstandard）
+PAGE_LOG_FILE = os.path.join(OUTPUT_DIR, 'pr_pages.jsonl')
+SYNC_STATE_FILE = os.path.join(OUTPUT_DIR, 'pr_sync_state.json')  # 增量同步的高水位线
+HTTP_CACHE_DIR = os.path.join(OUTPUT_DIR, 'http_cache')  # ETag条件请求缓存
+SCORE_CACHE_DB = os.path.join(OUTPUT_DIR, 'score_cache.db')  # 置信度缓存，只对内容变化过的PR重新评分
 
 # 请求重试配置
 MAX_RETRIES = 5
 RETRY_DELAY = 3  # 秒
 
+# PR列表页和PR详情请求的并发数
+PAGE_WORKERS = 4
+DETAIL_WORKERS = 8
+
+# 存在缓存时是否增量同步新合并的PR，False则直接使用缓存
+INCREMENTAL_SYNC = True
+
+# 需要通过详情请求获取的字段
+DETAIL_FIELDS = ['body', 'additions', 'deletions', 'changed_files']
+
+# 详情获取的检查点日志，记录中断或部分失败的运行中已完成的PR，全部获取成功后清空；RESUME_DETAILS为False时清空检查点重新获取
+DETAIL_CHECKPOINT_FILE = os.path.join(OUTPUT_DIR, 'pr_details_checkpoint.jsonl')
+RESUME_DETAILS = True
+
+# PR获取后端: 'rest' 或 'graphql'
+# graphql需要有效token，每次查询带回100个PR的正文和改动统计，无需逐个获取详情
+FETCH_BACKEND = 'rest'
+
+
+def simplify_pr(pr):
+    """只保留PR的必要字段，减少内存占用"""
+    simplified = {
+        'number': pr['number'],
+        'title': pr['title'],
+        'url': pr['url'],
+        'html_url': pr['html_url'],
+        'state': pr['state'],
+        'created_at': pr['created_at'],
+        'updated_at': pr['updated_at'],
+        'merged_at': pr['merged_at'],
+        'user': {'login': pr['user']['login']},
+        'labels': pr.get('labels', [])
+    }
+    # GraphQL后端已经带回了正文和改动统计，一并保留
+    if 'additions' in pr:
+        for key in DETAIL_FIELDS:
+            simplified[key] = pr[key]
+    return simplified
+
 
 def fetch_merged_prs(owner, repo, token=None):
     """使用GitHub API获取所有已合并的PR"""
-    # 首先检查是否有缓存
-    if os.path.exists(CACHE_FILE):
-        print(f"找到缓存文件，正在加载...")
-        try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                all_prs = json.load(f)
-            print(f"成功从缓存加载 {len(all_prs)} 个PR")
-            return all_prs
-        except Exception as e:
-            print(f"加载缓存失败: {e}")
-
-    all_prs = []
-    page = 1
-    per_page = 100
-
-    headers = {}
-    if token:
-        headers['Authorization'] = f'token {token}'
-
-    while True:
-        print(f"获取第{page}页PR...")
-        url = f"https://api.github.com/repos/{owner}/{repo}/pulls"
-        params = {
-            'state': 'closed',
-            'per_page': per_page,
-            'page': page
-        }
-
-        # 添加重试逻辑
-        for attempt in range(MAX_RETRIES):
+    with GitHubClient(token, max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY, concurrency=PAGE_WORKERS,
+                      cache=HttpCache(HTTP_CACHE_DIR)) as client, PrStore(CACHE_DB) as store:
+        # 首先检查是否有缓存，旧版的JSON缓存先导入数据库
+        repo_key = f"{owner}/{repo}"
+        if store.count_prs(repo_key) == 0 and os.path.exists(CACHE_FILE):
+            print(f"找到旧版缓存文件，正在导入数据库...")
             try:
-                response = requests.get(url, headers=headers, params=params, timeout=30)
-                response.raise_for_status()  # 抛出异常，如果请求失败
-                break
+                print(f"成功导入 {store.import_json(repo_key, CACHE_FILE)} 个PR")
             except Exception as e:
-                if attempt < MAX_RETRIES - 1:
-                    print(f"请求失败 (尝试 {attempt + 1}/{MAX_RETRIES}): {e}")
-                    print(f"等待 {RETRY_DELAY} 秒后重试...")
-                    time.sleep(RETRY_DELAY)
-                else:
-                    print(f"请求失败，已达到最大重试次数: {e}")
-                    # 保存已获取的PRs
-                    if all_prs:
-                        print(f"保存已获取的 {len(all_prs)} 个PR到缓存...")
-                        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-                            json.dump(all_prs, f, ensure_ascii=False, indent=2)
-                    return all_prs
-
-        if response.status_code != 200:
-            print(f"API请求失败: {response.status_code} - {response.text}")
-            break
-
-        prs = response.json()
-        if not prs:
-            break
-
-        # 过滤出已合并的PR (在这个阶段只获取基本信息)
-        for pr in prs:
-            if pr.get('merged_at'):
-                # 只保留必要的字段，减少内存占用
-                simplified_pr = {
-                    'number': pr['number'],
-                    'title': pr['title'],
-                    'url': pr['url'],
-                    'html_url': pr['html_url'],
-                    'state': pr['state'],
-                    'created_at': pr['created_at'],
-                    'merged_at': pr['merged_at'],
-                    'user': {'login': pr['user']['login']},
-                    'labels': pr.get('labels', [])
-                }
-                all_prs.append(simplified_pr)
-
-        page += 1
-
-        # 如果获取的PR数量小于每页数量，说明已经到最后一页
-        if len(prs) < per_page:
-            break
-
-        # 避免触发GitHub API速率限制
-        time.sleep(1)
-
-    print(f"共获取到 {len(all_prs)} 个已合并的PR")
-
-    # 保存到缓存文件
-    print("保存PR数据到缓存文件...")
-    with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(all_prs, f, ensure_ascii=False, indent=2)
-
-    return all_prs
+                print(f"导入缓存失败: {e}")
+
+        # 上次全量抓取中断时留下了抓取日志，继续全量抓取而不是增量同步
+        page_log = PageLog(PAGE_LOG_FILE)
+        cached_prs = None
+        if store.count_prs(repo_key) and not page_log.exists():
+            cached_prs = store.load_prs(repo_key)
+            print(f"成功从缓存加载 {len(cached_prs)} 个PR")
+
+        if cached_prs is not None:
+            if not INCREMENTAL_SYNC:
+                return cached_prs
+
+            # 只获取上次同步之后更新过的PR，合并进缓存
+            fetch_updated = fetch_updated_pulls_graphql if FETCH_BACKEND == 'graphql' else fetch_updated_pulls
+            all_prs, delta = sync_merged_prs(client, owner, repo, cached_prs, SYNC_STATE_FILE, simplify_pr,
+                                             fetch_updated=fetch_updated)
+            print(f"增量同步完成，新增或更新 {len(delta)} 个PR，共 {len(all_prs)} 个PR")
+            # 只写入变化的行
+            store.upsert_prs(repo_key, delta)
+            return all_prs
+
+        all_prs = []
+        per_page = 100
+
+        start_page = 1
+        if page_log.exists():
+            if FETCH_BACKEND == 'graphql':
+                # GraphQL按游标翻页，无法从页码继续
+                print("上次全量抓取中断，GraphQL后端从头重新抓取...")
+                page_log.clear()
+            else:
+                start_page = page_log.recover() + 1
+                all_prs = list(page_log.iter_records())
+                print(f"上次全量抓取中断，已恢复 {len(all_prs)} 个PR，从第{start_page}页继续...")
+        seen = {pr['number'] for pr in all_prs}
+
+        # REST后端在第1页确定总页数后并发获取其余页面，GraphQL后端按游标逐页获取
+        if FETCH_BACKEND == 'graphql':
+            pages = fetch_merged_pulls_graphql(client, owner, repo, per_page=per_page)
+        else:
+            pages = fetch_pull_pages(client, owner, repo, per_page=per_page, start_page=start_page)
+        for page, prs in pages:
+            if prs is None:
+                print(f"获取第{page}页PR失败，已达到最大重试次数")
+                # 之前的页面已经逐页写入缓存和抓取日志
+                if all_prs:
+                    print(f"已获取的 {len(all_prs)} 个PR已保存在缓存中，下次运行时继续抓取")
+                return all_prs
+
+            print(f"获取第{page}页PR...")
+
+            # 过滤出已合并的PR (在这个阶段只获取基本信息)
+            # 继续抓取时，新创建的PR会把旧PR挤到后面的页，跳过已经获取过的
+            page_prs = [simplify_pr(pr) for pr in prs if pr.get('merged_at') and pr['number'] not in seen]
+            seen.update(pr['number'] for pr in page_prs)
+            all_prs.extend(page_prs)
+
+            # 逐页写入缓存和抓取日志，中途失败时已获取的页面不会丢失
+            store.upsert_prs(repo_key, page_prs)
+            page_log.append_page(page, page_prs)
+
+        print(f"共获取到 {len(all_prs)} 个已合并的PR")
+
+        # 记录高水位线，供下次增量同步使用
+        mark = get_high_water_mark(all_prs)
+        if mark:
+            save_sync_state(SYNC_STATE_FILE, *mark)
+
+        # 全量抓取已完成，不再需要抓取日志
+        page_log.clear()
+        return all_prs
+
+
+def fill_pr_detail(df, idx, pr_detail):
+    """把PR详情写入DataFrame的一行，处理可能的空值"""
+    df.at[idx, 'body'] = pr_detail.get('body') or ''
+    df.at[idx, 'additions'] = pr_detail.get('additions', 0)
+    df.at[idx, 'deletions'] = pr_detail.get('deletions', 0)
+    df.at[idx, 'changed_files'] = pr_detail.get('changed_files', 0)
 
 
 def extract_pr_data(prs):
@@ -134,11 +186,19 @@ def extract_pr_data(prs):
             'author': pr['user']['login'],
             'html_url': pr['html_url']
         }
+        # GraphQL后端已经带回了正文和改动统计
+        if 'additions' in pr:
+            for key in DETAIL_FIELDS:
+                pr_info[key] = pr[key]
         pr_data.append(pr_info)
 
     # 创建DataFrame
     df = pd.DataFrame(pr_data)
 
+    if all('additions' in pr for pr in prs):
+        print("PR详细信息已通过GraphQL获取")
+        return df
+
     # 如果数据量太大，可以跳过详细信息获取
     if len(prs) > 500:  # Synthetix可能有更多PR，增加阈值
         print(f"PR数量过多 ({len(prs)}), 跳过获取详细信息...")
@@ -151,234 +211,59 @@ def extract_pr_data(prs):
         print("跳过获取PR详细信息，将只基于基本信息进行分析...")
         return df
 
-    # 批量获取PR详情
-    print("\n开始获取PR详细信息...")
-
-    # 对所有PR进行分批处理
-    batch_size = 10  # 每次处理10个PR
-    num_batches = (len(prs) + batch_size - 1) // batch_size
-
-    for batch_idx in range(num_batches):
-        start_idx = batch_idx * batch_size
-        end_idx = min(start_idx + batch_size, len(prs))
-
-        print(f"\n处理批次 {batch_idx + 1}/{num_batches} (PR {start_idx + 1}-{end_idx}/{len(prs)})...")
-
-        # 处理当前批次
-        for i in range(start_idx, end_idx):
-            pr = prs[i]
-            pr_number = pr['number']
-
-            print(f"  获取PR #{pr_number} 详情...")
-
-            # 获取PR详情
-            headers = {}
-            if GITHUB_TOKEN:
-                headers['Authorization'] = f'token {GITHUB_TOKEN}'
-
-            # 添加重试逻辑
-            detail_url = pr['url']
-            detail_response = None
-            success = False
-
-            for attempt in range(MAX_RETRIES):
-                try:
-                    detail_response = requests.get(detail_url, headers=headers, timeout=30)
-                    detail_response.raise_for_status()
-                    success = True
-                    break
-                except Exception as e:
-                    if attempt < MAX_RETRIES - 1:
-                        print(f"  获取详情失败 (尝试 {attempt + 1}/{MAX_RETRIES}): {e}")
-                        print(f"  等待 {RETRY_DELAY} 秒后重试...")
-                        time.sleep(RETRY_DELAY)
-                    else:
-                        print(f"  获取详情失败，已达到最大重试次数: {e}")
-
-            if not success or not detail_response or detail_response.status_code != 200:
+    # 并发获取PR详情，速率由客户端的调度器根据GitHub配额控制
+    print(f"\n开始获取PR详细信息 (并发数: {DETAIL_WORKERS})...")
+    with GitHubClient(GITHUB_TOKEN, max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY,
+                      concurrency=DETAIL_WORKERS, cache=HttpCache(HTTP_CACHE_DIR)) as client:
+        index_by_number = dict(zip(df['number'], df.index))
+
+        # 从检查点恢复已完成的PR详情，只请求剩余的PR
+        batch_size = 10
+        checkpoint = DetailCheckpoint(DETAIL_CHECKPOINT_FILE, DETAIL_FIELDS, batch_size=batch_size)
+        completed = checkpoint.load() if RESUME_DETAILS else checkpoint.reset()
+        for pr_number, pr_detail in completed.items():
+            if pr_number in index_by_number:
+                fill_pr_detail(df, index_by_number[pr_number], pr_detail)
+        pr_urls = [(pr['number'], pr['url']) for pr in prs if pr['number'] not in completed]
+        if completed:
+            print(f"从检查点恢复了 {len(prs) - len(pr_urls)} 个PR的详情，还需获取 {len(pr_urls)} 个")
+
+        failed = 0
+        details = fetch_pr_details(client, pr_urls)
+        for done, (pr_number, pr_detail) in enumerate(details, start=1):
+            if pr_detail is None:
                 print(f"  获取PR#{pr_number}详情失败")
-                continue
-
-            pr_detail = detail_response.json()
-
-            # 更新DataFrame中的值，处理可能的空值
-            idx = df['number'] == pr_number
-            df.loc[idx, 'body'] = pr_detail.get('body', '') if pr_detail.get('body') else ''
-            df.loc[idx, 'additions'] = pr_detail.get('additions', 0)
-            df.loc[idx, 'deletions'] = pr_detail.get('deletions', 0)
-            df.loc[idx, 'changed_files'] = pr_detail.get('changed_files', 0)
-
-            # 避免触发GitHub API速率限制
-            time.sleep(1)
+                failed += 1
+            else:
+                # 更新DataFrame中的值，并记入检查点
+                fill_pr_detail(df, index_by_number[pr_number], pr_detail)
+                checkpoint.add(pr_number, pr_detail)
 
-        # 每批次结束后保存一次，防止中途出错
-        print("  保存当前进度...")
-        progress_file = OUTPUT_FILE.replace('.xlsx', f'_progress_batch{batch_idx + 1}.xlsx')
-        with pd.ExcelWriter(progress_file) as writer:
-            df.to_excel(writer, index=False)
+            # 每批次结束后把这一批追加到检查点日志，防止中途出错；Excel只在最后由save_results导出一次
+            if done % batch_size == 0 or done == len(pr_urls):
+                checkpoint.flush()
+                print(f"  已完成 {done}/{len(pr_urls)}，已写入检查点")
 
-        # 批次间休息，避免过于频繁的请求
-        if batch_idx < num_batches - 1:
-            print(f"批次完成，休息5秒...")
-            time.sleep(5)
+        # 全部获取成功后清空检查点，下次运行重新获取，避免沿用已过期的详情；有失败时保留，重新运行只补取失败的PR
+        if failed == 0:
+            checkpoint.reset()
 
     return df
 
 
-def calculate_bug_fix_confidence(row):
-    """计算PR是否为bug修复的置信度"""
-    confidence = 0
-
-    # 安全获取字段值，处理可能的NaN值
-    title = str(row.get('title', '')) if pd.notna(row.get('title', '')) else ""
-    body = str(row.get('body', '')) if pd.notna(row.get('body', '')) else ""
-    labels = str(row.get('labels', '')) if pd.notna(row.get('labels', '')) else ""
-
-    # 转小写
-    title = title.lower()
-    body = body.lower()
-    labels = labels.lower()
-
-    # Synthetix特有的关键词
-    synthetix_keywords = ['synthetix', 'synth', 'snx', 'staking', 'collateral',
-                          'oracle', 'exchange', 'liquidation', 'debt', 'fee',
-                          'reward', 'eth collateral', 'l2', 'optimism', 'chainlink',
-                          'proxy', 'sip', 'keeper', 'havven', 'susd', 'seth']
-
-    # 高置信度关键词（标题中）
-    high_keywords_title = ['fix', 'bug', 'issue', 'error', 'crash', 'incorrect',
-                           'wrong', 'vulnerability', 'exploit', 'security', 'problem',
-                           'resolve', 'patch', 'overflow', 'underflow', 'revert']
-
-    # 中置信度关键词（标题中）
-    medium_keywords_title = ['update', 'improve', 'adjust', 'address', 'correct',
-                             'handle', 'prevent', 'validate', 'edge case']
-
-    # 高置信度关键词（正文中）
-    high_keywords_body = ['fixes #', 'closes #', 'resolves #', 'bugfix', 'fixed a bug',
-                          'edge case', 'race condition', 'overflow', 'underflow',
-                          'security vulnerability', 'incorrect calculation',
-                          'off-by-one', 'rounding error', 'revert']
-
-    # 降低置信度的词
-    negative_keywords = ['feature', 'enhancement', 'add', 'implement', 'introduce',
-                         'support', 'documentation', 'docs', 'refactor', 'cleanup',
-                         'style', 'formatting', 'typo', 'test']
-
-    # 标签中的关键词
-    high_confidence_labels = ['bug', 'fix', 'security', 'vulnerability', 'critical']
-    medium_confidence_labels = ['enhancement', 'improvement', 'contracts']
-    low_confidence_labels = ['documentation', 'refactor', 'style', 'test', 'chore']
-
-    # 检查Synthetix特有的标签
-    if 'sip' in labels:  # SIP = Synthetix Improvement Proposal
-        confidence += 5  # 可能与bug修复相关，但不一定
-
-    if 'bug' in labels or 'bugfix' in labels or 'fix' in labels:
-        confidence += 25
-
-    # 检查标签
-    for label in high_confidence_labels:
-        if label in labels:
-            confidence += 25
-            break
-
-    for label in medium_confidence_labels:
-        if label in labels:
-            confidence += 10
-            break
-
-    for label in low_confidence_labels:
-        if label in labels:
-            confidence -= 15
-            break
-
-    # 检查标题中的高置信度关键词
-    for keyword in high_keywords_title:
-        if keyword in title:
-            confidence += 20
-            break  # 找到一个就足够
-
-    # 检查标题中的中置信度关键词
-    for keyword in medium_keywords_title:
-        if keyword in title:
-            confidence += 10
-            break  # 找到一个就足够
-
-    # 检查正文中的高置信度关键词
-    for keyword in high_keywords_body:
-        if keyword in body:
-            confidence += 15
-            break  # 找到一个就足够
-
-    # 检查正文中是否引用了issue编号
-    issue_refs = []
-    issue_patterns = [
-        r'(?:fix|fixes|fixed|close|closes|closed|resolve|resolves|resolved)\s+#(\d+)',
-        r'(?:fix|fixes|fixed|close|closes|closed|resolve|resolves|resolved)\s+\w+/\w+#(\d+)'
-    ]
-    for pattern in issue_patterns:
-        matches = re.findall(pattern, body, re.IGNORECASE)
-        issue_refs.extend(matches)
-
-    if issue_refs:
-        confidence += 25
-
-    # 检查降低置信度的词
-    for keyword in negative_keywords:
-        if keyword in title.lower():
-            confidence -= 15
-            break  # 找到一个就足够
-
-    # 评估代码更改范围（只有当有详细信息时才评估）
-    if pd.notna(row.get('additions', 0)) and pd.notna(row.get('deletions', 0)):
-        changes = row.get('additions', 0) + row.get('deletions', 0)
-        if changes < 10:  # 小改动更可能是简单修复
-            confidence += 10
-        elif changes > 100:  # 大改动更可能是特性或重构
-            confidence -= 10
-
-    # 评估更改的文件数量（只有当有详细信息时才评估）
-    if pd.notna(row.get('changed_files', 0)):
-        changed_files = row.get('changed_files', 0)
-        if changed_files == 1:  # 单文件更改更可能是简单修复
-            confidence += 5
-        elif changed_files > 5:  # 多文件更改更可能是特性或重构
-            confidence -= 5
-
-    # Synthetix特有的加分
-    for keyword in synthetix_keywords:
-        if keyword in title or keyword in body:
-            confidence += 2  # 每个synthetix相关的关键词稍微增加一点置信度
-            break  # 只加一次
-
-    # 合约改动相关关键词
-    contract_keywords = ['contract', 'solidity', 'function', 'variable', 'struct',
-                         'library', 'interface', 'inheritance', 'gas', 'optimiz']
-
-    for keyword in contract_keywords:
-        if keyword in title or keyword in body:
-            confidence += 2  # 每个合约相关的关键词稍微增加一点置信度
-            break  # 只加一次
-
-    # 确保置信度在0-100之间
-    confidence = max(0, min(confidence, 100))
-
-    return confidence
+def calculate_bug_fix_confidence(df):
+    """计算每个PR是否为bug修复的置信度，关键词表和权重见common.bug_fix_scoring中的协议配置"""
+    return bug_fix_scoring.calculate_bug_fix_confidence(df, SCORING_PROFILE, cache_db=SCORE_CACHE_DB)
 
 
 def analyze_prs(df):
     """分析PR数据，计算bug修复置信度"""
     # 计算置信度
     print("\n计算bug修复置信度...")
-    df['bug_fix_confidence'] = df.apply(calculate_bug_fix_confidence, axis=1)
+    df['bug_fix_confidence'] = calculate_bug_fix_confidence(df)
 
     # 根据置信度分类
-    df['confidence_level'] = pd.cut(
-        df['bug_fix_confidence'],
-        bins=[0, 30, 60, 100],
-        labels=['低', '中', '高']
-    )
+    df['confidence_level'] = bug_fix_scoring.confidence_levels(df['bug_fix_confidence'], SCORING_PROFILE)
 
     # 统计各置信度级别的数量
     confidence_counts = df['confidence_level'].value_counts().sort_index()
@@ -1,86 +1,78 @@
 import pandas as pd
-import requests
-import time
 import os
-import re  # 添加这一行
+import sys
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.github_client import GitHubClient, fetch_pr_details, fetch_pull_pages
+from common.github_graphql import fetch_merged_pulls_graphql
+from common.http_cache import HttpCache
+from common import bug_fix_scoring
+
 # GitHub API相关参数
 REPO_OWNER = 'Uniswap'
 REPO_NAME = 'v2-core'
-GITHUB_TOKEN = 'YOUR_GITHUB_TOKEN'  # 如果有的话，可以提高API限制
+SCORING_PROFILE = 'uniswap_v2'  # common.bug_fix_scoring中的评分配置
+GITHUB_TOKEN = 'YOUR_GITHUB_TOKEN'  # 如果有的话，可以提高API限制；也可以是token列表
 
 # 输出路径
 OUTPUT_DIR = 'D:\\paper\\issues_of_uniswap_v2'
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, 'uniswap_v2_core_merged_prs.xlsx')
+HTTP_CACHE_DIR = os.path.join(OUTPUT_DIR, 'http_cache')  # ETag条件请求缓存
+SCORE_CACHE_DB = os.path.join(OUTPUT_DIR, 'score_cache.db')  # 置信度缓存，只对内容变化过的PR重新评分
+
+# PR列表页和PR详情请求的并发数
+PAGE_WORKERS = 4
+DETAIL_WORKERS = 8
+
+# PR获取后端: 'rest' 或 'graphql'
+# graphql需要有效token，每次查询带回100个PR的正文和改动统计，无需逐个获取详情
+FETCH_BACKEND = 'rest'
 
 
 def fetch_merged_prs(owner, repo, token=None):
     """使用GitHub API获取所有已合并的PR"""
     all_prs = []
-    page = 1
     per_page = 100
 
-    headers = {}
-    if token:
-        headers['Authorization'] = f'token {token}'
-
-    while True:
-        print(f"获取第{page}页PR...")
-        url = f"https://api.github.com/repos/{owner}/{repo}/pulls"
-        params = {
-            'state': 'closed',
-            'per_page': per_page,
-            'page': page
-        }
-
-        response = requests.get(url, headers=headers, params=params)
-
-        if response.status_code != 200:
-            print(f"API请求失败: {response.status_code} - {response.text}")
-            break
-
-        prs = response.json()
-        if not prs:
-            break
-
-        # 过滤出已合并的PR
-        merged_prs = [pr for pr in prs if pr.get('merged_at')]
-        all_prs.extend(merged_prs)
-
-        page += 1
+    # REST后端在第1页确定总页数后并发获取其余页面，GraphQL后端按游标逐页获取
+    with GitHubClient(token, concurrency=PAGE_WORKERS, cache=HttpCache(HTTP_CACHE_DIR)) as client:
+        if FETCH_BACKEND == 'graphql':
+            pages = fetch_merged_pulls_graphql(client, owner, repo, per_page=per_page)
+        else:
+            pages = fetch_pull_pages(client, owner, repo, per_page=per_page)
+        for page, prs in pages:
+            if prs is None:
+                print(f"获取第{page}页PR失败")
+                break
 
-        # 如果获取的PR数量小于每页数量，说明已经到最后一页
-        if len(prs) < per_page:
-            break
+            print(f"获取第{page}页PR...")
 
-        # 避免触发GitHub API速率限制
-        time.sleep(1)
+            # 过滤出已合并的PR
+            merged_prs = [pr for pr in prs if pr.get('merged_at')]
+            all_prs.extend(merged_prs)
 
-    print(f"共获取到 {len(all_prs)} 个已合并的PR")
-    return all_prs
+        print(f"共获取到 {len(all_prs)} 个已合并的PR")
+        return all_prs
 
 
 def extract_pr_data(prs):
     """从PR数据中提取我们需要的信息"""
     pr_data = []
 
+    # 并发获取PR的额外信息（特别是PR内容），GraphQL后端已经带回了这些字段
+    with GitHubClient(GITHUB_TOKEN, concurrency=DETAIL_WORKERS, cache=HttpCache(HTTP_CACHE_DIR)) as client:
+        pr_urls = [(pr['number'], pr['url']) for pr in prs if 'additions' not in pr]
+        details = dict(fetch_pr_details(client, pr_urls))
+
     for pr in prs:
-        # 获取PR的额外信息（特别是PR内容）
-        pr_detail_url = pr['url']
-        headers = {}
-        if GITHUB_TOKEN:
-            headers['Authorization'] = f'token {GITHUB_TOKEN}'
-
-        detail_response = requests.get(pr_detail_url, headers=headers)
-        if detail_response.status_code == 200:
-            pr_detail = detail_response.json()
+        if 'additions' in pr:
+            pr_detail = pr
         else:
-            print(f"获取PR#{pr['number']}详情失败")
-            pr_detail = {}
-
-        # 避免触发GitHub API速率限制
-        time.sleep(1)
+            pr_detail = details.get(pr['number'])
+            if pr_detail is None:
+                print(f"获取PR#{pr['number']}详情失败")
+                pr_detail = {}
 
         # 提取PR的基本信息
         pr_info = {
@@ -105,106 +97,19 @@ def extract_pr_data(prs):
     return df
 
 
-def calculate_bug_fix_confidence(row):
-    """计算PR是否为bug修复的置信度"""
-    confidence = 0
-
-    # 安全获取字段值，处理可能的NaN值
-    title = str(row.get('title', '')) if pd.notna(row.get('title', '')) else ""
-    body = str(row.get('body', '')) if pd.notna(row.get('body', '')) else ""
-
-    # 转小写
-    title = title.lower()
-    body = body.lower()
-
-    # 高置信度关键词（标题中）
-    high_keywords_title = ['fix', 'bug', 'issue', 'error', 'crash', 'incorrect',
-                           'wrong', 'vulnerability', 'exploit', 'security', 'problem',
-                           'resolve', 'patch']
-
-    # 中置信度关键词（标题中）
-    medium_keywords_title = ['update', 'improve', 'adjust', 'address', 'correct',
-                             'handle', 'prevent', 'validate']
-
-    # 高置信度关键词（正文中）
-    high_keywords_body = ['fixes #', 'closes #', 'resolves #', 'bugfix', 'fixed a bug',
-                          'edge case', 'race condition', 'overflow', 'underflow',
-                          'security vulnerability', 'incorrect calculation']
-
-    # 降低置信度的词
-    negative_keywords = ['feature', 'enhancement', 'add', 'implement', 'introduce',
-                         'support', 'documentation', 'docs', 'refactor', 'cleanup',
-                         'style', 'formatting', 'typo']
-
-    # 检查标题中的高置信度关键词
-    for keyword in high_keywords_title:
-        if keyword in title:
-            confidence += 20
-            break  # 找到一个就足够
-
-    # 检查标题中的中置信度关键词
-    for keyword in medium_keywords_title:
-        if keyword in title:
-            confidence += 10
-            break  # 找到一个就足够
-
-    # 检查正文中的高置信度关键词
-    for keyword in high_keywords_body:
-        if keyword in body:
-            confidence += 15
-            break  # 找到一个就足够
-
-    # 检查正文中是否引用了issue编号
-    issue_refs = []
-    issue_patterns = [
-        r'(?:fix|fixes|fixed|close|closes|closed|resolve|resolves|resolved)\s+#(\d+)',
-        r'(?:fix|fixes|fixed|close|closes|closed|resolve|resolves|resolved)\s+\w+/\w+#(\d+)'
-    ]
-    for pattern in issue_patterns:
-        matches = re.findall(pattern, body, re.IGNORECASE)
-        issue_refs.extend(matches)
-
-    if issue_refs:
-        confidence += 25
-
-    # 检查降低置信度的词
-    for keyword in negative_keywords:
-        if keyword in title.lower():
-            confidence -= 15
-            break  # 找到一个就足够
-
-    # 评估代码更改范围
-    changes = row.get('additions', 0) + row.get('deletions', 0)
-    if changes < 10:  # 小改动更可能是简单修复
-        confidence += 10
-    elif changes > 100:  # 大改动更可能是特性或重构
-        confidence -= 10
-
-    # 评估更改的文件数量
-    changed_files = row.get('changed_files', 0)
-    if changed_files == 1:  # 单文件更改更可能是简单修复
-        confidence += 5
-    elif changed_files > 5:  # 多文件更改更可能是特性或重构
-        confidence -= 5
-
-    # 确保置信度在0-100之间
-    confidence = max(0, min(confidence, 100))
-
-    return confidence
+def calculate_bug_fix_confidence(df):
+    """计算每个PR是否为bug修复的置信度，关键词表和权重见common.bug_fix_scoring中的协议配置"""
+    return bug_fix_scoring.calculate_bug_fix_confidence(df, SCORING_PROFILE, cache_db=SCORE_CACHE_DB)
 
 
 def analyze_prs(df):
     """分析PR数据，计算bug修复置信度"""
     # 计算置信度
     print("\n计算bug修复置信度...")
-    df['bug_fix_confidence'] = df.apply(calculate_bug_fix_confidence, axis=1)
+    df['bug_fix_confidence'] = calculate_bug_fix_confidence(df)
 
     # 根据置信度分类
-    df['confidence_level'] = pd.cut(
-        df['bug_fix_confidence'],
-        bins=[0, 30, 60, 100],
-        labels=['低', '中', '高']
-    )
+    df['confidence_level'] = bug_fix_scoring.confidence_levels(df['bug_fix_confidence'], SCORING_PROFILE)
 
     # 统计各置信度级别的数量
     confidence_counts = df['confidence_level'].value_counts().sort_index()
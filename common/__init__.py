@@ -0,0 +1 @@
+"""各分析脚本共享的公共组件"""
@@ -0,0 +1,382 @@
+"""按协议配置计算PR的bug修复置信度
+
+各协议的评分规则相同，只有关键词表、额外的标签加分和分级阈值不同，这些都以数据的形式写在PROFILES中。
+ScoringEngine把所有协议配置的关键词按文本列（标题、正文、标签）各编译成一个KeywordMatcher，一个进程内只编译一次；
+多个数据集一起评分时先把各列拼接起来，每列只在其中不同的词上匹配一遍，再按各行所属的协议配置累加分数。
+
+命令行用法（在仓库根目录运行），一次对所有数据集重新评分:
+    python -m common.bug_fix_scoring
+    python -m common.bug_fix_scoring --dataset aave=PR_of_aave/aave_protocol_merged_prs.xlsx
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache, partial
+
+import numpy as np
+import pandas as pd
+
+from common.keyword_matcher import KeywordMatcher
+from common.parallel import map_frame
+from common.score_cache import ScoreCache, content_hashes
+from common.scoring import TextColumn, change_size_score, clip_confidence, matches_any, numeric_column, text_values
+
+# 评分规则的版本，规则或关键词表变化时递增
+SCORER_VERSION = 2
+
+# 高置信度关键词（标题中）
+TITLE_HIGH_KEYWORDS = ['fix', 'bug', 'issue', 'error', 'crash', 'incorrect',
+                       'wrong', 'vulnerability', 'exploit', 'security', 'problem',
+                       'resolve', 'patch', 'overflow', 'underflow']
+
+# 中置信度关键词（标题中）
+TITLE_MEDIUM_KEYWORDS = ['update', 'improve', 'adjust', 'address', 'correct',
+                         'handle', 'prevent', 'validate', 'edge case']
+
+# 高置信度关键词（正文中）
+BODY_HIGH_KEYWORDS = ['fixes #', 'closes #', 'resolves #', 'bugfix', 'fixed a bug',
+                      'edge case', 'race condition', 'overflow', 'underflow',
+                      'security vulnerability', 'incorrect calculation',
+                      'off-by-one', 'rounding error']
+
+# 降低置信度的词（标题中）
+NEGATIVE_KEYWORDS = ['feature', 'enhancement', 'add', 'implement', 'introduce',
+                     'support', 'documentation', 'docs', 'refactor', 'cleanup',
+                     'style', 'formatting', 'typo', 'test']
+
+# 标签中的关键词
+HIGH_CONFIDENCE_LABELS = ['bug', 'fix', 'security', 'vulnerability']
+MEDIUM_CONFIDENCE_LABELS = ['enhancement', 'improvement']
+LOW_CONFIDENCE_LABELS = ['documentation', 'refactor', 'style', 'test']
+
+# 合约改动相关关键词
+CONTRACT_KEYWORDS = ['contract', 'solidity', 'function', 'variable', 'struct',
+                     'library', 'interface', 'inheritance', 'gas', 'optimiz']
+
+# 正文中引用issue编号的模式，与原来逐行计算时一样忽略大小写匹配（re.IGNORECASE比str.lower()多折叠ſ等字符）；
+# 动词写成公共前缀加后缀（fix|fixes|fixed -> fix(?:es|ed)?），匹配的文本不变，正则引擎不必在每个位置逐个尝试
+ISSUE_PATTERNS = [
+    r'(?:fix(?:es|ed)?|close[sd]?|resolve[sd]?)\s+#(\d+)',
+    r'(?:fix(?:es|ed)?|close[sd]?|resolve[sd]?)\s+\w+/\w+#(\d+)'
+]
+# 每个issue引用模式都包含的字符，只有含这个字符的正文才需要用正则检查
+ISSUE_MARKER = '#'
+
+# 各组关键词命中时的加减分
+WEIGHTS = {
+    'label_high': 25,
+    'label_medium': 10,
+    'label_low': -15,
+    'title_high': 20,
+    'title_medium': 10,
+    'body_high': 15,
+    'issue_reference': 25,
+    'negative': -15,
+    'protocol': 2,   # 协议相关的关键词出现在标题或正文中，只加一次
+    'contract': 2    # 合约相关的关键词出现在标题或正文中，只加一次
+}
+
+# 置信度分级: 区间(0, 30]为低，(30, 60]为中，(60, 100]为高
+CONFIDENCE_BINS = [0, 30, 60, 100]
+CONFIDENCE_LABELS = ['低', '中', '高']
+
+# 各协议的评分配置
+#   keywords    各组关键词，没有的组不参与评分
+#   label_bonus 协议特有的标签加分 {组名: ([关键词, ...], 分数)}
+#   bins/labels 置信度分级的阈值和名称
+PROFILES = {
+    'uniswap_v3': {
+        'repo': 'Uniswap/v3-core',
+        'keywords': {
+            'title_high': TITLE_HIGH_KEYWORDS,
+            'title_medium': TITLE_MEDIUM_KEYWORDS,
+            'body_high': BODY_HIGH_KEYWORDS,
+            'negative': NEGATIVE_KEYWORDS,
+            'label_high': HIGH_CONFIDENCE_LABELS,
+            'label_medium': MEDIUM_CONFIDENCE_LABELS,
+            'label_low': LOW_CONFIDENCE_LABELS,
+            'protocol': ['v3', 'v3-core', 'pool', 'tick', 'sqrt price', 'fee tier',
+                         'concentrated liquidity', 'range', 'position', 'oracle',
+                         'swap', 'mint', 'burn', 'flash'],
+            'contract': CONTRACT_KEYWORDS
+        }
+    },
+    'aave': {
+        'repo': 'aave/aave-protocol',
+        'keywords': {
+            'title_high': TITLE_HIGH_KEYWORDS,
+            'title_medium': TITLE_MEDIUM_KEYWORDS,
+            'body_high': BODY_HIGH_KEYWORDS,
+            'negative': NEGATIVE_KEYWORDS,
+            'label_high': HIGH_CONFIDENCE_LABELS,
+            'label_medium': MEDIUM_CONFIDENCE_LABELS,
+            'label_low': LOW_CONFIDENCE_LABELS,
+            'protocol': ['aave', 'lending', 'pool', 'borrow', 'deposit', 'flash loan',
+                         'liquidation', 'collateral', 'interest rate', 'reserve',
+                         'oracle', 'governance', 'staking', 'lendingpool'],
+            'contract': CONTRACT_KEYWORDS
+        }
+    },
+    'synthetix': {
+        'repo': 'Synthetixio/synthetix',
+        'keywords': {
+            'title_high': TITLE_HIGH_KEYWORDS + ['revert'],
+            'title_medium': TITLE_MEDIUM_KEYWORDS,
+            'body_high': BODY_HIGH_KEYWORDS + ['revert'],
+            'negative': NEGATIVE_KEYWORDS,
+            'label_high': HIGH_CONFIDENCE_LABELS + ['critical'],
+            'label_medium': MEDIUM_CONFIDENCE_LABELS + ['contracts'],
+            'label_low': LOW_CONFIDENCE_LABELS + ['chore'],
+            'protocol': ['synthetix', 'synth', 'snx', 'staking', 'collateral',
+                         'oracle', 'exchange', 'liquidation', 'debt', 'fee',
+                         'reward', 'eth collateral', 'l2', 'optimism', 'chainlink',
+                         'proxy', 'sip', 'keeper', 'havven', 'susd', 'seth'],
+            'contract': CONTRACT_KEYWORDS
+        },
+        'label_bonus': {
+            # SIP = Synthetix Improvement Proposal，可能与bug修复相关，但不一定
+            'sip': (['sip'], 5),
+            'bug': (['bug', 'bugfix', 'fix'], 25)
+        }
+    },
+    'openzeppelin': {
+        'repo': 'OpenZeppelin/openzeppelin-contracts',
+        'keywords': {
+            'title_high': TITLE_HIGH_KEYWORDS + ['revert', 'unsafe'],
+            'title_medium': TITLE_MEDIUM_KEYWORDS,
+            'body_high': BODY_HIGH_KEYWORDS + ['reentrancy', 'double spend'],
+            'negative': NEGATIVE_KEYWORDS,
+            'label_high': HIGH_CONFIDENCE_LABELS + ['critical', 'bugfix'],
+            'label_medium': MEDIUM_CONFIDENCE_LABELS,
+            'label_low': LOW_CONFIDENCE_LABELS + ['chore'],
+            'protocol': ['openzeppelin', 'erc20', 'erc721', 'erc1155', 'token',
+                         'access control', 'ownable', 'safemath', 'cryptography',
+                         'security', 'upgradeable', 'proxy', 'governance', 'access',
+                         'pausable', 'reentrancy', 'eip', 'modifier', 'abstract'],
+            'contract': CONTRACT_KEYWORDS
+        },
+        'label_bonus': {
+            'security': (['security'], 30),  # 安全相关的修复通常很重要
+            'bug': (['bug', 'bugfix', 'fix'], 25)
+        }
+    },
+    'uniswap_v2': {
+        # v2用的是较早的关键词表（少了各表末尾的几个词），不看标签，也没有协议和合约相关的加分
+        'repo': 'Uniswap/v2-core',
+        'keywords': {
+            'title_high': TITLE_HIGH_KEYWORDS[:-2],
+            'title_medium': TITLE_MEDIUM_KEYWORDS[:-1],
+            'body_high': BODY_HIGH_KEYWORDS[:-2],
+            'negative': NEGATIVE_KEYWORDS[:-1]
+        }
+    }
+}
+
+# 各组关键词所在的文本列，protocol和contract两组在标题或正文中出现都算
+GROUP_COLUMNS = {
+    'title_high': ['title'],
+    'title_medium': ['title'],
+    'negative': ['title'],
+    'body_high': ['body'],
+    'label_high': ['labels'],
+    'label_medium': ['labels'],
+    'label_low': ['labels'],
+    'protocol': ['title', 'body'],
+    'contract': ['title', 'body']
+}
+
+TEXT_COLUMNS = ['title', 'body', 'labels']
+NUMERIC_COLUMNS = ['additions', 'deletions', 'changed_files']
+
+# 批量评分命令行默认处理的数据集（各脚本保存的Excel，相对仓库根目录）
+DATASETS = {
+    'uniswap_v3': os.path.join('PR_of_uniswap_v3', 'uniswap_v3_core_merged_prs.xlsx'),
+    'aave': os.path.join('PR_of_aave', 'aave_protocol_merged_prs.xlsx'),
+    'synthetix': os.path.join('PR_of_synthetix', 'synthetix_merged_prs.xlsx'),
+    'openzeppelin': os.path.join('PR_of_openzeppelin', 'openzeppelin_merged_prs.xlsx'),
+    'uniswap_v2': os.path.join('PR_of_uniswap_v2', 'uniswap_v2_core_merged_prs.xlsx')
+}
+DATASET_SHEET = '所有已合并PR'
+SCORED_OUTPUT_FILE = 'scored_merged_prs.xlsx'
+
+
+def scoring_frame(df):
+    """只取评分用到的列并规范化: 文本列的空值为空字符串，数值列为浮点数；缺失的文本列视为空字符串，缺失的数值列视为0"""
+    columns = {}
+    for column in TEXT_COLUMNS:
+        columns[column] = text_values(df, column)
+    for column in NUMERIC_COLUMNS:
+        columns[column] = numeric_column(df, column)
+    return pd.DataFrame(columns)
+
+
+def profile_fingerprint(profile):
+    """评分配置的指纹，评分规则的版本、关键词表或权重变化时随之变化"""
+    settings = [SCORER_VERSION, PROFILES[profile], WEIGHTS, GROUP_COLUMNS, ISSUE_PATTERNS]
+    return hashlib.sha1(json.dumps(settings, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ScoringEngine:
+    """编译好的多协议评分器，所有协议的同一列关键词编译成一个KeywordMatcher"""
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        # {列名: {(协议, 组名): [关键词, ...]}}
+        self.column_groups = {column: {} for column in TEXT_COLUMNS}
+        for name, profile in profiles.items():
+            for group, keywords in profile['keywords'].items():
+                for column in GROUP_COLUMNS[group]:
+                    self.column_groups[column][(name, group)] = keywords
+            for group, (keywords, _) in profile.get('label_bonus', {}).items():
+                self.column_groups['labels'][(name, 'label_bonus', group)] = keywords
+        self.matchers = {column: KeywordMatcher(groups) for column, groups in self.column_groups.items()}
+
+    def score(self, frames):
+        """对多个数据集一起评分，frames为{协议名: DataFrame}，返回{协议名: 置信度Series}"""
+        names = list(frames)
+        for name in names:
+            if name not in self.profiles:
+                raise ValueError(f"未知的评分配置: {name}")
+
+        # 各数据集的同一列拼接起来，每列的关键词一起匹配，得到每行是否出现各协议各组的关键词
+        texts = {column: TextColumn([value for name in names for value in text_values(frames[name], column)])
+                 for column in TEXT_COLUMNS}
+        hits = {column: self.matchers[column].match_column(texts[column]) for column in TEXT_COLUMNS}
+        issue_reference = matches_any(texts['body'], ISSUE_PATTERNS, re.IGNORECASE, required=ISSUE_MARKER)
+        numbers = pd.DataFrame({column: np.concatenate([np.zeros(0)] + [numeric_column(frames[name], column)
+                                                                         for name in names])
+                                for column in NUMERIC_COLUMNS})
+        size_score = change_size_score(numbers)
+
+        results = {}
+        start = 0
+        for name in names:
+            df = frames[name]
+            rows = slice(start, start + len(df))
+            start += len(df)
+            profile = self.profiles[name]
+            confidence = size_score[rows] + WEIGHTS['issue_reference'] * issue_reference[rows]
+            for group in profile['keywords']:
+                found = np.zeros(len(df), dtype=bool)
+                for column in GROUP_COLUMNS[group]:
+                    found |= hits[column][(name, group)][rows]
+                confidence += WEIGHTS[group] * found
+            for group, (_, weight) in profile.get('label_bonus', {}).items():
+                confidence += weight * hits['labels'][(name, 'label_bonus', group)][rows]
+            # 确保置信度在0-100之间
+            results[name] = clip_confidence(confidence, df.index)
+        return results
+
+
+@lru_cache(maxsize=None)
+def get_engine():
+    """进程内共享的评分器，第一次使用时编译所有协议配置"""
+    return ScoringEngine(PROFILES)
+
+
+def score_shard(engine, shard, profile):
+    """在工作进程中按指定协议的配置对一个分片评分"""
+    return engine.score({profile: shard})[profile]
+
+
+def score_with_engine(frames, workers=1):
+    """用共享的评分器评分，workers大于1时每个数据集按行切片，由多个进程并行评分后按原顺序合并"""
+    engine = get_engine()
+    if workers <= 1:
+        return engine.score(frames)
+    return {name: map_frame(partial(score_shard, profile=name), engine, df, workers) for name, df in frames.items()}
+
+
+def score_frames(frames, cache_db=None, workers=1):
+    """对多个数据集一起评分，frames为{协议名: DataFrame}，返回{协议名: 置信度Series}
+
+    给出cache_db时先按内容哈希查询置信度缓存，只对内容或评分规则变化过的PR重新评分，
+    评分后删除旧版评分规则留下的缓存；workers大于1时由多个进程并行评分
+    """
+    if cache_db is None:
+        return score_with_engine(frames, workers)
+
+    with ScoreCache(cache_db) as cache:
+        fingerprints, hashes, cached, missing = {}, {}, {}, {}
+        for name, df in frames.items():
+            fingerprints[name] = profile_fingerprint(name)
+            hashes[name] = content_hashes(scoring_frame(df), TEXT_COLUMNS, NUMERIC_COLUMNS)
+            cached[name] = cache.lookup(fingerprints[name], hashes[name])
+            missing[name] = np.flatnonzero(np.isnan(cached[name]))
+        scores = score_with_engine({name: frames[name].iloc[missing[name]] for name in frames}, workers)
+
+        results = {}
+        for name, df in frames.items():
+            confidence = cached[name]
+            confidence[missing[name]] = scores[name].to_numpy()
+            cache.store(fingerprints[name], [hashes[name][row] for row in missing[name]], scores[name].to_numpy())
+            results[name] = pd.Series(confidence.astype(np.int64), index=df.index)
+            if len(missing[name]):
+                print(f"  {name}: {len(df) - len(missing[name])} 个PR的置信度来自缓存，重新评分 {len(missing[name])} 个")
+
+        # 只保留当前各协议配置的缓存，其他协议的脚本可能共用同一个缓存文件
+        pruned = cache.prune([profile_fingerprint(name) for name in PROFILES])
+        if pruned:
+            print(f"  已删除 {pruned} 条旧版评分规则的置信度缓存")
+        return results
+
+
+def calculate_bug_fix_confidence(df, profile, cache_db=None, workers=1):
+    """按指定协议的配置计算每个PR是否为bug修复的置信度，给出cache_db时使用置信度缓存"""
+    return score_frames({profile: df}, cache_db, workers)[profile]
+
+
+def confidence_levels(confidence, profile):
+    """按协议配置的阈值把置信度分为低、中、高"""
+    settings = PROFILES[profile]
+    return pd.cut(confidence,
+                  bins=settings.get('bins', CONFIDENCE_BINS),
+                  labels=settings.get('labels', CONFIDENCE_LABELS))
+
+
+def score_datasets(datasets, output_file, cache_db=None, workers=1):
+    """读取各数据集的Excel，一次批量评分后各保存为输出文件中的一个工作表"""
+    frames = {}
+    for name, path in datasets.items():
+        if not os.path.exists(path):
+            print(f"文件 {path} 不存在，跳过 {name}")
+            continue
+        frames[name] = pd.read_excel(path, sheet_name=DATASET_SHEET)
+        print(f"读取 {name}: {len(frames[name])} 个PR")
+    if not frames:
+        print("没有可评分的数据集")
+        return None
+
+    scores = score_frames(frames, cache_db, workers)
+    with pd.ExcelWriter(output_file) as writer:
+        for name, df in frames.items():
+            df['bug_fix_confidence'] = scores[name]
+            df['confidence_level'] = confidence_levels(df['bug_fix_confidence'], name)
+            df.sort_values('bug_fix_confidence', ascending=False).to_excel(writer, sheet_name=name, index=False)
+
+            counts = df['confidence_level'].value_counts().sort_index()
+            print(f"\n{name} ({PROFILES[name]['repo']}):")
+            for level, count in counts.items():
+                print(f"  {level}置信度: {count}个")
+
+    print(f"\n评分结果已保存到: {output_file}")
+    return output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按协议配置对所有PR数据集批量计算bug修复置信度')
+    parser.add_argument('--dataset', action='append', default=[],
+                        help='协议名=Excel路径，可重复指定；不指定时处理所有默认数据集')
+    parser.add_argument('--output', default=SCORED_OUTPUT_FILE)
+    parser.add_argument('--cache', default=None, help='置信度缓存数据库路径，不指定时不使用缓存')
+    parser.add_argument('--workers', type=int, default=1, help='并行评分的进程数')
+    args = parser.parse_args()
+
+    datasets = dict(item.split('=', 1) for item in args.dataset) if args.dataset else DATASETS
+    score_datasets(datasets, args.output, args.cache, args.workers)
+
+
+if __name__ == "__main__":
+    main()
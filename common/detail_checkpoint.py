@@ -0,0 +1,46 @@
+"""PR详情获取的检查点日志
+
+每完成一批PR就把这一批的详情追加到JSONL日志（一批一行），写入代价只与批大小有关；
+中断后重新运行时读回已完成的PR，只请求剩余的部分
+"""
+from common.page_log import PageLog
+
+
+class DetailCheckpoint:
+    """记录已获取详情的PR编号及详情字段"""
+
+    def __init__(self, path, fields, batch_size=10):
+        self.log = PageLog(path)
+        self.fields = fields
+        self.batch_size = batch_size
+        self.pending = []
+        self.batches = 0
+
+    def load(self):
+        """读取已完成的PR详情，返回{PR编号: 详情}"""
+        self.batches = self.log.recover()
+        return {record['number']: record for record in self.log.iter_records()}
+
+    def reset(self):
+        """清空检查点，重新获取全部详情"""
+        self.log.clear()
+        self.pending = []
+        self.batches = 0
+        return {}
+
+    def add(self, pr_number, pr_detail):
+        """记录一个已完成的PR，攒满一批时写入日志"""
+        record = {'number': pr_number}
+        for field in self.fields:
+            record[field] = pr_detail.get(field)
+        self.pending.append(record)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """把尚未写入的记录作为一批追加到日志"""
+        if not self.pending:
+            return
+        self.batches += 1
+        self.log.append_page(self.batches, self.pending)
+        self.pending = []
@@ -0,0 +1,500 @@
+"""本地的GitHub REST API替身服务器，用于离线、可复现地测试和评测抓取代码
+
+用仓库中已有的pr_cache.json和issue数据文件提供与GitHub相同结构的接口:
+    /rate_limit
+    /repos/{owner}/{repo}/pulls          支持state、sort、direction、page、per_page
+    /repos/{owner}/{repo}/pulls/{number}
+    /repos/{owner}/{repo}/issues         支持state、since、sort、direction、page、per_page
+    /repos/{owner}/{repo}/issues/{number}
+    POST /graphql                        只支持common.github_graphql中的已合并PR查询和PR标签查询
+
+列表接口返回Link分页头，GET响应带ETag并支持If-None-Match（304不消耗配额），
+可以配置响应延迟、按token和配额类型（core、graphql）计算的配额，以及按比例注入的5xx、403和次级速率限制响应。
+
+命令行用法（在仓库根目录运行）:
+    python -m common.fake_github --pr-cache PR_of_aave/pr_cache.json \\
+        --issues issues_of_openzeppelin/processed_issues.csv --latency 0.05 --error-rate 0.05
+
+然后把环境变量GITHUB_API_URL设为输出的地址，再运行各抓取脚本
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import pandas as pd
+
+DEFAULT_PER_PAGE = 30
+MAX_PER_PAGE = 100
+# GraphQL游标的前缀，游标为该前缀加上下一页第一条记录的下标
+CURSOR_PREFIX = 'cursor:'
+# 数据文件中没有时间字段时，按编号生成递增的时间
+SYNTHETIC_EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def format_time(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_repo_from_url(url):
+    """从PR的API地址中解析(owner, repo)"""
+    parts = urlparse(url).path.strip('/').split('/')
+    if len(parts) >= 3 and parts[0] == 'repos':
+        return parts[1], parts[2]
+    return None
+
+
+def read_table(path):
+    """读取issue数据文件，扩展名为.csv但实际是xlsx的文件按Excel读取"""
+    with open(path, 'rb') as f:
+        header = f.read(4)
+    if header.startswith(b'PK'):
+        return pd.read_excel(path)
+    return pd.read_csv(path)
+
+
+def row_to_issue(row):
+    """把数据文件的一行转换为GitHub issue结构，缺少的字段按编号生成"""
+    number = int(row['number'])
+    synthetic = format_time(SYNTHETIC_EPOCH + timedelta(hours=number))
+
+    def field(name, default=None):
+        value = row.get(name)
+        return default if value is None or pd.isna(value) else value
+
+    labels = field('labels', '')
+    if isinstance(labels, str):
+        labels = [name.strip() for name in labels.split(',') if name.strip()]
+    created_at = field('created_at', synthetic)
+    state = field('state', 'closed')
+
+    return {
+        'number': number,
+        'title': str(field('title', '')),
+        'state': state,
+        'created_at': created_at,
+        'updated_at': field('updated_at', created_at),
+        'closed_at': field('closed_at', created_at if state == 'closed' else None),
+        'labels': [{'name': name} for name in labels],
+        'user': {'login': field('author', 'ghost')},
+        'body': field('body')
+    }
+
+
+def connection(items, first, cursor=None):
+    """按GraphQL的游标分页取出一页，返回{'pageInfo', 'nodes'}"""
+    start = int(cursor[len(CURSOR_PREFIX):]) if cursor and cursor.startswith(CURSOR_PREFIX) else 0
+    end = start + max(min(first, MAX_PER_PAGE), 1)
+    has_next = end < len(items)
+    return {'pageInfo': {'hasNextPage': has_next, 'endCursor': f'{CURSOR_PREFIX}{end}' if has_next else None},
+            'nodes': items[start:end]}
+
+
+def pr_node(pr, label_count):
+    """把REST格式的PR转换为GraphQL的PR节点"""
+    user = pr.get('user') or {}
+    return {
+        'number': pr['number'],
+        'title': pr.get('title', ''),
+        'url': pr.get('html_url', ''),
+        'createdAt': pr.get('created_at'),
+        'updatedAt': pr.get('updated_at'),
+        'mergedAt': pr.get('merged_at'),
+        'body': pr.get('body') or '',
+        'additions': pr.get('additions', 0),
+        'deletions': pr.get('deletions', 0),
+        'changedFiles': pr.get('changed_files', 0),
+        'author': {'login': user['login']} if user.get('login') else None,
+        'labels': connection(label_nodes(pr), label_count)
+    }
+
+
+def label_nodes(pr):
+    return [{'name': label['name']} for label in pr.get('labels', [])]
+
+
+class FakeGitHubServer(ThreadingHTTPServer):
+    """GitHub API替身服务器
+
+    latency: 每个请求的固定延迟（秒）
+    error_rate / forbidden_rate / secondary_rate: 返回5xx、普通403、次级速率限制的概率
+    quota / reset_window: 每个token在一个重置周期内的请求配额
+    seed: 故障注入的随机种子，相同的种子和请求顺序得到相同的结果
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, forbidden_rate=0.0,
+                 secondary_rate=0.0, retry_after=1, quota=5000, reset_window=3600, seed=0):
+        super().__init__((host, port), FakeGitHubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.forbidden_rate = forbidden_rate
+        self.secondary_rate = secondary_rate
+        self.retry_after = retry_after
+        self.quota = quota
+        self.reset_window = reset_window
+        self.random = random.Random(seed)
+
+        self.repos = {}  # (owner, repo) -> {'pulls': {number: pr}, 'issues': {number: issue}}
+        self.quotas = {}  # (token, 配额类型) -> [remaining, reset_at]
+        self.stats = Counter()  # 按状态码统计的响应数
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def get_repo(self, owner, repo):
+        return self.repos.setdefault((owner.lower(), repo.lower()), {'pulls': {}, 'issues': {}})
+
+    def add_pulls(self, owner, repo, prs):
+        """添加PR数据，url字段改写为本服务器的地址"""
+        data = self.get_repo(owner, repo)
+        for pr in prs:
+            pr = dict(pr)
+            pr['url'] = f'{self.base_url}/repos/{owner}/{repo}/pulls/{pr["number"]}'
+            pr.setdefault('updated_at', pr.get('merged_at') or pr['created_at'])
+            data['pulls'][pr['number']] = pr
+
+    def add_issues(self, owner, repo, issues):
+        data = self.get_repo(owner, repo)
+        for issue in issues:
+            issue = dict(issue)
+            issue['url'] = f'{self.base_url}/repos/{owner}/{repo}/issues/{issue["number"]}'
+            data['issues'][issue['number']] = issue
+
+    def load_pr_cache(self, path, owner=None, repo=None):
+        """加载PR脚本生成的pr_cache.json，未指定仓库时从PR的url中解析"""
+        with open(path, 'r', encoding='utf-8') as f:
+            prs = json.load(f)
+        if not prs:
+            return 0
+        if owner is None or repo is None:
+            owner, repo = parse_repo_from_url(prs[0]['url'])
+        self.add_pulls(owner, repo, prs)
+        print(f"已加载 {len(prs)} 个PR: {owner}/{repo} ({path})")
+        return len(prs)
+
+    def load_issue_file(self, path, owner, repo):
+        """加载issue数据文件（CSV或xlsx），至少需要number和title列"""
+        df = read_table(path)
+        df = df.dropna(subset=['number']).drop_duplicates(subset=['number'])
+        issues = [row_to_issue(row) for row in df.to_dict('records')]
+        self.add_issues(owner, repo, issues)
+        print(f"已加载 {len(issues)} 个issue: {owner}/{repo} ({path})")
+        return len(issues)
+
+    def consume_quota(self, token, resource='core'):
+        """扣减token某类配额，返回(limit, remaining, reset_at)，配额已用完时remaining为-1"""
+        now = time.time()
+        with self.lock:
+            state = self.quotas.get((token, resource))
+            if state is None or state[1] <= now:
+                state = self.quotas[(token, resource)] = [self.quota, int(now) + self.reset_window]
+            if state[0] <= 0:
+                return self.quota, -1, state[1]
+            state[0] -= 1
+            return self.quota, state[0], state[1]
+
+    def refund_quota(self, token):
+        """304响应不消耗配额"""
+        with self.lock:
+            if (token, 'core') in self.quotas:
+                self.quotas[(token, 'core')][0] += 1
+
+    def pick_fault(self):
+        """按配置的概率选择要注入的故障，不注入时返回None"""
+        with self.lock:
+            roll = self.random.random()
+            status = self.random.choice([500, 502, 503])
+        if roll < self.secondary_rate:
+            return 'secondary'
+        roll -= self.secondary_rate
+        if roll < self.forbidden_rate:
+            return 'forbidden'
+        roll -= self.forbidden_rate
+        if roll < self.error_rate:
+            return status
+        return None
+
+    def start(self):
+        """在后台线程中运行服务器，返回服务器地址"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def admit(self, token, resource):
+        """扣减配额并按配置注入故障，返回响应应带的配额头；已经回复了错误响应时返回None"""
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        limit, remaining, reset_at = server.consume_quota(token, resource)
+        rate_headers = {
+            'X-RateLimit-Limit': limit,
+            'X-RateLimit-Remaining': max(remaining, 0),
+            'X-RateLimit-Reset': reset_at,
+            'X-RateLimit-Resource': resource
+        }
+        if remaining < 0:
+            self.send_json(403, {'message': 'API rate limit exceeded'}, rate_headers)
+            return None
+
+        fault = server.pick_fault()
+        if fault == 'secondary':
+            rate_headers['Retry-After'] = server.retry_after
+            self.send_json(403, {'message': 'You have exceeded a secondary rate limit'}, rate_headers)
+            return None
+        if fault == 'forbidden':
+            self.send_json(403, {'message': 'Resource not accessible'}, rate_headers)
+            return None
+        if fault is not None:
+            self.send_json(fault, {'message': 'Server Error'}, rate_headers)
+            return None
+        return rate_headers
+
+    def token(self):
+        return (self.headers.get('Authorization') or '').split(' ')[-1]
+
+    def do_GET(self):
+        server = self.server
+        parsed = urlparse(self.path)
+        query = dict(parse_qsl(parsed.query))
+        parts = parsed.path.strip('/').split('/')
+        token = self.token()
+
+        # /rate_limit不消耗配额
+        if parts == ['rate_limit']:
+            self.send_rate_limit(token)
+            return
+
+        rate_headers = self.admit(token, 'core')
+        if rate_headers is None:
+            return
+        remaining = rate_headers['X-RateLimit-Remaining']
+
+        status, payload, extra_headers = self.route(parts, query)
+        rate_headers.update(extra_headers)
+        body = json.dumps(payload).encode('utf-8')
+        etag = 'W/"' + hashlib.sha1(body).hexdigest() + '"'
+        rate_headers['ETag'] = etag
+
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            server.refund_quota(token)
+            rate_headers['X-RateLimit-Remaining'] = remaining + 1
+            self.send_body(304, b'', rate_headers)
+            return
+        self.send_body(status, body, rate_headers)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if urlparse(self.path).path.strip('/') != 'graphql':
+            self.send_json(404, {'message': 'Not Found'})
+            return
+        try:
+            request = json.loads(body)
+        except ValueError:
+            self.send_json(400, {'message': 'Problems parsing JSON'})
+            return
+
+        rate_headers = self.admit(self.token(), 'graphql')
+        if rate_headers is None:
+            return
+        self.send_json(200, self.graphql(request.get('query') or '', request.get('variables') or {}), rate_headers)
+
+    def graphql(self, query, variables):
+        """按查询中用到的字段区分已合并PR列表查询和单个PR的标签查询，返回响应数据"""
+        owner, repo = str(variables.get('owner', '')), str(variables.get('name', ''))
+        data = self.server.repos.get((owner.lower(), repo.lower()))
+        if 'pullRequests(' in query:
+            field = 'pullRequests'
+        elif 'pullRequest(' in query:
+            field = 'pullRequest'
+        else:
+            return {'errors': [{'message': 'Unsupported query'}]}
+        if data is None:
+            return {'data': {'repository': None}}
+
+        label_count = int(variables.get('labelCount', MAX_PER_PAGE))
+        if field == 'pullRequest':
+            pr = data['pulls'].get(variables.get('number'))
+            if pr is None or not pr.get('merged_at'):
+                return {'data': {'repository': {'pullRequest': None}}}
+            labels = connection(label_nodes(pr), label_count, variables.get('cursor'))
+            return {'data': {'repository': {'pullRequest': {'labels': labels}}}}
+
+        sort_field = 'updated_at' if variables.get('orderField') == 'UPDATED_AT' else 'created_at'
+        prs = [pr for pr in data['pulls'].values() if pr.get('merged_at')]
+        prs.sort(key=lambda pr: (pr.get(sort_field) or '', pr['number']), reverse=True)
+        page = connection(prs, int(variables.get('first', MAX_PER_PAGE)), variables.get('cursor'))
+        page['nodes'] = [pr_node(pr, label_count) for pr in page['nodes']]
+        return {'data': {'repository': {'pullRequests': page}}}
+
+    def route(self, parts, query):
+        """返回(状态码, 响应数据, 额外响应头)"""
+        if len(parts) < 4 or parts[0] != 'repos':
+            return 404, {'message': 'Not Found'}, {}
+        data = self.server.repos.get((parts[1].lower(), parts[2].lower()))
+        kind = parts[3]
+        if data is None or kind not in ('pulls', 'issues'):
+            return 404, {'message': 'Not Found'}, {}
+
+        items = data[kind]
+        if len(parts) == 5:
+            try:
+                item = items.get(int(parts[4]))
+            except ValueError:
+                item = None
+            if item is None:
+                return 404, {'message': 'Not Found'}, {}
+            return 200, self.detail(kind, item), {}
+        if len(parts) != 4:
+            return 404, {'message': 'Not Found'}, {}
+
+        return self.list_page(list(items.values()), query)
+
+    def detail(self, kind, item):
+        """详情接口比列表多出正文和改动统计字段"""
+        item = dict(item)
+        item.setdefault('body', '')
+        if kind == 'pulls':
+            for field in ('additions', 'deletions', 'changed_files'):
+                item.setdefault(field, 0)
+        return item
+
+    def list_page(self, items, query):
+        state = query.get('state', 'open')
+        if state != 'all':
+            items = [item for item in items if item.get('state') == state]
+        if 'since' in query:
+            items = [item for item in items if item.get('updated_at', '') >= query['since']]
+
+        sort_field = 'updated_at' if query.get('sort') == 'updated' else 'created_at'
+        reverse = query.get('direction', 'desc') == 'desc'
+        items.sort(key=lambda item: (item.get(sort_field) or '', item['number']), reverse=reverse)
+
+        try:
+            per_page = min(max(int(query.get('per_page', DEFAULT_PER_PAGE)), 1), MAX_PER_PAGE)
+            page = max(int(query.get('page', 1)), 1)
+        except ValueError:
+            return 422, {'message': 'Validation Failed'}, {}
+
+        last_page = max((len(items) + per_page - 1) // per_page, 1)
+        start = (page - 1) * per_page
+        headers = {}
+        link = self.link_header(query, page, last_page)
+        if link:
+            headers['Link'] = link
+        return 200, items[start:start + per_page], headers
+
+    def link_header(self, query, page, last_page):
+        """按GitHub的格式生成Link分页头"""
+        path = urlparse(self.path).path
+        base = self.server.base_url + path
+
+        def page_url(number):
+            return base + '?' + urlencode({**query, 'page': number})
+
+        links = []
+        if page < last_page:
+            links.append(f'<{page_url(page + 1)}>; rel="next"')
+            links.append(f'<{page_url(last_page)}>; rel="last"')
+        if page > 1:
+            links.append(f'<{page_url(1)}>; rel="first"')
+            links.append(f'<{page_url(min(page - 1, last_page))}>; rel="prev"')
+        return ', '.join(links)
+
+    def send_rate_limit(self, token):
+        server = self.server
+        resources = {'search': {'limit': 30, 'remaining': 30, 'reset': int(time.time()) + 60, 'used': 0}}
+        for resource in ('core', 'graphql'):
+            with server.lock:
+                state = server.quotas.get((token, resource))
+            if state is None or state[1] <= time.time():
+                remaining, reset_at = server.quota, int(time.time()) + server.reset_window
+            else:
+                remaining, reset_at = max(state[0], 0), state[1]
+            resources[resource] = {'limit': server.quota, 'remaining': remaining, 'reset': reset_at,
+                                   'used': server.quota - remaining}
+        # 与GitHub一样带ETag，客户端不应对/rate_limit发送条件请求
+        body = json.dumps({'resources': resources, 'rate': resources['core']}).encode('utf-8')
+        self.send_body(200, body, {'ETag': 'W/"' + hashlib.sha1(body).hexdigest() + '"'})
+
+    def send_json(self, status, payload, headers=None):
+        self.send_body(status, json.dumps(payload).encode('utf-8'), headers or {})
+
+    def send_body(self, status, body, headers):
+        with self.server.lock:
+            self.server.stats[status] += 1
+        self.send_response(status)
+        if body:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地GitHub API替身服务器')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pr-cache', action='append', default=[], help='pr_cache.json路径，可重复指定')
+    parser.add_argument('--issues', action='append', default=[], help='issue数据文件路径，可重复指定')
+    parser.add_argument('--issues-repo', default='OpenZeppelin/openzeppelin-contracts',
+                        help='issue数据所属的仓库')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--forbidden-rate', type=float, default=0.0)
+    parser.add_argument('--secondary-rate', type=float, default=0.0)
+    parser.add_argument('--quota', type=int, default=5000)
+    parser.add_argument('--reset-window', type=int, default=3600)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeGitHubServer(port=args.port, latency=args.latency, error_rate=args.error_rate,
+                              forbidden_rate=args.forbidden_rate, secondary_rate=args.secondary_rate,
+                              quota=args.quota, reset_window=args.reset_window, seed=args.seed)
+    for path in args.pr_cache:
+        server.load_pr_cache(path)
+    owner, repo = args.issues_repo.split('/')
+    for path in args.issues:
+        if os.path.exists(path):
+            server.load_issue_file(path, owner, repo)
+        else:
+            print(f"文件 {path} 不存在")
+
+    print(f"GitHub API替身服务器已启动: {server.base_url}")
+    print(f"设置环境变量 GITHUB_API_URL={server.base_url} 后运行抓取脚本")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n响应统计: {dict(server.stats)}")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
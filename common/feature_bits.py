@@ -0,0 +1,76 @@
+"""标题特征的位掩码编码
+
+每个特征是"标题中是否出现某个关键词"，全部特征的关键词编译进一个KeywordMatcher，整列标题只扫描一遍；
+结果按位打包成一列无符号整数（第i个特征对应第i位），代替每个特征一列布尔值。
+需要时可以查询单个特征，或展开为原来的has_xxx、op_xxx布尔列；导出给人查看的CSV时展开（见expand_feature_column），
+列与原来相同
+"""
+import numpy as np
+import pandas as pd
+
+from common.keyword_matcher import KeywordMatcher
+
+# 合约名称特征，特征列为has_{小写名称}
+CONTRACT_PATTERNS = ['ERC20', 'ERC721', 'ERC1155', 'SafeMath', 'AccessControl',
+                     'Governor', 'Ownable', 'Proxy', 'TimeLock', 'Merkle']
+
+# 操作类型特征，特征列为op_{名称}
+OPERATION_PATTERNS = ['transfer', 'approve', 'mint', 'burn', 'initialize', 'deploy',
+                      'upgrade', 'delegatecall', 'verify', 'validate']
+
+# 保存标题特征位掩码的列名
+FEATURE_COLUMN = 'title_features'
+
+# 按特征个数选用的整数类型
+MASK_DTYPES = [(8, np.uint8), (16, np.uint16), (32, np.uint32), (64, np.uint64)]
+
+
+class FeatureSet:
+    """一组按位打包的关键词特征"""
+
+    def __init__(self, features):
+        """features为{特征名: 关键词}，特征的顺序即位的顺序，关键词匹配区分大小写（调用方先转小写）"""
+        self.names = list(features)
+        self.bits = {name: bit for bit, name in enumerate(self.names)}
+        self.matcher = KeywordMatcher({name: [keyword] for name, keyword in features.items()})
+        for width, dtype in MASK_DTYPES:
+            if len(self.names) <= width:
+                self.dtype = dtype
+                break
+        else:
+            raise ValueError(f"特征个数 {len(self.names)} 超过64个，无法打包进一个整数")
+
+    def extract(self, text):
+        """对整列文本（TextColumn）扫描一遍，返回每行的特征位掩码"""
+        masks = np.zeros(len(text), dtype=self.dtype)
+        for name, hits in self.matcher.match_column(text).items():
+            masks |= hits.astype(self.dtype) << self.dtype(self.bits[name])
+        return masks
+
+    def masks_of(self, masks):
+        """位掩码列（Series或数组，读回的CSV中为int64）转为本特征集的整数类型"""
+        return np.asarray(masks).astype(self.dtype)
+
+    def has(self, masks, name):
+        """每行是否具有某个特征，返回布尔数组"""
+        return (self.masks_of(masks) >> self.dtype(self.bits[name])) & self.dtype(1) == 1
+
+    def expand(self, masks, names=None, index=None):
+        """把位掩码展开为布尔列组成的DataFrame，names为None时展开全部特征"""
+        masks = self.masks_of(masks)
+        return pd.DataFrame({name: self.has(masks, name) for name in (names or self.names)}, index=index)
+
+
+TITLE_FEATURES = FeatureSet({
+    **{f'has_{pattern.lower()}': pattern.lower() for pattern in CONTRACT_PATTERNS},
+    **{f'op_{pattern}': pattern for pattern in OPERATION_PATTERNS},
+})
+
+
+def expand_feature_column(df, features=TITLE_FEATURES, column=FEATURE_COLUMN):
+    """把df中的位掩码列就地展开为各特征的布尔列（列的位置不变），返回新的DataFrame；没有该列时原样返回"""
+    if column not in df.columns:
+        return df
+    position = df.columns.get_loc(column)
+    expanded = features.expand(df[column], index=df.index)
+    return pd.concat([df.iloc[:, :position], expanded, df.iloc[:, position + 1:]], axis=1)
@@ -0,0 +1,123 @@
+"""输入数据文件的格式推断
+
+只读取文件开头的一段（SNIFF_BYTES），一次确定文件类型、编码、分隔符和引号规则，
+之后用推断出的参数完整解析一次文件。推断结果按(路径, 大小, 修改时间)缓存到JSON文件，
+文件没有变化时重复运行不再检测
+"""
+import codecs
+import csv
+import io
+import json
+import os
+
+try:
+    import chardet
+    CHARDET_AVAILABLE = True
+except ImportError:
+    CHARDET_AVAILABLE = False
+
+# 推断格式时读取的字节数
+SNIFF_BYTES = 64 * 1024
+
+# 依次尝试的分隔符，取第一个能把表头分成多列、且样本中没有哪行多出字段的
+DELIMITERS = [',', ';', '\t', '|']
+
+
+def detect_encoding(sample):
+    """推断编码: 有BOM时按BOM，能按UTF-8解码时为UTF-8，否则交给chardet，都不行时用latin1"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        # 样本末尾可能截断在一个多字节字符中间，不完整的字节不算解码失败
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    if CHARDET_AVAILABLE:
+        return chardet.detect(sample)['encoding'] or 'latin1'
+    return 'latin1'
+
+
+def detect_dialect(text, truncated):
+    """从样本文本推断分隔符和引号规则，返回read_csv的参数，无法推断时返回None"""
+    for sep in DELIMITERS:
+        rows = [row for row in csv.reader(io.StringIO(text), delimiter=sep) if row]
+        if truncated:
+            # 最后一行可能不完整
+            rows = rows[:-1]
+        if rows and len(rows[0]) > 1 and all(len(row) <= len(rows[0]) for row in rows[1:]):
+            return {'sep': sep, 'quotechar': '"', 'doublequote': True, 'escapechar': None}
+
+    # 标准分隔符都不行，交给csv.Sniffer
+    try:
+        dialect = csv.Sniffer().sniff(text[:SNIFF_BYTES])
+    except csv.Error:
+        return None
+    return {'sep': dialect.delimiter, 'quotechar': dialect.quotechar,
+            'doublequote': dialect.doublequote, 'escapechar': dialect.escapechar}
+
+
+def sniff_file(file_path):
+    """读取文件开头一次，返回格式描述:
+    {'type': 'xlsx' | 'csv' | 'unknown', 'encoding': ..., 'sep': ..., 'quotechar': ..., ...}
+    """
+    with open(file_path, 'rb') as f:
+        sample = f.read(SNIFF_BYTES)
+        truncated = bool(f.read(1))
+
+    # Excel文件是zip包
+    if sample.startswith(b'PK') or (b'docProps' in sample[:500] and b'xl/' in sample[:500]):
+        return {'type': 'xlsx'}
+
+    encoding = detect_encoding(sample)
+    text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(sample, final=not truncated)
+    if '\x00' in text:
+        return {'type': 'unknown', 'encoding': encoding}
+
+    dialect = detect_dialect(text, truncated)
+    if dialect is None:
+        return {'type': 'unknown', 'encoding': encoding}
+    return {'type': 'csv', 'encoding': encoding, **dialect}
+
+
+class FormatCache:
+    """格式推断结果的缓存，文件大小或修改时间变化后失效"""
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.entries = {}
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"读取格式缓存失败: {e}")
+
+    @staticmethod
+    def key(file_path):
+        stat = os.stat(file_path)
+        return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+    def get(self, file_path):
+        path, size, mtime = self.key(file_path)
+        entry = self.entries.get(path)
+        if entry and entry['size'] == size and entry['mtime_ns'] == mtime:
+            return entry['format']
+        return None
+
+    def put(self, file_path, file_format):
+        path, size, mtime = self.key(file_path)
+        self.entries[path] = {'size': size, 'mtime_ns': mtime, 'format': file_format}
+        if self.cache_file:
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+
+    def detect(self, file_path):
+        """返回文件的格式，有缓存时直接使用"""
+        file_format = self.get(file_path)
+        if file_format is None:
+            file_format = sniff_file(file_path)
+            self.put(file_path, file_format)
+        return file_format
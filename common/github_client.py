@@ -0,0 +1,306 @@
+"""GitHub API访问的公共组件，供各个PR分析脚本和issues获取脚本共享
+
+所有请求都在一个后台事件循环中由异步客户端发出，复用keep-alive连接，
+安装了h2时使用HTTP/2。脚本通过同步接口GitHubClient调用，不需要改写成async
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import as_completed
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from common.rate_limit import TokenPool, get_resource, is_rate_limited, is_retryable
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 可以通过环境变量指向本地的替身服务器（common/fake_github.py）
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+
+
+class AsyncGitHubClient:
+    """基于httpx的异步GitHub客户端，带连接池、并发上限、重试和自适应限速
+
+    token可以是单个token，也可以是token列表，多个token时按剩余配额分配请求。
+    retry_delay是失败重试时指数退避的基数（秒）；只有传输错误、5xx和速率限制会重试，
+    其余4xx（token无效、PR不存在等）立即返回None
+    """
+
+    def __init__(self, token=None, max_retries=5, retry_delay=3, max_rate=10.0, concurrency=10,
+                 base_url=GITHUB_API_URL, cache=None):
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache  # 可选的HttpCache，用于发送条件请求
+        self.max_retries = max_retries
+        tokens = [token] if token is None or isinstance(token, str) else token
+        self.pool = TokenPool(tokens, max_rate=max_rate, backoff_base=retry_delay)
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+        headers = {'Accept': 'application/vnd.github.v3+json'}
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        self.http = httpx.AsyncClient(headers=headers, limits=limits, http2=HTTP2_AVAILABLE,
+                                      timeout=30, follow_redirects=True)
+
+    async def get(self, url, params=None):
+        """发送GET请求，失败时重试，最终失败返回None
+
+        配置了缓存时发送条件请求，304响应会被替换为缓存中的200响应
+        """
+        entry = self.cache.lookup(url, params) if self.cache else None
+        headers = self.cache.conditional_headers(entry) if self.cache else {}
+        return await self._send('GET', url, entry=entry, params=params, headers=headers)
+
+    async def post(self, url, payload, timeout=60):
+        """发送JSON POST请求（用于GraphQL），失败时重试，最终失败返回None"""
+        return await self._send('POST', url, json=payload, timeout=timeout)
+
+    async def _send(self, method, url, entry=None, headers=None, **kwargs):
+        """发送请求的公共重试逻辑，使用的token、发送节奏和退避时间由调度器决定"""
+        resource = get_resource(url)
+        for attempt in range(self.max_retries):
+            token = self.pool.choose(resource)
+            scheduler = self.pool.schedulers[token]
+            await scheduler.acquire(resource)
+
+            request_headers = dict(headers or {})
+            if token:
+                request_headers['Authorization'] = f'token {token}'
+            response = None
+            try:
+                async with self.semaphore:
+                    response = await self.http.request(method, url, headers=request_headers, **kwargs)
+                scheduler.update(response.headers)
+                if response.status_code == 304 and entry is not None:
+                    return self.cache.build_response(entry, response)
+                response.raise_for_status()
+                if self.cache and method == 'GET' and response.status_code == 200:
+                    self.cache.store(url, kwargs.get('params'), response)
+                return response
+            except httpx.HTTPError as e:
+                if not is_retryable(response):
+                    print(f"  请求失败，不再重试: {e}")
+                    return None
+                if attempt < self.max_retries - 1:
+                    delay = scheduler.backoff(response, attempt)
+                    print(f"  请求失败 (尝试 {attempt + 1}/{self.max_retries}): {e}")
+                    if is_rate_limited(response):
+                        # 该token已暂停，下次尝试换用其他token，所有token都暂停时在acquire中等待
+                        continue
+                    print(f"  等待 {delay:.0f} 秒后重试...")
+                    await asyncio.sleep(delay)
+                else:
+                    print(f"  请求失败，已达到最大重试次数: {e}")
+        return None
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+class GitHubClient:
+    """AsyncGitHubClient的同步接口
+
+    在后台线程中运行一个事件循环，get/post阻塞等待结果，
+    submit返回concurrent.futures.Future，便于同时发出多个请求
+    """
+
+    def __init__(self, token=None, max_retries=5, retry_delay=3, max_rate=10.0, concurrency=10,
+                 base_url=GITHUB_API_URL, cache=None):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        async def create():
+            return AsyncGitHubClient(token, max_retries=max_retries, retry_delay=retry_delay, max_rate=max_rate,
+                                     concurrency=concurrency, base_url=base_url, cache=cache)
+
+        self.client = self.run(create())
+
+    @property
+    def base_url(self):
+        return self.client.base_url
+
+    @property
+    def cache(self):
+        return self.client.cache
+
+    def run(self, coro):
+        """在客户端的事件循环中运行协程并等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def submit(self, coro):
+        """把协程提交到客户端的事件循环，立即返回Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def get(self, url, params=None):
+        return self.run(self.client.get(url, params=params))
+
+    def post(self, url, payload, timeout=60):
+        return self.run(self.client.post(url, payload, timeout=timeout))
+
+    def expect(self, count, resource='core'):
+        """告知调度器接下来预计还要发出count个请求，剩余配额不够时提前放慢节奏"""
+        pool = self.client.pool
+
+        async def expect():
+            pool.expect(count, resource)
+
+        self.run(expect())
+
+    def seed_rate_limit(self, resources, token=None):
+        """用/rate_limit接口返回的resources初始化某个token的配额状态，默认为第一个token"""
+        pool = self.client.pool
+        scheduler = pool.schedulers[token if token in pool.schedulers else pool.tokens[0]]
+
+        async def seed():
+            scheduler.seed(resources)
+
+        self.run(seed())
+
+    def close(self):
+        """关闭连接池并停止事件循环"""
+        self.run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def fetch_pr_details(client, pr_urls):
+    """并发获取PR详情，并发数由客户端的concurrency决定
+
+    pr_urls为(PR编号, 详情URL)列表，按完成顺序逐个产出(PR编号, 详情dict)，
+    获取失败的PR产出(PR编号, None)
+    """
+    async def fetch_one(pr_number, url):
+        response = await client.client.get(url)
+        if response is None or response.status_code != 200:
+            return pr_number, None
+        return pr_number, response.json()
+
+    pr_urls = list(pr_urls)
+    client.expect(len(pr_urls))
+    futures = [client.submit(fetch_one(pr_number, url)) for pr_number, url in pr_urls]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def get_last_page(response):
+    """从响应的Link头中解析最后一页的页码，没有分页信息时返回1"""
+    last = response.links.get('last')
+    if not last:
+        return 1
+    query = parse_qs(urlparse(last['url']).query)
+    try:
+        return int(query['page'][0])
+    except (KeyError, ValueError):
+        return 1
+
+
+def fetch_list_pages(client, url, params, start_page=1):
+    """获取分页的列表接口
+
+    先请求第start_page页并从Link头中得到最后一页的页码，再并发获取其余页面。
+    按页码顺序逐页产出(页码, 记录列表)，某页获取失败时产出(页码, None)后停止
+    """
+    def fetch_page(page):
+        return client.client.get(url, params={**params, 'page': page})
+
+    first = client.run(fetch_page(start_page))
+    if first is None or first.status_code != 200:
+        yield start_page, None
+        return
+
+    items = first.json()
+    yield start_page, items
+    last_page = get_last_page(first)
+    if not items or last_page <= start_page:
+        return
+
+    # 其余页面并发获取，按页码顺序合并
+    client.expect(last_page - start_page)
+    futures = [(page, client.submit(fetch_page(page))) for page in range(start_page + 1, last_page + 1)]
+    try:
+        for page, future in futures:
+            response = future.result()
+            if response is None or response.status_code != 200:
+                yield page, None
+                return
+            yield page, response.json()
+    finally:
+        for _, future in futures:
+            future.cancel()
+
+
+def fetch_pull_pages(client, owner, repo, per_page=100, state='closed', start_page=1):
+    """获取仓库的PR列表页，第1页之后的页面并发获取，按页码顺序逐页产出(页码, PR列表)"""
+    url = f"{client.base_url}/repos/{owner}/{repo}/pulls"
+    return fetch_list_pages(client, url, {'state': state, 'per_page': per_page}, start_page)
+
+
+def fetch_issue_pages(client, owner, repo, per_page=100, state='all'):
+    """全量获取仓库的issue列表页（GitHub的issues接口也包含PR），第1页之后的页面并发获取
+
+    按创建时间升序排列: issue被更新不会改变它的位置，新建的issue排在最后，
+    抓取过程中已获取的页不会错位。按页码顺序逐页产出(页码, issue列表)
+    """
+    url = f"{client.base_url}/repos/{owner}/{repo}/issues"
+    params = {'state': state, 'sort': 'created', 'direction': 'asc', 'per_page': per_page}
+    return fetch_list_pages(client, url, params)
+
+
+def fetch_updated_issues(client, owner, repo, since, per_page=100, state='all'):
+    """按更新时间倒序逐页获取since之后（含）更新过的issue
+
+    页面依次获取: 抓取过程中被更新的issue移到最前面，只会让其后的issue在下一页重复出现，不会被跳过。
+    逐页产出(页码, issue列表)，某页获取失败时产出(页码, None)后停止
+    """
+    url = f"{client.base_url}/repos/{owner}/{repo}/issues"
+    page = 1
+    while True:
+        params = {'state': state, 'sort': 'updated', 'direction': 'desc', 'since': since,
+                  'per_page': per_page, 'page': page}
+        response = client.get(url, params=params)
+        if response is None or response.status_code != 200:
+            yield page, None
+            return
+
+        issues = response.json()
+        yield page, issues
+        if len(issues) < per_page or issues[-1]['updated_at'] < since:
+            return
+        page += 1
+
+
+def fetch_updated_pulls(client, owner, repo, since, per_page=100, state='closed'):
+    """按更新时间倒序获取PR列表页
+
+    逐页产出(页码, PR列表)，某页中出现更新时间早于since的PR后停止翻页；
+    某页获取失败时产出(页码, None)后停止
+    """
+    url = f"{client.base_url}/repos/{owner}/{repo}/pulls"
+    page = 1
+    while True:
+        params = {'state': state, 'sort': 'updated', 'direction': 'desc',
+                  'per_page': per_page, 'page': page}
+        response = client.get(url, params=params)
+        if response is None or response.status_code != 200:
+            yield page, None
+            return
+
+        prs = response.json()
+        yield page, prs
+        if len(prs) < per_page or prs[-1]['updated_at'] < since:
+            return
+        page += 1
@@ -0,0 +1,138 @@
+"""GitHub GraphQL后端：一次查询获取100个已合并PR的元数据、正文和改动统计
+
+产出的PR字典与REST接口的字段保持一致，可以直接替换REST后端使用。
+每个PR随查询带回前LABELS_PER_PAGE个标签，标签更多的PR再单独按游标补齐
+"""
+
+# 每个PR每次查询带回的标签数
+LABELS_PER_PAGE = 50
+
+MERGED_PRS_QUERY = '''
+query($owner: String!, $name: String!, $first: Int!, $cursor: String, $orderField: IssueOrderField!,
+      $labelCount: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(states: MERGED, first: $first, after: $cursor,
+                 orderBy: {field: $orderField, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        number
+        title
+        url
+        createdAt
+        updatedAt
+        mergedAt
+        body
+        additions
+        deletions
+        changedFiles
+        author { login }
+        labels(first: $labelCount) {
+          pageInfo { hasNextPage endCursor }
+          nodes { name }
+        }
+      }
+    }
+  }
+}
+'''
+
+PR_LABELS_QUERY = '''
+query($owner: String!, $name: String!, $number: Int!, $cursor: String, $labelCount: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      labels(first: $labelCount, after: $cursor) {
+        pageInfo { hasNextPage endCursor }
+        nodes { name }
+      }
+    }
+  }
+}
+'''
+
+
+def run_query(client, query, variables):
+    """执行GraphQL查询，返回data部分，失败时返回None"""
+    response = client.post(f"{client.base_url}/graphql", {'query': query, 'variables': variables})
+    if response is None:
+        return None
+
+    payload = response.json()
+    if payload.get('errors'):
+        print(f"  GraphQL查询出错: {payload['errors'][0].get('message')}")
+        return None
+    return payload.get('data')
+
+
+def node_to_pr(node, api_url):
+    """把GraphQL的PR节点转换为REST接口的字段格式"""
+    author = node.get('author') or {}
+    return {
+        'number': node['number'],
+        'title': node['title'],
+        'url': f"{api_url}/{node['number']}",
+        'html_url': node['url'],
+        'state': 'closed',  # REST接口中已合并PR的state为closed
+        'created_at': node['createdAt'],
+        'updated_at': node['updatedAt'],
+        'merged_at': node['mergedAt'],
+        'body': node.get('body') or '',
+        'user': {'login': author.get('login', 'ghost')},  # 已删除的账号没有author
+        'labels': [{'name': label['name']} for label in node['labels']['nodes']],
+        'additions': node['additions'],
+        'deletions': node['deletions'],
+        'changed_files': node['changedFiles']
+    }
+
+
+def fetch_remaining_labels(client, owner, repo, node):
+    """PR的标签超过一页时，按游标补齐其余标签并追加到node中，失败时返回False"""
+    labels = node['labels']
+    variables = {'owner': owner, 'name': repo, 'number': node['number'], 'labelCount': LABELS_PER_PAGE}
+    while labels['pageInfo']['hasNextPage']:
+        variables['cursor'] = labels['pageInfo']['endCursor']
+        data = run_query(client, PR_LABELS_QUERY, variables)
+        if data is None or (data.get('repository') or {}).get('pullRequest') is None:
+            return False
+        page = data['repository']['pullRequest']['labels']
+        labels['nodes'].extend(page['nodes'])
+        labels['pageInfo'] = page['pageInfo']
+    return True
+
+
+def fetch_merged_pulls_graphql(client, owner, repo, per_page=100, order_field='CREATED_AT', since=None):
+    """按游标分页获取已合并的PR
+
+    逐页产出(页码, PR列表)，某页获取失败时产出(页码, None)后停止。
+    给定since时按order_field倒序遇到早于since的PR后停止翻页
+    """
+    api_url = f"{client.base_url}/repos/{owner}/{repo}/pulls"
+    variables = {'owner': owner, 'name': repo, 'first': per_page, 'cursor': None,
+                 'orderField': order_field, 'labelCount': LABELS_PER_PAGE}
+    sort_key = 'updated_at' if order_field == 'UPDATED_AT' else 'created_at'
+
+    page = 1
+    while True:
+        data = run_query(client, MERGED_PRS_QUERY, variables)
+        if data is None or data.get('repository') is None:
+            yield page, None
+            return
+
+        connection = data['repository']['pullRequests']
+        if not all(fetch_remaining_labels(client, owner, repo, node) for node in connection['nodes']):
+            yield page, None
+            return
+        prs = [node_to_pr(node, api_url) for node in connection['nodes']]
+        yield page, prs
+
+        if not connection['pageInfo']['hasNextPage']:
+            return
+        if since is not None and prs and prs[-1][sort_key] < since:
+            return
+        variables['cursor'] = connection['pageInfo']['endCursor']
+        page += 1
+
+
+def fetch_updated_pulls_graphql(client, owner, repo, since, per_page=100):
+    """按更新时间倒序获取已合并的PR，供增量同步使用"""
+    return fetch_merged_pulls_graphql(client, owner, repo, per_page=per_page,
+                                      order_field='UPDATED_AT', since=since)
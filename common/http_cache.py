@@ -0,0 +1,162 @@
+"""基于ETag/Last-Modified的本地HTTP响应缓存
+
+GitHub对带If-None-Match/If-Modified-Since且内容未变化的请求返回304，
+304响应不消耗主速率限制配额，此时直接使用磁盘上缓存的响应体。
+打开缓存时删除长期未使用的条目，总大小超过上限时从最久未使用的条目开始删除
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import httpx
+
+# 需要随响应体一起缓存的响应头
+CACHED_HEADERS = ['ETag', 'Last-Modified', 'Link', 'Content-Type']
+
+# 不经过缓存的接口: /rate_limit返回的是当前配额，304时沿用的缓存响应体会报告过期的剩余请求数
+UNCACHED_PATHS = ['/rate_limit']
+
+# 超过这么久（秒）没有用到的条目在打开缓存时删除
+MAX_AGE = 30 * 24 * 3600
+# 缓存目录的总大小上限（字节）
+MAX_BYTES = 512 * 1024 * 1024
+
+
+class HttpCache:
+    """以URL+查询参数为键，把响应体和校验头保存在cache_dir下
+
+    max_age/max_bytes为None时不按该条件删除条目
+    """
+
+    def __init__(self, cache_dir, max_age=MAX_AGE, max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.prune()
+
+    def cacheable(self, url):
+        """该URL的响应是否使用缓存"""
+        path = urlparse(url).path.rstrip('/')
+        return not any(path.endswith(uncached) for uncached in UNCACHED_PATHS)
+
+    def make_key(self, url, params=None):
+        """根据URL和排序后的查询参数生成缓存键"""
+        items = sorted((str(k), str(v)) for k, v in (params or {}).items())
+        raw = url + '?' + '&'.join(f'{k}={v}' for k, v in items)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.json', base + '.body'
+
+    def lookup(self, url, params=None):
+        """查找缓存条目，返回(元数据, 响应体)，不存在或该URL不使用缓存时返回None
+
+        找到的条目记为刚刚用过，清理时最后删除
+        """
+        if not self.cacheable(url):
+            return None
+        meta_path, body_path = self._paths(self.make_key(url, params))
+        if not os.path.exists(meta_path) or not os.path.exists(body_path):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+            os.utime(meta_path)
+        except Exception as e:
+            print(f"  读取HTTP缓存失败: {e}")
+            return None
+        return meta, body
+
+    def conditional_headers(self, entry):
+        """根据缓存条目生成条件请求头"""
+        if entry is None:
+            return {}
+        meta, _ = entry
+        headers = {}
+        if meta.get('ETag'):
+            headers['If-None-Match'] = meta['ETag']
+        if meta.get('Last-Modified'):
+            headers['If-Modified-Since'] = meta['Last-Modified']
+        return headers
+
+    def store(self, url, params, response):
+        """保存200响应的响应体和校验头，没有ETag/Last-Modified的响应和不使用缓存的URL不缓存"""
+        if not self.cacheable(url):
+            return
+        if not response.headers.get('ETag') and not response.headers.get('Last-Modified'):
+            return
+        meta = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+        meta['url'] = url
+        meta_path, body_path = self._paths(self.make_key(url, params))
+
+        # 先写临时文件再替换，避免并发请求读到写了一半的缓存
+        suffix = f'.{threading.get_ident()}.tmp'
+        with open(body_path + suffix, 'wb') as f:
+            f.write(response.content)
+        with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(body_path + suffix, body_path)
+        os.replace(meta_path + suffix, meta_path)
+
+    def build_response(self, entry, not_modified):
+        """用缓存的响应体构造一个200响应，响应头中的配额信息取自304响应"""
+        meta, body = entry
+        with self.lock:
+            self.hits += 1
+
+        headers = httpx.Headers({name: meta[name] for name in CACHED_HEADERS if name in meta})
+        for name, value in not_modified.headers.items():
+            # 缓存的是解码后的响应体，不能沿用304响应的长度和编码头
+            if name.lower() not in ('content-length', 'content-encoding', 'transfer-encoding'):
+                headers[name] = value
+        return httpx.Response(200, headers=headers, content=body, request=not_modified.request)
+
+    def prune(self):
+        """删除超过max_age没有用到的条目，总大小仍超过max_bytes时从最久未使用的条目开始删除，返回删除的条目数
+
+        同一个键的元数据、响应体和写了一半的临时文件作为一个条目，最后使用时间取其中最新的修改时间
+        """
+        entries = {}  # 键 -> [最后使用时间, 总大小, 文件列表]
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = entries.setdefault(name.split('.', 1)[0], [0.0, 0, []])
+            entry[0] = max(entry[0], stat.st_mtime)
+            entry[1] += stat.st_size
+            entry[2].append(path)
+
+        expired = []
+        if self.max_age is not None:
+            cutoff = time.time() - self.max_age
+            expired = [key for key, (used, _, _) in entries.items() if used < cutoff]
+        if self.max_bytes is not None:
+            removed = set(expired)
+            kept = sorted((key for key in entries if key not in removed), key=lambda key: entries[key][0])
+            total = sum(entries[key][1] for key in kept)
+            for key in kept:
+                if total <= self.max_bytes:
+                    break
+                total -= entries[key][1]
+                expired.append(key)
+
+        for key in expired:
+            for path in entries[key][2]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if expired:
+            print(f"  已清理 {len(expired)} 条过期的HTTP缓存")
+        return len(expired)
@@ -0,0 +1,248 @@
+"""多组关键词匹配器
+
+把若干组关键词编译在一起，一段文本只扫描一遍就能得到其中出现的全部关键词及其所属的组：
+安装了pyahocorasick时用Aho-Corasick自动机，没有安装时用一个由全部关键词组成的前缀树正则，结果相同。
+同一个关键词可以属于多个组，匹配区分大小写，调用方负责先把文本转为小写。
+
+对DataFrame的整列文本（common.scoring.TextColumn）匹配时，不含空格的关键词只可能出现在一个词里，
+只需在列中不同的词（vocabulary）上扫描一遍，再按词的编号映射回行；含空格的关键词按空格拆开，
+在相邻的词上分别判断首词的结尾、中间的整词和末词的开头
+"""
+import re
+
+import numpy as np
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# 切分整列文本的字符
+WORD_SEPARATOR = ' '
+# 拼接vocabulary时的分隔符，关键词中没有这个字符
+VOCABULARY_SEPARATOR = '\x00'
+
+
+def trie_pattern(keywords):
+    """把关键词编译成前缀树形式的正则（不带分组），同一位置上优先匹配最长的关键词"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def pattern(node):
+        ends = '' in node
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 and len(branches[0]) == 1 else '(?:' + '|'.join(branches) + ')'
+        return body + '?' if ends else body
+
+    return pattern(trie)
+
+
+class KeywordMatcher:
+    """编译好的多组关键词匹配器"""
+
+    def __init__(self, groups):
+        """groups为{组名: [关键词, ...]}，组的顺序即结果中组的顺序"""
+        self.groups = {group: list(keywords) for group, keywords in groups.items()}
+        # 关键词 -> 所属的组，空关键词在任何文本中都出现，不放进自动机
+        self.keyword_groups = {}
+        for group, keywords in self.groups.items():
+            for keyword in keywords:
+                owners = self.keyword_groups.setdefault(keyword, [])
+                if group not in owners:
+                    owners.append(group)
+        self.keywords = [keyword for keyword in self.keyword_groups if keyword]
+        self.index = {keyword: i for i, keyword in enumerate(self.keywords)}
+        # 每个关键词所属的组，组按定义顺序每64个压成一个位掩码
+        blocks = max(1, (len(self.groups) + 63) // 64)
+        columns = {group: column for column, group in enumerate(self.groups)}
+        self.owner_bits = np.zeros((len(self.keywords), blocks), dtype=np.uint64)
+        for keyword in self.keywords:
+            for group in self.keyword_groups[keyword]:
+                column = columns[group]
+                self.owner_bits[self.index[keyword], column // 64] |= np.uint64(1 << (column % 64))
+        # 含空格的关键词 -> 按空格拆开的各部分
+        self.phrases = {keyword: keyword.split(WORD_SEPARATOR) for keyword in self.keywords if WORD_SEPARATOR in keyword}
+
+        if AHOCORASICK_AVAILABLE:
+            self.automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self.automaton.add_word(keyword, self.index[keyword])
+            if self.keywords:
+                self.automaton.make_automaton()
+        elif self.keywords:
+            # 前向断言让每个位置都匹配一次，得到从该位置开始的最长关键词；
+            # 同一位置上较短的关键词是它的前缀，由prefixes补全
+            trie = trie_pattern(self.keywords)
+            self.regex = re.compile(f'(?=({trie}))')
+            self.vocabulary_regex = re.compile(f'(?=({trie}|{VOCABULARY_SEPARATOR}))')
+            self.prefixes = {keyword: [self.index[other] for other in self.keywords if keyword.startswith(other)]
+                             for keyword in self.keywords}
+            self.prefixes[VOCABULARY_SEPARATOR] = []
+
+    def scan(self, text):
+        """扫描一遍文本，返回其中出现的关键词的下标（可能重复）"""
+        if not self.keywords:
+            return []
+        if AHOCORASICK_AVAILABLE:
+            return [index for _, index in self.automaton.iter(text)]
+        return [index for longest in self.regex.findall(text) for index in self.prefixes[longest]]
+
+    def found_keywords(self, text):
+        """文本中出现过的全部关键词（集合）"""
+        found = {self.keywords[index] for index in self.scan(text)}
+        if '' in self.keyword_groups:
+            found.add('')
+        return found
+
+    def match(self, text):
+        """扫描一遍文本，返回{组名: [该组中出现的关键词, ...]}，只包含有匹配的组
+
+        每组内的关键词按组定义中的顺序排列（重复定义的关键词重复出现）
+        """
+        found = self.found_keywords(text)
+        result = {}
+        if not found:
+            return result
+        for group, keywords in self.groups.items():
+            matched = [keyword for keyword in keywords if keyword in found]
+            if matched:
+                result[group] = matched
+        return result
+
+    def vocabulary_hits(self, vocabulary):
+        """在不同的词上扫描一遍，返回(词的下标数组, 关键词下标数组)，每对表示该词中出现了该关键词"""
+        joined = VOCABULARY_SEPARATOR.join(vocabulary)
+        if AHOCORASICK_AVAILABLE:
+            ends, found = [], []
+            for end, index in self.automaton.iter(joined):
+                ends.append(end)
+                found.append(index)
+            lengths = np.fromiter(map(len, vocabulary), dtype=np.int64, count=len(vocabulary))
+            starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+            entries = np.searchsorted(starts, np.asarray(ends, dtype=np.int64), side='right') - 1
+            return entries, np.asarray(found, dtype=np.int64)
+
+        entries, found = [], []
+        entry = 0
+        for longest in self.vocabulary_regex.findall(joined):
+            if longest == VOCABULARY_SEPARATOR:
+                entry += 1
+                continue
+            for index in self.prefixes[longest]:
+                entries.append(entry)
+                found.append(index)
+        return np.asarray(entries, dtype=np.int64), np.asarray(found, dtype=np.int64)
+
+    def phrase_positions(self, text):
+        """含空格的关键词在整列文本中出现的位置，返回{关键词: 起始词的下标数组}
+
+        关键词按空格拆开后，从第position个词的结尾开始，中间的词完全相同，到第position+k个词的开头结束；
+        先用所有关键词的首词一起筛出候选位置，再逐个关键词检查
+        """
+        codes, vocabulary, separator, _ = text.words
+
+        def test(predicate):
+            """vocabulary中每个词是否满足predicate的布尔数组，文本之间的分隔符不满足"""
+            result = np.fromiter(map(predicate, vocabulary), dtype=bool, count=len(vocabulary))
+            if separator >= 0:
+                result[separator] = False
+            return result
+
+        firsts = {keyword: test(lambda word, part=parts[0]: word.endswith(part))
+                  for keyword, parts in self.phrases.items()}
+        candidates = np.flatnonzero(np.logical_or.reduce(list(firsts.values()))[codes])
+        positions = {}
+        for keyword, parts in self.phrases.items():
+            last = len(parts) - 1
+            found = candidates[candidates < len(codes) - last]
+            found = found[firsts[keyword][codes[found]]]
+            for offset, part in enumerate(parts[1:], 1):
+                if offset < last:
+                    matches = test(lambda word, part=part: word == part)
+                else:
+                    matches = test(lambda word, part=part: word.startswith(part))
+                found = found[matches[codes[found + offset]]]
+            positions[keyword] = found
+        return positions
+
+    def keyword_rows(self, text):
+        """对整列文本（TextColumn）匹配，返回{关键词: 出现该关键词的不同文本（text.distinct）的下标数组（可能重复）}"""
+        rows = {keyword: np.zeros(0, dtype=np.int64) for keyword in self.keywords}
+        if self.keywords and len(text):
+            codes, vocabulary, _, _ = text.words
+            positions = {}
+            entries, found = self.vocabulary_hits(vocabulary)
+            if len(entries):
+                # 按编号排序后，同一个词的所有出现位置是连续的一段
+                order = np.argsort(codes)
+                offsets = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(vocabulary)))))
+                for entry, index in set(zip(entries.tolist(), found.tolist())):
+                    positions.setdefault(self.keywords[index], []).append(order[offsets[entry]:offsets[entry + 1]])
+            if self.phrases:
+                for keyword, found_positions in self.phrase_positions(text).items():
+                    positions.setdefault(keyword, []).append(found_positions)
+            for keyword, parts in positions.items():
+                rows[keyword] = text.distinct_of(np.concatenate(parts))
+        if '' in self.keyword_groups:
+            rows[''] = np.arange(len(text.distinct))
+        return rows
+
+    def match_matrix(self, text):
+        """对整列文本匹配，返回(行数 x 关键词数)的布尔矩阵，列的顺序与self.keyword_groups一致"""
+        matrix = np.zeros((len(text.distinct), len(self.keyword_groups)), dtype=bool)
+        rows = self.keyword_rows(text)
+        for column, keyword in enumerate(self.keyword_groups):
+            matrix[rows[keyword], column] = True
+        return matrix[text.row_codes]
+
+    def membership(self):
+        """(关键词数 x 组数)的矩阵，元素为关键词在组定义中出现的次数"""
+        index = {keyword: column for column, keyword in enumerate(self.keyword_groups)}
+        matrix = np.zeros((len(self.keyword_groups), len(self.groups)), dtype=np.int64)
+        for column, keywords in enumerate(self.groups.values()):
+            for keyword in keywords:
+                matrix[index[keyword], column] += 1
+        return matrix
+
+    def group_counts(self, text):
+        """对整列文本匹配，返回{组名: 每行出现的该组关键词个数}，与match()结果中各组列表的长度一致"""
+        counts = self.match_matrix(text).astype(np.int64) @ self.membership()
+        return {group: counts[:, column] for column, group in enumerate(self.groups)}
+
+    def distinct_hits(self, text):
+        """对整列文本（TextColumn）匹配，返回{组名: 每个不同的文本是否出现该组关键词的布尔数组}
+
+        每个不同的词先算出它含有哪些组的关键词（每64组压成一个位掩码），按词的编号取出后逐个文本按位或，
+        不需要列出每个关键词所在的位置
+        """
+        blocks = max(1, (len(self.groups) + 63) // 64)
+        text_bits = np.zeros((len(text.distinct), blocks), dtype=np.uint64)
+        if self.keywords and len(text):
+            codes, vocabulary, _, word_starts = text.words
+            entries, found = self.vocabulary_hits(vocabulary)
+            word_bits = np.zeros((len(vocabulary), blocks), dtype=np.uint64)
+            np.bitwise_or.at(word_bits, entries, self.owner_bits[found])
+            text_bits = np.bitwise_or.reduceat(word_bits[codes], word_starts, axis=0)
+            if self.phrases:
+                for keyword, positions in self.phrase_positions(text).items():
+                    text_bits[text.distinct_of(positions)] |= self.owner_bits[self.index[keyword]]
+
+        result = {}
+        for column, group in enumerate(self.groups):
+            bit = np.uint64(1 << (column % 64))
+            hits = (text_bits[:, column // 64] & bit) != 0
+            if '' in self.groups[group]:
+                hits[:] = True
+            result[group] = hits
+        return result
+
+    def match_column(self, text):
+        """对整列文本（TextColumn）匹配，返回{组名: 每行是否出现该组关键词的布尔数组}"""
+        return {group: hits[text.row_codes] for group, hits in self.distinct_hits(text).items()}
@@ -0,0 +1,121 @@
+"""逐页追加写入的JSONL抓取日志
+
+全量抓取时每获取一页就把该页的记录作为一行追加到日志并立即刷到磁盘，
+中断后可以从日志中最后一页之后继续；读取时逐行解析，不需要一次载入整个文件。
+文件名以.zst结尾时每页压缩为一个独立的zstd帧（需要安装zstandard），仍然可以直接追加
+"""
+import io
+import json
+import os
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# 读取压缩日志时每次读入的字节数
+READ_SIZE = 1 << 16
+
+# 崩溃时写了一半的内容在读取时会引发这些异常
+CORRUPT_ERRORS = (ValueError, KeyError, zstandard.ZstdError) if ZSTD_AVAILABLE else (ValueError, KeyError)
+
+
+class PageLog:
+    """每行一页: {"page": 页码, "records": [记录, ...]}"""
+
+    def __init__(self, path, compress=None):
+        self.path = path
+        self.compress = path.endswith('.zst') if compress is None else compress
+        if self.compress and not ZSTD_AVAILABLE:
+            raise ImportError("压缩的抓取日志需要安装zstandard: pip install zstandard")
+        self.corrupted = False  # 读取时是否遇到了不完整的内容
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def encode(self, page, records):
+        data = (json.dumps({'page': page, 'records': records}, ensure_ascii=False) + '\n').encode('utf-8')
+        if self.compress:
+            data = zstandard.ZstdCompressor().compress(data)
+        return data
+
+    def append_page(self, page, records):
+        """追加一页记录并刷到磁盘"""
+        with open(self.path, 'ab') as f:
+            f.write(self.encode(page, records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def iter_pages(self):
+        """逐页产出(页码, 记录列表)，遇到崩溃时写了一半的内容就停止"""
+        self.corrupted = False
+        if not self.exists():
+            return
+        with open(self.path, 'rb') as f:
+            if self.compress:
+                reader = (data.decode('utf-8') for data in self.read_frames(f))
+            else:
+                reader = io.TextIOWrapper(f, encoding='utf-8')
+            try:
+                for line in reader:
+                    if not line.endswith('\n'):
+                        self.corrupted = True
+                        return
+                    entry = json.loads(line)
+                    yield entry['page'], entry['records']
+            except CORRUPT_ERRORS:
+                self.corrupted = True
+
+    def read_frames(self, f):
+        """逐个产出压缩日志中每个zstd帧（一页）解压后的内容
+
+        写了一半的帧解压时不报错也没有输出，只能由文件结束时帧仍未结束来发现，此时设置corrupted
+        """
+        decompressor = zstandard.ZstdDecompressor()
+        frame = decompressor.decompressobj()
+        output = []
+        started = False
+        while True:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                break
+            while chunk:
+                output.append(frame.decompress(chunk))
+                started = True
+                if not frame.eof:
+                    break
+                yield b''.join(output)
+                # 同一块中下一帧的开头
+                chunk = frame.unused_data
+                frame = decompressor.decompressobj()
+                output = []
+                started = False
+        if started:
+            self.corrupted = True
+
+    def iter_records(self):
+        """逐条产出日志中的记录"""
+        for _, records in self.iter_pages():
+            yield from records
+
+    def recover(self):
+        """返回最后一个完整写入的页码，并截掉末尾不完整的内容，没有日志时返回0"""
+        last_page = 0
+        for page, _ in self.iter_pages():
+            last_page = max(last_page, page)
+
+        if self.corrupted:
+            print(f"抓取日志末尾的内容不完整，保留到第{last_page}页")
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                for page, records in self.iter_pages():
+                    f.write(self.encode(page, records))
+            os.replace(temp_path, self.path)
+            self.corrupted = False
+        return last_page
+
+    def clear(self):
+        """抓取完成后删除日志"""
+        if self.exists():
+            os.remove(self.path)
@@ -0,0 +1,67 @@
+"""用进程池并行处理DataFrame的分片
+
+把DataFrame按行切成连续的分片交给进程池处理，再按原来的顺序拼接结果。关键词匹配和评分都是
+只依赖行内容的纯计算，分片之间互不影响。编译好的状态（分类器、评分器中的KeywordMatcher）
+在工作进程启动时通过initializer传入一次，之后每个分片只传数据；处理函数必须是模块级函数，
+以func(state, shard)的形式调用
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# 并行处理时每个分片的行数
+SHARD_ROWS = 50000
+
+# 工作进程中的共享状态，由init_worker设置
+worker_state = None
+
+
+def init_worker(state):
+    """工作进程启动时保存共享状态"""
+    global worker_state
+    worker_state = state
+
+
+def run_shard(func, shard):
+    """在工作进程中处理一个分片"""
+    return func(worker_state, shard)
+
+
+def imap_ordered(func, state, shards, workers):
+    """按输入顺序逐个产出func(state, shard)的结果
+
+    同时提交给进程池的分片不超过2*workers个，shards可以是按需读取的迭代器，内存占用有上限
+    """
+    if workers <= 1:
+        for shard in shards:
+            yield func(state, shard)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(state,)) as executor:
+        pending = deque()
+        for shard in shards:
+            pending.append(executor.submit(run_shard, func, shard))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def split_frame(df, shard_rows=SHARD_ROWS):
+    """按行切成连续的分片，至少产出一个分片（空DataFrame时为它本身）"""
+    if len(df) <= shard_rows:
+        yield df
+        return
+    for start in range(0, len(df), shard_rows):
+        yield df.iloc[start:start + shard_rows]
+
+
+def map_frame(func, state, df, workers, shard_rows=SHARD_ROWS):
+    """把df切成分片并行处理，结果（DataFrame或Series）按原顺序拼接后返回"""
+    if workers <= 1:
+        return func(state, df)
+    # 行数不多时也切成至少workers份，让每个进程都有活干
+    shard_rows = max(1, min(shard_rows, -(-len(df) // workers)))
+    results = list(imap_ordered(func, state, split_frame(df, shard_rows), workers))
+    return pd.concat(results) if len(results) > 1 else results[0]
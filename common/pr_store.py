@@ -0,0 +1,149 @@
+"""基于SQLite的PR/issue缓存
+
+以(repo, number)为主键逐行存储，merged_at和updated_at上建有索引，
+支持按行upsert和读取，不需要像pr_cache.json那样每次整体读写
+"""
+import json
+import os
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prs (
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    state TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    merged_at TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (repo, number)
+);
+CREATE INDEX IF NOT EXISTS idx_prs_merged_at ON prs (repo, merged_at);
+CREATE INDEX IF NOT EXISTS idx_prs_updated_at ON prs (repo, updated_at);
+
+CREATE TABLE IF NOT EXISTS issues (
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    state TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    closed_at TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (repo, number)
+);
+CREATE INDEX IF NOT EXISTS idx_issues_updated_at ON issues (repo, updated_at);
+"""
+
+# 各表中除repo、number、data以外单独存储、可用于查询的列
+TABLE_COLUMNS = {
+    'prs': ['state', 'created_at', 'updated_at', 'merged_at'],
+    'issues': ['state', 'created_at', 'updated_at', 'closed_at']
+}
+
+
+class PrStore:
+    """PR和issue的SQLite缓存，完整的记录以JSON存在data列中"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        # WAL模式下写入只追加日志，读写互不阻塞
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def _upsert(self, table, repo, records):
+        columns = TABLE_COLUMNS[table]
+        names = ', '.join(['repo', 'number'] + columns + ['data'])
+        placeholders = ', '.join('?' * (len(columns) + 3))
+        updates = ', '.join(f'{name} = excluded.{name}' for name in columns + ['data'])
+        sql = (f'INSERT INTO {table} ({names}) VALUES ({placeholders}) '
+               f'ON CONFLICT (repo, number) DO UPDATE SET {updates}')
+        rows = [
+            [repo, record['number']] + [record.get(name) for name in columns] +
+            [json.dumps(record, ensure_ascii=False)]
+            for record in records
+        ]
+        with self.conn:
+            self.conn.executemany(sql, rows)
+        return len(rows)
+
+    def _get(self, table, repo, number):
+        row = self.conn.execute(f'SELECT data FROM {table} WHERE repo = ? AND number = ?',
+                                (repo, number)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _iter(self, table, repo, conditions=None, order='number DESC'):
+        """按条件逐行读取记录，conditions为{列名比较式: 参数}，如{'updated_at >= ?': since}"""
+        sql = f'SELECT data FROM {table} WHERE repo = ?'
+        params = [repo]
+        for condition, value in (conditions or {}).items():
+            sql += f' AND {condition}'
+            params.append(value)
+        sql += f' ORDER BY {order}'
+        for (data,) in self.conn.execute(sql, params):
+            yield json.loads(data)
+
+    def _count(self, table, repo):
+        return self.conn.execute(f'SELECT COUNT(*) FROM {table} WHERE repo = ?', (repo,)).fetchone()[0]
+
+    def upsert_prs(self, repo, prs):
+        """插入或更新PR，返回写入的行数"""
+        return self._upsert('prs', repo, prs)
+
+    def get_pr(self, repo, number):
+        """读取单个PR，不存在时返回None"""
+        return self._get('prs', repo, number)
+
+    def iter_prs(self, repo, merged_since=None, updated_since=None):
+        """按编号倒序逐个产出PR，可按合并时间或更新时间筛选"""
+        conditions = {}
+        if merged_since is not None:
+            conditions['merged_at >= ?'] = merged_since
+        if updated_since is not None:
+            conditions['updated_at >= ?'] = updated_since
+        return self._iter('prs', repo, conditions)
+
+    def load_prs(self, repo):
+        """读取仓库的全部PR，按编号倒序"""
+        return list(self.iter_prs(repo))
+
+    def count_prs(self, repo):
+        return self._count('prs', repo)
+
+    def upsert_issues(self, repo, issues):
+        """插入或更新issue，返回写入的行数"""
+        return self._upsert('issues', repo, issues)
+
+    def get_issue(self, repo, number):
+        return self._get('issues', repo, number)
+
+    def iter_issues(self, repo, updated_since=None):
+        """按编号倒序逐个产出issue，可按更新时间筛选"""
+        conditions = {}
+        if updated_since is not None:
+            conditions['updated_at >= ?'] = updated_since
+        return self._iter('issues', repo, conditions)
+
+    def load_issues(self, repo):
+        return list(self.iter_issues(repo))
+
+    def count_issues(self, repo):
+        return self._count('issues', repo)
+
+    def import_json(self, repo, json_file):
+        """把旧版pr_cache.json导入数据库，返回导入的PR数"""
+        with open(json_file, 'r', encoding='utf-8') as f:
+            prs = json.load(f)
+        return self.upsert_prs(repo, prs)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
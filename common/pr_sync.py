@@ -0,0 +1,87 @@
+"""PR缓存的增量同步：记录高水位线，只获取其后更新过的PR"""
+import json
+import os
+
+from common.github_client import fetch_updated_pulls
+
+
+def load_sync_state(state_file):
+    """读取上次同步记录的高水位线，不存在时返回None"""
+    if not os.path.exists(state_file):
+        return None
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"读取同步状态失败: {e}")
+        return None
+
+
+def save_sync_state(state_file, updated_at, number):
+    """保存高水位线：见过的最新updated_at及对应的PR编号"""
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump({'updated_at': updated_at, 'number': number}, f, ensure_ascii=False, indent=2)
+
+
+def get_high_water_mark(prs):
+    """从PR列表中找出最新的(updated_at, number)
+
+    旧版缓存没有updated_at字段，用merged_at代替，因为PR的更新时间不会早于合并时间
+    """
+    mark = None
+    for pr in prs:
+        updated_at = pr.get('updated_at') or pr.get('merged_at')
+        if updated_at and (mark is None or (updated_at, pr['number']) > mark):
+            mark = (updated_at, pr['number'])
+    return mark
+
+
+def merge_prs(cached_prs, delta):
+    """把增量PR合并进缓存列表：已有的就地替换，新的按编号倒序放在最前面"""
+    delta = dict(delta)
+    merged = [delta.pop(pr['number'], pr) for pr in cached_prs]
+    new_prs = sorted(delta.values(), key=lambda pr: pr['number'], reverse=True)
+    return new_prs + merged
+
+
+def sync_merged_prs(client, owner, repo, cached_prs, state_file, simplify, per_page=100,
+                    fetch_updated=fetch_updated_pulls):
+    """增量同步已合并的PR
+
+    按updated倒序请求PR列表，直到遇到早于高水位线的PR为止，把其中已合并的PR
+    经simplify精简后合并进缓存。fetch_updated可替换为GraphQL后端的同名函数。
+    返回(合并后的PR列表, 本次新增或更新的PR列表)
+    """
+    state = load_sync_state(state_file)
+    if state:
+        mark = (state['updated_at'], state['number'])
+    else:
+        mark = get_high_water_mark(cached_prs)
+    if mark is None:
+        return cached_prs, []
+
+    print(f"增量同步: 获取 {mark[0]} (PR #{mark[1]}) 之后更新的PR...")
+    delta = {}
+    newest = mark
+    completed = True
+    for page, prs in fetch_updated(client, owner, repo, mark[0], per_page=per_page):
+        if prs is None:
+            print(f"获取第{page}页更新失败，本次不推进高水位线")
+            completed = False
+            break
+
+        for pr in prs:
+            if pr['updated_at'] < mark[0]:
+                break
+            # 高水位线上的PR本身上次已经同步过
+            if (pr['updated_at'], pr['number']) == mark:
+                continue
+            newest = max(newest, (pr['updated_at'], pr['number']))
+            if pr.get('merged_at'):
+                delta[pr['number']] = simplify(pr)
+
+    merged = merge_prs(cached_prs, delta)
+
+    if completed:
+        save_sync_state(state_file, *newest)
+    return merged, list(delta.values())
@@ -0,0 +1,216 @@
+"""根据GitHub响应头自适应调节请求节奏的调度器
+
+跟踪每类配额（core、search、graphql）的X-RateLimit-Remaining和X-RateLimit-Reset。
+配额充足时只按max_rate发送，剩余配额低于保留量（上限的RESERVE_FRACTION）或低于预计还要发出的请求数时，
+才把剩余配额平均分配到重置前的时间里；遇到403/429时按Retry-After或重置时间暂停，
+传输错误和5xx按指数退避加随机抖动重试，其余4xx不重试。
+配置多个token时，每个token有自己的调度器，请求交给剩余配额最多的token
+"""
+import asyncio
+import random
+import time
+
+# 剩余配额不高于上限的这个比例时，开始把剩余配额平均分配到重置前
+RESERVE_FRACTION = 0.1
+
+
+def get_resource(url):
+    """根据请求URL判断消耗哪一类配额"""
+    if url.rstrip('/').endswith('/graphql'):
+        return 'graphql'
+    if '/search/' in url:
+        return 'search'
+    return 'core'
+
+
+def is_rate_limited(response):
+    """判断403/429响应是否由主速率限制或次级速率限制引起"""
+    if response is None:
+        return False
+    if response.status_code == 429:
+        return True
+    if response.status_code != 403:
+        return False
+    if 'Retry-After' in response.headers or response.headers.get('X-RateLimit-Remaining') == '0':
+        return True
+    return 'rate limit' in response.text.lower()
+
+
+def is_retryable(response):
+    """失败的请求是否值得重试: 传输错误（没有响应）、5xx和速率限制可以重试，其余4xx（401、404、422等）重试也不会成功"""
+    if response is None or response.status_code >= 500:
+        return True
+    return is_rate_limited(response)
+
+
+class RateLimitScheduler:
+    """为一个token的所有请求分配发送时间
+
+    只在客户端的事件循环中使用
+    """
+
+    def __init__(self, max_rate=10.0, backoff_base=3, backoff_cap=600):
+        self.max_rate = max_rate  # 配额充足时每秒最多发出的请求数
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # 各类配额的状态: {'limit', 'remaining', 'reset_at'}，收到响应之前未知
+        self.states = {}
+        self.next_slot = 0.0
+        # 各类配额预计还要发出的请求数，由expect设置
+        self.demand = {}
+        self.paused_until = 0.0  # 遇到速率限制后所有请求暂停到这个时间
+
+    def seed(self, resources):
+        """用/rate_limit接口返回的resources初始化各类配额的状态"""
+        for resource, info in resources.items():
+            self.states[resource] = {
+                'limit': info.get('limit'),
+                'remaining': info['remaining'],
+                'reset_at': info['reset']
+            }
+
+    def remaining(self, resource='core'):
+        """返回某类配额的剩余请求数，未知时返回None"""
+        state = self.states.get(resource)
+        if state is None or state['reset_at'] <= time.time():
+            return None
+        return state['remaining']
+
+    def ready_at(self, resource='core'):
+        """返回可以再次发送请求的时间，配额耗尽或暂停期间是将来的某个时间"""
+        ready = self.paused_until
+        state = self.states.get(resource)
+        if state is not None and state['remaining'] <= 0:
+            ready = max(ready, state['reset_at'])
+        return ready
+
+    def expect(self, count, resource='core'):
+        """告知调度器接下来预计还要发出count个请求"""
+        self.demand[resource] = count
+
+    def interval(self, resource='core'):
+        """两次请求之间的间隔
+
+        剩余配额高于保留量和预计请求数时按max_rate发送；否则把剩余配额平均分配到重置前，但不超过max_rate
+        """
+        min_interval = 1 / self.max_rate
+        state = self.states.get(resource)
+        if state is None:
+            return min_interval
+
+        seconds_left = state['reset_at'] - time.time()
+        if seconds_left <= 0:
+            return min_interval
+        reserve = (state['limit'] or 0) * RESERVE_FRACTION
+        if state['remaining'] > max(reserve, self.demand.get(resource, 0)):
+            return min_interval
+        return max(min_interval, seconds_left / max(state['remaining'], 1))
+
+    async def acquire(self, resource='core'):
+        """等待到轮到本次请求发送的时间"""
+        # 速率限制引起的全局暂停
+        wait = self.paused_until - time.time()
+        if wait > 0:
+            print(f"  触发速率限制，暂停 {wait:.0f} 秒...")
+            await asyncio.sleep(wait)
+
+        # 配额耗尽，等到重置时间
+        state = self.states.get(resource)
+        if state is not None and state['remaining'] <= 0:
+            wait = state['reset_at'] - time.time()
+            if wait > 0:
+                print(f"  {resource}配额已用完，等待 {wait:.0f} 秒后重置...")
+                await asyncio.sleep(wait + 1)
+            self.states.pop(resource, None)
+            state = None
+
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval(resource)
+        if state is not None:
+            state['remaining'] -= 1
+        if self.demand.get(resource):
+            self.demand[resource] -= 1
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def update(self, headers):
+        """根据响应中的X-RateLimit头更新配额状态"""
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+
+        try:
+            remaining = int(remaining)
+            reset = int(reset)
+            limit = int(headers.get('X-RateLimit-Limit', 0)) or None
+        except ValueError:
+            return
+
+        resource = headers.get('X-RateLimit-Resource', 'core')
+        state = self.states.get(resource)
+        # 并发请求的响应可能乱序到达，同一个重置周期内只接受更小的剩余值
+        if state is None or state['reset_at'] != reset or remaining < state['remaining']:
+            self.states[resource] = {'limit': limit, 'remaining': remaining, 'reset_at': reset}
+
+    def backoff(self, response, attempt):
+        """计算第attempt次失败后的等待秒数
+
+        速率限制优先使用Retry-After，其次是重置时间，并让所有请求一起暂停；
+        传输错误和5xx按指数退避加随机抖动
+        """
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+        delay += random.uniform(0, self.backoff_base)
+
+        if is_rate_limited(response):
+            headers = response.headers
+            if 'Retry-After' in headers:
+                delay = int(headers['Retry-After'])
+            elif headers.get('X-RateLimit-Remaining') == '0' and 'X-RateLimit-Reset' in headers:
+                delay = max(int(headers['X-RateLimit-Reset']) - time.time(), 0) + 1
+            else:
+                # 次级速率限制没有给出等待时间时，GitHub建议至少等待1分钟
+                delay = max(delay, 60)
+            self.paused_until = max(self.paused_until, time.time() + delay)
+
+        return delay
+
+
+class TokenPool:
+    """多个token组成的池，每个token单独跟踪配额和重置时间
+
+    每次请求选择剩余配额最多的token，配额相同时轮流使用；
+    配额耗尽或触发速率限制的token在重置前不再被选中，
+    所有token都不可用时选择最早恢复的那个
+    """
+
+    def __init__(self, tokens, max_rate=10.0, backoff_base=3):
+        self.tokens = list(dict.fromkeys(tokens)) or [None]
+        self.schedulers = {
+            token: RateLimitScheduler(max_rate=max_rate, backoff_base=backoff_base)
+            for token in self.tokens
+        }
+        self.turn = 0
+
+    def expect(self, count, resource='core'):
+        """把预计的请求数平均分到各个token"""
+        for scheduler in self.schedulers.values():
+            scheduler.expect(-(-count // len(self.tokens)), resource)
+
+    def quota(self, token, resource='core'):
+        """token的剩余配额，还没有收到过响应时视为无限"""
+        remaining = self.schedulers[token].remaining(resource)
+        return float('inf') if remaining is None else remaining
+
+    def choose(self, resource='core'):
+        """选择本次请求使用的token"""
+        # 从上次的下一个token开始比较，配额相同时实现轮询
+        order = self.tokens[self.turn:] + self.tokens[:self.turn]
+        self.turn = (self.turn + 1) % len(self.tokens)
+
+        now = time.time()
+        available = [token for token in order if self.schedulers[token].ready_at(resource) <= now]
+        if not available:
+            return min(order, key=lambda token: self.schedulers[token].ready_at(resource))
+        return max(available, key=lambda token: self.quota(token, resource))
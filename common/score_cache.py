@@ -0,0 +1,93 @@
+"""持久化的PR置信度缓存
+
+以(评分配置指纹, 内容哈希)为键保存每个PR的置信度。内容哈希覆盖评分用到的全部字段
+（标题、正文、标签、增删行数、改动文件数），评分配置指纹覆盖评分规则的版本、关键词表和权重，
+因此只有内容或评分规则变化过的PR需要重新评分
+"""
+import hashlib
+import os
+import sqlite3
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    fingerprint TEXT NOT NULL,
+    content_hash BLOB NOT NULL,
+    confidence INTEGER NOT NULL,
+    PRIMARY KEY (fingerprint, content_hash)
+) WITHOUT ROWID;
+"""
+
+# 内容哈希的字节数（128位）
+DIGEST_SIZE = 16
+
+# 每次查询的内容哈希个数，不超过SQLite单条语句的参数个数上限（旧版本为999）
+LOOKUP_BATCH = 500
+
+
+def content_hashes(frame, text_columns, numeric_columns):
+    """每行内容的哈希（bytes列表）
+
+    frame中的列应已规范化（文本列为字符串，数值列为浮点数），同样的内容才会得到同样的哈希；
+    文本之间用\\x00分隔，再加上各文本的长度，文本中本身含有\\x00时也不会混淆
+    """
+    texts = [frame[column].tolist() for column in text_columns]
+    lengths = [np.fromiter(map(len, values), dtype=float, count=len(values)) for values in texts]
+    numbers = np.column_stack([frame[column].to_numpy(dtype=float) for column in numeric_columns] + lengths)
+    return [hashlib.blake2b('\x00'.join(values).encode('utf-8') + row.tobytes(), digest_size=DIGEST_SIZE).digest()
+            for *values, row in zip(*texts, numbers)]
+
+
+class ScoreCache:
+    """置信度缓存，存放在SQLite数据库中"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def lookup(self, fingerprint, hashes):
+        """按内容哈希查询置信度，返回浮点数组，没有缓存的行为NaN
+
+        只按主键查询这些哈希（每批LOOKUP_BATCH个），读取的行数与hashes的长度有关，与缓存的总行数无关
+        """
+        cached = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), LOOKUP_BATCH):
+            batch = unique[start:start + LOOKUP_BATCH]
+            placeholders = ', '.join('?' * len(batch))
+            query = ('SELECT content_hash, confidence FROM scores '
+                     f'WHERE fingerprint = ? AND content_hash IN ({placeholders})')
+            cached.update(self.conn.execute(query, [fingerprint, *batch]))
+        return np.array([cached.get(key, np.nan) for key in hashes], dtype=float)
+
+    def store(self, fingerprint, hashes, confidences):
+        """保存新计算的置信度"""
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO scores VALUES (?, ?, ?)',
+                                  zip([fingerprint] * len(hashes), hashes, [int(value) for value in confidences]))
+
+    def prune(self, fingerprints):
+        """删除不属于给定评分配置指纹的旧缓存，返回删除的行数"""
+        placeholders = ', '.join('?' * len(fingerprints))
+        with self.conn:
+            cursor = self.conn.execute(f'DELETE FROM scores WHERE fingerprint NOT IN ({placeholders})',
+                                       list(fingerprints))
+        return cursor.rowcount
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
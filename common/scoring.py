@@ -0,0 +1,131 @@
+"""PR bug修复置信度的向量化计算工具
+
+整列文本按空格切分成词并给不同的词编号，关键词只在不同的词上匹配，再按编号映射回行得到布尔数组，
+最后用NumPy按权重相加，代替逐行DataFrame.apply；匹配语义与逐行的`keyword in text.lower()`完全一致
+"""
+import re
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from common.keyword_matcher import KeywordMatcher, WORD_SEPARATOR
+
+# 拼接整列文本时的分隔符，关键词和正则都不会匹配跨过它
+SEPARATOR = '\x1e'
+# 文本中本身含有分隔符或NUL时替换成的字符（pandas按C字符串对词编号，NUL之后的内容会被忽略）；
+# 关键词和正则中都没有这几个控制字符，替换不改变匹配结果
+SEPARATOR_SUBSTITUTE = '\x1f'
+
+
+class TextColumn:
+    """一列文本，匹配时不区分大小写
+
+    先给各行编号，相同的文本只保留一份（distinct，row_codes为每行在其中的下标）；
+    再把不同的文本用SEPARATOR拼接后按空格切分成词并给不同的词编号（words），只把不同的词转为小写：
+    str.lower()不会产生或去掉空格，按空格切分后再转小写与逐行转小写的结果相同。
+    同一列中重复的词很多，关键词匹配只需在不同的词上做一遍
+    """
+
+    def __init__(self, values):
+        values = list(values)
+        self.size = len(values)
+        joined = SEPARATOR.join(values)
+        if joined.count(SEPARATOR) != max(self.size - 1, 0) or '\x00' in joined:
+            values = [value.replace(SEPARATOR, SEPARATOR_SUBSTITUTE).replace('\x00', SEPARATOR_SUBSTITUTE)
+                      for value in values]
+        self.row_codes, distinct = pd.factorize(np.array(values, dtype=object))
+        self.distinct = distinct.tolist()
+
+    def __len__(self):
+        return self.size
+
+    @cached_property
+    def words(self):
+        """(codes, vocabulary, separator, word_starts)
+
+        codes为每个词的编号，vocabulary为按编号排列的不同的词（已转小写，可能有重复），
+        word_starts为每个不同的文本第一个词的下标；文本之间的分隔符单独成词，编号为separator（只有一个文本时为-1），
+        在vocabulary中记为空字符串
+        """
+        delimiter = f'{WORD_SEPARATOR}{SEPARATOR}{WORD_SEPARATOR}'
+        codes, uniques = pd.factorize(np.array(delimiter.join(self.distinct).split(WORD_SEPARATOR), dtype=object))
+        vocabulary = [word.lower() for word in uniques.tolist()]
+        separator = -1
+        word_starts = np.zeros(min(len(self.distinct), 1), dtype=np.int64)
+        if len(self.distinct) > 1:
+            separator = vocabulary.index(SEPARATOR)
+            vocabulary[separator] = ''
+            word_starts = np.concatenate((word_starts, np.flatnonzero(codes == separator) + 1))
+        return codes, vocabulary, separator, word_starts
+
+    def distinct_of(self, positions):
+        """把词的下标映射为所在的不同文本的下标"""
+        return np.searchsorted(self.words[3], positions, side='right') - 1
+
+    def lowered(self, index):
+        """第index个不同的文本转为小写"""
+        return self.distinct[index].lower()
+
+
+def text_values(df, column):
+    """取出文本列的字符串列表，缺失的列和空值视为空字符串"""
+    if column not in df.columns:
+        return [''] * len(df)
+    return [value if isinstance(value, str) else ('' if pd.isna(value) else str(value))
+            for value in df[column].tolist()]
+
+
+def text_column(df, column):
+    """取出文本列（匹配时转小写），缺失的列和空值视为空字符串"""
+    return TextColumn(text_values(df, column))
+
+
+def match_groups(text, groups):
+    """返回{组名: 每行是否包含该组任一关键词（子串匹配）的布尔数组}"""
+    return KeywordMatcher(groups).match_column(text)
+
+
+def matches_any(text, patterns, flags=0, required=None):
+    """每行文本是否匹配任一正则表达式，返回布尔数组
+
+    所有模式合并成一个正则（模式中不能用反向引用），在每个不同的文本转为小写后search一次；
+    给出required时，只检查含有这个字符串（小写）的文本，每个模式的匹配都必须包含它
+    """
+    if not patterns:
+        return np.zeros(len(text), dtype=bool)
+    regex = re.compile('|'.join(f'(?:{pattern})' for pattern in patterns), flags)
+    hits = np.zeros(len(text.distinct), dtype=bool)
+    if required is None:
+        candidates = range(len(text.distinct))
+    else:
+        candidates = np.flatnonzero(KeywordMatcher({required: [required]}).distinct_hits(text)[required]).tolist()
+    hits[list(candidates)] = [regex.search(text.lowered(index)) is not None for index in candidates]
+    return hits[text.row_codes]
+
+
+def numeric_column(df, column, default=0):
+    """取出数值列，缺失的列视为default，空值保留为NaN"""
+    if column not in df.columns:
+        return np.full(len(df), default, dtype=float)
+    return df[column].astype(float).to_numpy()
+
+
+def change_size_score(df):
+    """按改动规模调整置信度，只在有详细信息（非空）时评估
+
+    改动行数<10加10分、>100减10分；改动文件数为1加5分、>5减5分
+    """
+    changes = numeric_column(df, 'additions') + numeric_column(df, 'deletions')
+    changed_files = numeric_column(df, 'changed_files')
+
+    # NaN参与比较的结果都是False，相当于跳过没有详细信息的行
+    with np.errstate(invalid='ignore'):
+        score = 10 * (changes < 10) - 10 * (changes > 100)
+        score += 5 * (changed_files == 1) - 5 * (changed_files > 5)
+    return score.astype(np.int64)
+
+
+def clip_confidence(confidence, index):
+    """把置信度限制在0-100之间，返回与DataFrame对齐的Series"""
+    return pd.Series(np.clip(confidence, 0, 100), index=index)
@@ -0,0 +1,124 @@
+"""流水线各阶段之间交换数据的存储格式
+
+阶段之间用Parquet文件传递数据：列式存储、压缩，保存各列的类型（布尔列、数值列读回来仍是原来的类型，
+不必重新解析文本），下一阶段可以只读取需要的列。CSV只作为给人查看的导出格式。
+没有安装pyarrow时阶段文件退回为CSV，格式与导出的CSV相同
+"""
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+PARQUET_SUFFIX = '.parquet'
+CSV_SUFFIX = '.csv'
+
+# Parquet文件的压缩算法
+COMPRESSION = 'zstd'
+
+
+def stage_file(name):
+    """阶段文件的路径：name加上扩展名，没有安装pyarrow时为CSV"""
+    return name + (PARQUET_SUFFIX if PARQUET_AVAILABLE else CSV_SUFFIX)
+
+
+def is_parquet(file_path):
+    return file_path.lower().endswith(PARQUET_SUFFIX)
+
+
+def csv_path(file_path):
+    """同名的CSV导出文件路径"""
+    return os.path.splitext(file_path)[0] + CSV_SUFFIX
+
+
+def writable_path(file_path):
+    """要写Parquet但没有安装pyarrow时改写为同名的CSV"""
+    if is_parquet(file_path) and not PARQUET_AVAILABLE:
+        fallback = csv_path(file_path)
+        print(f"未安装pyarrow，{file_path} 改为保存为 {fallback}")
+        return fallback
+    return file_path
+
+
+def read_stage(file_path, columns=None):
+    """读取阶段文件（按扩展名区分Parquet和CSV），columns给出时只读取这些列"""
+    if is_parquet(file_path):
+        return pd.read_parquet(file_path, columns=columns)
+    return pd.read_csv(file_path, usecols=columns)
+
+
+def iter_stage(file_path, chunksize, columns=None):
+    """按块读取阶段文件，每块最多chunksize行"""
+    if is_parquet(file_path):
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(file_path, chunksize=chunksize, usecols=columns)
+
+
+def write_csv(df, file_path, prepare_csv=None, append=False):
+    """把df写成给人查看的CSV，prepare_csv为写出前对df的转换（例如把位掩码列展开为布尔列）"""
+    (prepare_csv(df) if prepare_csv else df).to_csv(file_path, mode='a' if append else 'w', header=not append,
+                                                     index=False, encoding='utf-8')
+
+
+def write_stage(df, file_path, export_csv=False, prepare_csv=None):
+    """保存阶段文件，export_csv为True时另外导出同名的CSV，返回实际保存的阶段文件路径
+
+    写出的CSV都先经过prepare_csv转换：没有安装pyarrow、阶段文件本身就是CSV时也一样，
+    与导出的CSV内容相同；Parquet阶段文件不受影响
+    """
+    file_path = writable_path(file_path)
+    if is_parquet(file_path):
+        df.to_parquet(file_path, index=False, compression=COMPRESSION)
+        if export_csv:
+            write_csv(df, csv_path(file_path), prepare_csv)
+    else:
+        write_csv(df, file_path, prepare_csv)
+    return file_path
+
+
+class StageWriter:
+    """逐块追加写出阶段文件
+
+    Parquet文件的列类型以第一块为准，之后的块按同样的类型转换后写成新的行组；
+    export_csv和prepare_csv与write_stage相同，CSV逐块追加
+    """
+
+    def __init__(self, file_path, export_csv=False, prepare_csv=None):
+        self.file_path = writable_path(file_path)
+        self.prepare_csv = prepare_csv
+        if is_parquet(self.file_path):
+            self.csv_file = csv_path(self.file_path) if export_csv else None
+        else:
+            self.csv_file = self.file_path
+        self.writer = None
+        self.chunks = 0
+
+    def write(self, chunk):
+        if is_parquet(self.file_path):
+            if self.writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                self.writer = pq.ParquetWriter(self.file_path, table.schema, compression=COMPRESSION)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=self.writer.schema, preserve_index=False)
+            self.writer.write_table(table)
+        if self.csv_file:
+            write_csv(chunk, self.csv_file, self.prepare_csv, append=self.chunks > 0)
+        self.chunks += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
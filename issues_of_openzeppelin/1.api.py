@@ -1,17 +1,31 @@
-import requests
 import pandas as pd
-from datetime import datetime
-import time
+from datetime import datetime, timedelta, timezone
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.github_client import GitHubClient, fetch_issue_pages, fetch_updated_issues
+from common.http_cache import HttpCache
+from common.pr_store import PrStore
+from common.pr_sync import load_sync_state, save_sync_state
 
 # GitHub API配置
-BASE_URL = "https://api.github.com"
+BASE_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
 REPO = "OpenZeppelin/openzeppelin-contracts"
-TOKEN = "YOUR_GITHUB_TOKEN"
+TOKEN = "YOUR_GITHUB_TOKEN"  # 也可以是token列表，多个token按剩余配额分配请求
+HTTP_CACHE_DIR = "http_cache"  # ETag条件请求缓存
+CACHE_DB = "issues_cache.db"  # issue缓存数据库，增量同步的结果逐条upsert
+SYNC_STATE_FILE = "issues_sync_state.json"  # 增量同步的高水位线（上次同步开始的时间）
+OUTPUT_FILE = "openzeppelin_issues.csv"
 
-headers = {
-    "Authorization": f"token {TOKEN}",
-    "Accept": "application/vnd.github.v3+json"
-}
+# 列表页的并发数
+PAGE_WORKERS = 4
+
+# 只获取上次同步之后更新过的issue；关闭时每次全量获取
+INCREMENTAL_SYNC = True
+
+# 高水位线比同步开始时间提前的量，容忍本机与GitHub的时钟偏差
+SYNC_OVERLAP = timedelta(minutes=5)
 
 # 基础查询参数
 params = {
@@ -20,38 +34,47 @@ params = {
 }
 
 
-def test_api_connection():
+def create_client():
+    """创建共享客户端，复用连接并自动重试，未变化的页面通过条件请求返回304，不消耗配额
+
+    客户端在后台线程中运行事件循环，只在运行脚本时创建，导入本模块不会启动线程
+    """
+    return GitHubClient(TOKEN, base_url=BASE_URL, concurrency=PAGE_WORKERS, cache=HttpCache(HTTP_CACHE_DIR))
+
+
+def test_api_connection(client):
     """测试API连接和令牌有效性"""
-    test_response = requests.get(f"{BASE_URL}/rate_limit", headers=headers)
-    if test_response.status_code == 200:
+    test_response = client.get(f"{BASE_URL}/rate_limit")
+    if test_response is not None and test_response.status_code == 200:
         print("API连接成功!")
         rate_limit = test_response.json()
         print(f"API调用限制信息：")
         print(f"核心API剩余请求数: {rate_limit['resources']['core']['remaining']}")
         print(f"搜索API剩余请求数: {rate_limit['resources']['search']['remaining']}")
+        # 用当前配额初始化客户端的调度器，后续请求据此分配节奏
+        client.seed_rate_limit(rate_limit['resources'])
         return True
     else:
-        print(f"API连接失败! 状态码: {test_response.status_code}")
-        print(f"错误信息: {test_response.text}")
+        print("API连接失败!")
         return False
 
 
-def fetch_issues(page=1):
+def fetch_issues(client, page=1):
     """获取单页issues"""
     url = f"{BASE_URL}/repos/{REPO}/issues"
     params["page"] = page
-    response = requests.get(url, headers=headers, params=params)
+    response = client.get(url, params=params)
 
-    if response.status_code == 200:
+    if response is not None and response.status_code == 200:
         return response.json()
     else:
-        print(f"获取第{page}页失败! 状态码: {response.status_code}")
+        print(f"获取第{page}页失败!")
         return []
 
 
-def get_first_page_issues():
+def get_first_page_issues(client):
     """获取第一页issues并打印基本信息"""
-    issues = fetch_issues(page=1)
+    issues = fetch_issues(client, page=1)
     print(f"\n成功获取第一页issues，共{len(issues)}条")
 
     if issues:
@@ -60,100 +83,142 @@ def get_first_page_issues():
             print(f"#{issue['number']}: {issue['title']}")
 
 
+def simplify_issue(issue):
+    """只保留需要的字段，存入缓存数据库"""
+    simplified = {
+        'number': issue['number'],
+        'title': issue['title'],
+        'state': issue['state'],
+        'created_at': issue['created_at'],
+        'updated_at': issue['updated_at'],
+        'closed_at': issue.get('closed_at'),
+        'labels': [{'name': label['name']} for label in issue['labels']],
+        'body': issue.get('body', '')
+    }
+    if 'pull_request' in issue:
+        simplified['pull_request'] = issue['pull_request']
+    return simplified
+
+
+def fetch_all_issues(client, since=None):
+    """获取所有issues，给出since时只获取在此之后更新过的
+
+    全量获取时按创建时间排序，第1页确定总页数后并发获取其余页面；
+    增量获取时按更新时间倒序逐页获取。返回(issue列表, 是否全部获取成功)
+    """
+    owner, repo = REPO.split('/')
+    if since:
+        pages = fetch_updated_issues(client, owner, repo, since, per_page=params['per_page'])
+    else:
+        pages = fetch_issue_pages(client, owner, repo, per_page=params['per_page'])
+    all_issues = {}
+    for page, issues in pages:
+        if issues is None:
+            print(f"获取第{page}页失败!")
+            return list(all_issues.values()), False
+
+        # 按更新时间翻页时，抓取过程中被更新的issue之后的issue可能出现两次，内容相同
+        for issue in issues:
+            all_issues[issue['number']] = simplify_issue(issue)
+
+        # 简单的进度显示
+        print(f"已获取第{page}页，共{len(all_issues)}条issues")
+
+    return list(all_issues.values()), True
+
+
+def sync_issues(client):
+    """把上次同步之后更新过的issues upsert进缓存数据库，返回全部issues（按编号倒序）
+
+    缓存为空或关闭增量同步时全量获取；全部页面获取成功后才推进高水位线，
+    失败时已获取的issue仍然写入缓存，下次从原来的高水位线重新获取。
+    高水位线取本次同步开始的时间（提前SYNC_OVERLAP），而不是见过的最新updated_at:
+    抓取过程中被更新的issue可能以旧版本写入缓存，下次同步时会重新获取
+    """
+    with PrStore(CACHE_DB) as store:
+        state = load_sync_state(SYNC_STATE_FILE)
+        since = None
+        if INCREMENTAL_SYNC and state and store.count_issues(REPO):
+            since = state['updated_at']
+            print(f"增量同步: 获取 {since} 之后更新的issues...")
+        else:
+            print("全量获取所有issues...")
+
+        started_at = datetime.now(timezone.utc) - SYNC_OVERLAP
+        issues, completed = fetch_all_issues(client, since)
+        store.upsert_issues(REPO, issues)
+        print(f"新增或更新 {len(issues)} 条issues，缓存中共 {store.count_issues(REPO)} 条")
+
+        if completed:
+            save_sync_state(SYNC_STATE_FILE, started_at.strftime('%Y-%m-%dT%H:%M:%SZ'), None)
+        return store.load_issues(REPO)
+
+
+def process_issues(issues):
+    """处理和分析issues数据"""
+    processed_data = []
+
+    for issue in issues:
+        # 提取关键信息
+        issue_data = {
+            'number': issue['number'],
+            'title': issue['title'],
+            'state': issue['state'],
+            'created_at': issue['created_at'],
+            'closed_at': issue.get('closed_at'),
+            'labels': [label['name'] for label in issue['labels']],
+            'is_pull_request': 'pull_request' in issue,
+            'body': issue.get('body', '')
+        }
+
+        # 检查是否包含bug/fix相关关键词
+        keywords = ['bug', 'fix', 'error', 'issue', 'vulnerability', 'security']
+        issue_data['is_bug_related'] = any(
+            keyword in issue['title'].lower() or
+            (issue['body'] and keyword in issue['body'].lower())
+            for keyword in keywords
+        )
+
+        processed_data.append(issue_data)
+
+    return pd.DataFrame(processed_data)
+
+
+def analyze_data(df):
+    """分析处理后的数据"""
+    print("\n数据分析结果:")
+    print(f"总issues数量: {len(df)}")
+    print(f"bug相关issues数量: {df['is_bug_related'].sum()}")
+    print(f"开放状态的issues数量: {len(df[df['state'] == 'open'])}")
+
+    print("\n标签统计:")
+    all_labels = [label for labels in df['labels'] for label in labels]
+    label_counts = pd.Series(all_labels).value_counts()
+    print(label_counts.head())
+
+    return df
+
+
 if __name__ == "__main__":
-    # 先测试API连接
-    if test_api_connection():
-        # 如果连接成功，获取第一页数据
-        get_first_page_issues()
-
-
-        def fetch_all_issues():
-            """获取所有issues"""
-            all_issues = []
-            page = 1
-            while True:
-                print(f"正在获取第{page}页...")
-                issues = fetch_issues(page)
-
-                if not issues:
-                    break
-
-                all_issues.extend(issues)
-                page += 1
-
-                # 简单的进度显示
-                print(f"已获取{len(all_issues)}条issues")
-
-                # 检查是否还有下一页
-                if len(issues) < 100:  # 如果返回的数据少于每页最大数，说明是最后一页
-                    break
-
-                # 避免触发GitHub API限制
-                time.sleep(1)
-
-            return all_issues
-
-
-        def process_issues(issues):
-            """处理和分析issues数据"""
-            processed_data = []
-
-            for issue in issues:
-                # 提取关键信息
-                issue_data = {
-                    'number': issue['number'],
-                    'title': issue['title'],
-                    'state': issue['state'],
-                    'created_at': issue['created_at'],
-                    'closed_at': issue.get('closed_at'),
-                    'labels': [label['name'] for label in issue['labels']],
-                    'is_pull_request': 'pull_request' in issue,
-                    'body': issue.get('body', '')
-                }
-
-                # 检查是否包含bug/fix相关关键词
-                keywords = ['bug', 'fix', 'error', 'issue', 'vulnerability', 'security']
-                issue_data['is_bug_related'] = any(
-                    keyword in issue['title'].lower() or
-                    (issue['body'] and keyword in issue['body'].lower())
-                    for keyword in keywords
-                )
-
-                processed_data.append(issue_data)
-
-            return pd.DataFrame(processed_data)
-
-
-        def analyze_data(df):
-            """分析处理后的数据"""
-            print("\n数据分析结果:")
-            print(f"总issues数量: {len(df)}")
-            print(f"bug相关issues数量: {df['is_bug_related'].sum()}")
-            print(f"开放状态的issues数量: {len(df[df['state'] == 'open'])}")
-
-            print("\n标签统计:")
-            all_labels = [label for labels in df['labels'] for label in labels]
-            label_counts = pd.Series(all_labels).value_counts()
-            print(label_counts.head())
-
-            return df
-
-
-        if __name__ == "__main__":
-            # 测试API连接
-            if test_api_connection():
-                # 获取所有issues
-                print("\n开始获取所有issues...")
-                all_issues = fetch_all_issues()
-
-                # 处理数据
-                print("\n处理数据...")
-                df = process_issues(all_issues)
-
-                # 分析数据
-                df = analyze_data(df)
-
-                # 保存数据
-                print("\n保存数据到CSV文件...")
-                df.to_csv('openzeppelin_issues.csv', index=False)
-                print("数据已保存到 openzeppelin_issues.csv")
\ No newline at end of file
+    # 结束时关闭共享客户端的连接池和后台事件循环
+    with create_client() as client:
+        # 先测试API连接
+        if test_api_connection(client):
+            # 如果连接成功，获取第一页数据
+            get_first_page_issues(client)
+
+            # 获取上次同步之后更新过的issues，合并进缓存
+            print("\n开始同步issues...")
+            all_issues = sync_issues(client)
+
+            # 处理数据
+            print("\n处理数据...")
+            df = process_issues(all_issues)
+
+            # 分析数据
+            df = analyze_data(df)
+
+            # 保存数据
+            print("\n保存数据到CSV文件...")
+            df.to_csv(OUTPUT_FILE, index=False)
+            print(f"数据已保存到 {OUTPUT_FILE}")
@@ -1,41 +1,43 @@
 import pandas as pd
 import os
-import chardet
-import io
+import sys
 import csv
 from openpyxl import load_workbook
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.feature_bits import FEATURE_COLUMN, TITLE_FEATURES, expand_feature_column
+from common.file_format import FormatCache
+from common.parallel import imap_ordered
+from common.scoring import text_column
+from common.stage_io import stage_file, write_stage
+
+# 输入文件格式推断结果的缓存，文件没有变化时不再检测
+FORMAT_CACHE_FILE = "file_formats.json"
+
+# 并行读取时同时读取输入文件的进程数
+READ_WORKERS = os.cpu_count() or 1
+
+# 未指定进程数时，输入文件总大小达到这个字节数才启用多进程读取；
+# 小文件顺序读取更快，启动进程池（Windows上每个进程都要重新导入pandas）的开销超过并行节省的时间
+PARALLEL_READ_BYTES = 32 * 1024 * 1024
+
+# 交给分类阶段的数据文件（Parquet，未安装pyarrow时为CSV）
+PROCESSED_FILE = stage_file("processed_issues")
+
 
 class DataProcessor:
     def __init__(self):
         self.input_files = []
         self.combined_df = None
+        self.format_cache = FormatCache(FORMAT_CACHE_FILE)
 
     def add_input_file(self, file_path, source_label=None):
         """添加输入文件到处理列表"""
         self.input_files.append((file_path, source_label or os.path.basename(file_path).split('.')[0]))
 
     def detect_file_type(self, file_path):
-        """检测文件类型"""
-        with open(file_path, 'rb') as f:
-            header = f.read(4)
-
-        # Excel文件的标志
-        if header.startswith(b'PK'):
-            return 'xlsx'
-        # CSV文件可能的起始
-        elif any(header.startswith(x) for x in [b',', b';', b'\t', b'"', b"'"]):
-            return 'csv'
-        else:
-            # 尝试更详细的检测
-            with open(file_path, 'rb') as f:
-                content = f.read(500)
-                if b'docProps' in content and b'xl/' in content:
-                    return 'xlsx'
-                elif all(0x20 <= byte <= 0x7E or byte in [0x0A, 0x0D, 0x09] for byte in content):
-                    return 'csv'  # 可能是ASCII文本
-                else:
-                    return 'unknown'
+        """检测文件类型，返回'xlsx'、'csv'或'unknown'"""
+        return self.format_cache.detect(file_path)['type']
 
     def read_excel_file(self, file_path):
         """读取Excel文件"""
@@ -74,49 +76,41 @@ class DataProcessor:
                 print(f"openpyxl读取Excel失败: {e2}")
                 return None
 
-    def read_csv_file(self, file_path):
-        """读取CSV文件"""
+    def read_csv_file(self, file_path, file_format=None):
+        """读取CSV文件，编码、分隔符和引号规则由文件开头推断（有缓存时直接使用），整个文件只解析一次"""
         try:
-            # 检测编码
-            with open(file_path, 'rb') as f:
-                raw_data = f.read(10000)
-                result = chardet.detect(raw_data)
-                encoding = result['encoding'] or 'latin1'
-
-            # 尝试不同的分隔符
-            for sep in [',', ';', '\t', '|']:
-                try:
-                    df = pd.read_csv(file_path, sep=sep, encoding=encoding)
-                    if len(df.columns) > 1:
-                        return df
-                except:
-                    continue
-
-            # 所有标准尝试失败，试试更灵活的方法
-            with open(file_path, 'r', encoding=encoding, errors='replace') as f:
-                content = f.read()
-
-            # 尝试手动分析
-            sniffer = csv.Sniffer()
+            if file_format is None:
+                file_format = self.format_cache.detect(file_path)
+            if not file_format.get('sep'):
+                print(f"无法识别文件 {file_path} 的分隔符")
+                return None
+
+            encoding = file_format['encoding']
+            dialect = {'delimiter': file_format['sep'], 'quotechar': file_format['quotechar'],
+                       'doublequote': file_format['doublequote'], 'escapechar': file_format['escapechar']}
             try:
-                dialect = sniffer.sniff(content[:1024])
-                reader = csv.reader(io.StringIO(content), dialect)
-                rows = list(reader)
+                return pd.read_csv(file_path, sep=dialect['delimiter'], encoding=encoding,
+                                   quotechar=dialect['quotechar'], doublequote=dialect['doublequote'],
+                                   escapechar=dialect['escapechar'])
+            except (pd.errors.ParserError, UnicodeDecodeError) as e:
+                print(f"按推断的格式解析失败: {e}，改为逐行容错读取")
 
-                if not rows:
-                    return None
+            # 样本之后出现了多余字段或无法解码的字节，逐行读取，多余的字段丢弃
+            with open(file_path, 'r', encoding=encoding, errors='replace', newline='') as f:
+                rows = [row for row in csv.reader(f, **dialect) if row]
 
-                headers = rows[0]
-                data = {header: [] for header in headers}
+            if not rows:
+                return None
 
-                for row in rows[1:]:
-                    for i, value in enumerate(row):
-                        if i < len(headers):
-                            data[headers[i]].append(value)
+            headers = rows[0]
+            data = {header: [] for header in headers}
 
-                return pd.DataFrame(data)
-            except:
-                return None
+            for row in rows[1:]:
+                for i, value in enumerate(row):
+                    if i < len(headers):
+                        data[headers[i]].append(value)
+
+            return pd.DataFrame(dict((header, pd.Series(values)) for header, values in data.items()))
         except Exception as e:
             print(f"读取CSV文件失败: {e}")
             return None
@@ -128,66 +122,97 @@ class DataProcessor:
             return None
 
         print(f"\n处理文件: {file_path}")
-        file_type = self.detect_file_type(file_path)
+        file_format = self.format_cache.detect(file_path)
+        file_type = file_format['type']
         print(f"检测到文件类型: {file_type}")
 
         if file_type == 'xlsx':
             return self.read_excel_file(file_path)
         elif file_type == 'csv':
-            return self.read_csv_file(file_path)
+            print(f"编码: {file_format['encoding']}，分隔符: {file_format['sep']!r}")
+            return self.read_csv_file(file_path, file_format)
         else:
             print(f"未知文件类型，尝试作为Excel和CSV都处理")
             df = self.read_excel_file(file_path)
             if df is None:
-                df = self.read_csv_file(file_path)
+                df = self.read_csv_file(file_path, file_format)
             return df
 
-    def merge_datasets(self):
-        """合并所有输入数据集"""
-        dataframes = []
+    def read_source(self, file_path, source_label):
+        """读取一个输入文件并补齐必需的列（number、title）和来源标记，无法读取或文件为空时返回None"""
+        df = self.read_input_file(file_path)
+
+        if df is None or df.empty:
+            print(f"错误: 无法读取文件 {file_path} 或文件为空")
+            return None
+
+        # 确保存在必需的列
+        if 'number' not in df.columns or 'title' not in df.columns:
+            print(f"警告: 文件 {file_path} 缺少必需的列 (number, title)")
+
+            # 尝试查找可能的替代列名
+            possible_number_cols = ['number', 'num', 'id', 'issue', 'issue_id', '#']
+            possible_title_cols = ['title', 'name', 'description', 'summary', 'subject']
+
+            # 尝试映射列
+            number_col = None
+            for col in possible_number_cols:
+                if col in df.columns:
+                    number_col = col
+                    break
+
+            title_col = None
+            for col in possible_title_cols:
+                if col in df.columns:
+                    title_col = col
+                    break
+
+            # 重命名或创建必要的列
+            if number_col and number_col != 'number':
+                df['number'] = df[number_col]
+            elif 'number' not in df.columns:
+                df['number'] = range(1, len(df) + 1)
+
+            if title_col and title_col != 'title':
+                df['title'] = df[title_col]
+            elif 'title' not in df.columns:
+                df['title'] = f"Unknown title from {source_label}"
+
+        # 添加来源标记
+        df['source'] = source_label
+        print(f"成功读取 {file_path}，包含 {len(df)} 行数据")
+        return df
+
+    def read_workers(self):
+        """未指定进程数时的默认值: 输入文件总大小达到PARALLEL_READ_BYTES时为READ_WORKERS，否则顺序读取"""
+        total = sum(os.path.getsize(file_path) for file_path, _ in self.input_files if os.path.exists(file_path))
+        return READ_WORKERS if total >= PARALLEL_READ_BYTES else 1
+
+    def merge_datasets(self, workers=None):
+        """合并所有输入数据集
+
+        workers大于1时多个进程同时读取各输入文件，按添加的顺序取回结果，墙钟时间接近读取最大的单个文件的时间。
+        格式推断在主进程中先完成，工作进程只读取格式缓存。workers为None时按输入文件的总大小决定（见read_workers）。
+        每个文件读回后立即去掉之前已出现过的issue编号，重复的行不进入合并结果，最后只拼接一次
+        """
+        if workers is None:
+            workers = self.read_workers()
+        workers = min(workers, len(self.input_files))
+        if workers > 1:
+            for file_path, _ in self.input_files:
+                if os.path.exists(file_path):
+                    self.format_cache.detect(file_path)
 
-        for file_path, source_label in self.input_files:
-            df = self.read_input_file(file_path)
-
-            if df is not None and not df.empty:
-                # 确保存在必需的列
-                if 'number' not in df.columns or 'title' not in df.columns:
-                    print(f"警告: 文件 {file_path} 缺少必需的列 (number, title)")
-
-                    # 尝试查找可能的替代列名
-                    possible_number_cols = ['number', 'num', 'id', 'issue', 'issue_id', '#']
-                    possible_title_cols = ['title', 'name', 'description', 'summary', 'subject']
-
-                    # 尝试映射列
-                    number_col = None
-                    for col in possible_number_cols:
-                        if col in df.columns:
-                            number_col = col
-                            break
-
-                    title_col = None
-                    for col in possible_title_cols:
-                        if col in df.columns:
-                            title_col = col
-                            break
-
-                    # 重命名或创建必要的列
-                    if number_col and number_col != 'number':
-                        df['number'] = df[number_col]
-                    elif 'number' not in df.columns:
-                        df['number'] = range(1, len(df) + 1)
-
-                    if title_col and title_col != 'title':
-                        df['title'] = df[title_col]
-                    elif 'title' not in df.columns:
-                        df['title'] = f"Unknown title from {source_label}"
-
-                # 添加来源标记
-                df['source'] = source_label
-                dataframes.append(df)
-                print(f"成功读取 {file_path}，包含 {len(df)} 行数据")
-            else:
-                print(f"错误: 无法读取文件 {file_path} 或文件为空")
+        dataframes = []
+        seen = pd.Index([])
+        for df in imap_ordered(read_source, self, self.input_files, workers):
+            if df is None:
+                continue
+            # 与合并后再drop_duplicates相同：按添加的顺序保留每个编号第一次出现的行
+            df = df.drop_duplicates(subset=['number'])
+            df = df[~df['number'].isin(seen)]
+            seen = seen.append(pd.Index(df['number']))
+            dataframes.append(df)
 
         if not dataframes:
             # 如果没有有效数据，创建一个示例数据集
@@ -199,12 +224,9 @@ class DataProcessor:
             }
             self.combined_df = pd.DataFrame(sample_data)
         else:
-            # 合并有效的数据集
+            # 合并有效的数据集（已去除重复）
             self.combined_df = pd.concat(dataframes, ignore_index=True)
 
-            # 去除重复
-            self.combined_df = self.combined_df.drop_duplicates(subset=['number'])
-
             # 按issue编号排序
             try:
                 self.combined_df['number'] = pd.to_numeric(self.combined_df['number'], errors='coerce')
@@ -214,8 +236,12 @@ class DataProcessor:
 
         return self.combined_df
 
-    def enhance_features(self):
-        """从标题中提取特征"""
+    def enhance_features(self, expand=False):
+        """从标题中提取特征
+
+        合约名称特征（has_erc20等）和操作类型特征（op_transfer等）在标题上只扫描一遍，
+        按位打包保存在title_features列中；expand为True时另外展开为各特征的布尔列
+        """
         if self.combined_df is None:
             raise ValueError("请先合并数据集。")
 
@@ -225,29 +251,23 @@ class DataProcessor:
         # 标题转小写
         self.combined_df['title_lower'] = self.combined_df['title'].str.lower()
 
-        # 提取合约名称特征
-        contract_patterns = ['ERC20', 'ERC721', 'ERC1155', 'SafeMath', 'AccessControl',
-                             'Governor', 'Ownable', 'Proxy', 'TimeLock', 'Merkle']
-        for pattern in contract_patterns:
-            self.combined_df[f'has_{pattern.lower()}'] = self.combined_df['title_lower'].str.contains(
-                pattern.lower(), regex=False)
+        # 提取合约名称和操作类型特征
+        masks = TITLE_FEATURES.extract(text_column(self.combined_df, 'title_lower'))
+        self.combined_df[FEATURE_COLUMN] = masks
 
-        # 提取操作类型特征
-        operation_patterns = ['transfer', 'approve', 'mint', 'burn', 'initialize', 'deploy',
-                              'upgrade', 'delegatecall', 'verify', 'validate']
-        for pattern in operation_patterns:
-            self.combined_df[f'op_{pattern}'] = self.combined_df['title_lower'].str.contains(
-                pattern, regex=False)
+        if expand:
+            features = TITLE_FEATURES.expand(masks, index=self.combined_df.index)
+            self.combined_df = pd.concat([self.combined_df, features], axis=1)
 
         return self.combined_df
 
-    def save_processed_data(self, output_file="processed_issues.csv"):
-        """保存处理过的数据"""
+    def save_processed_data(self, output_file=PROCESSED_FILE, export_csv=True):
+        """保存处理过的数据，export_csv为True时另外导出CSV（标题特征展开为has_xxx、op_xxx列）"""
         if self.combined_df is None:
             raise ValueError("没有数据可保存。")
 
         try:
-            self.combined_df.to_csv(output_file, index=False, encoding='utf-8')
+            output_file = write_stage(self.combined_df, output_file, export_csv, expand_feature_column)
             print(f"处理后的数据已保存至 {output_file}")
         except Exception as e:
             print(f"保存数据时出错: {e}")
@@ -255,7 +275,7 @@ class DataProcessor:
             try:
                 essential_cols = ['number', 'title', 'source', 'title_lower']
                 cols_to_save = [col for col in essential_cols if col in self.combined_df.columns]
-                self.combined_df[cols_to_save].to_csv(output_file, index=False, encoding='utf-8')
+                output_file = write_stage(self.combined_df[cols_to_save], output_file, export_csv)
                 print(f"已保存简化版数据至 {output_file}")
             except Exception as e2:
                 print(f"保存简化版数据时也出错: {e2}")
@@ -288,14 +308,14 @@ class DataProcessor:
         except Exception as e:
             print(f"获取文件信息时出错: {e}")
 
-    def process_pipeline(self, output_file="processed_issues.csv"):
-        """执行完整的数据处理流水线"""
+    def process_pipeline(self, output_file=PROCESSED_FILE, export_csv=True, workers=None):
+        """执行完整的数据处理流水线，workers为读取输入文件的进程数，None时按文件大小决定"""
         # 打印每个输入文件的信息
         for file_path, _ in self.input_files:
             self.print_file_info(file_path)
 
         # 合并数据集
-        self.merge_datasets()
+        self.merge_datasets(workers)
 
         # 增强特征
         try:
@@ -304,7 +324,12 @@ class DataProcessor:
             print(f"增强特征时出错: {e}")
 
         # 保存处理后的数据
-        return self.save_processed_data(output_file)
+        return self.save_processed_data(output_file, export_csv)
+
+
+def read_source(processor, source):
+    """在工作进程中读取一个输入文件"""
+    return processor.read_source(*source)
 
 
 # 如果作为独立脚本运行
@@ -316,8 +341,9 @@ if __name__ == "__main__":
     processor.add_input_file("bug_issues.csv", "bug")
     processor.add_input_file("problem_issues.csv", "problem")
 
-    # 执行处理流水线
-    processed_file = processor.process_pipeline()
+    # 执行处理流水线，可以在命令行中指定读取输入文件的进程数
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    processed_file = processor.process_pipeline(workers=workers)
 
     if processed_file:
         print(f"数据预处理完成，结果保存在 {processed_file}")
@@ -1,6 +1,18 @@
-import pandas as pd
+import numpy as np
 import json
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.feature_bits import expand_feature_column
+from common.keyword_matcher import KeywordMatcher
+from common.parallel import imap_ordered, map_frame
+from common.scoring import text_column
+from common.stage_io import StageWriter, iter_stage, read_stage, stage_file, write_stage
+
+# 输入的预处理数据和输出的分类结果（Parquet，未安装pyarrow时为CSV）
+PROCESSED_FILE = stage_file("processed_issues")
+CLASSIFIED_FILE = stage_file("classified_issues")
 
 
 class IssueClassifier:
@@ -48,64 +60,113 @@ class IssueClassifier:
                            'access modifier']
         }
 
-    def classify_bug_related(self, title, source):
-        """判断issue是否与bug相关"""
+        # 判断"fix"含糊案例时使用的关键词
+        self.fix_non_bug_keywords = ['typo', 'comment', 'doc', 'test', 'format']
+        self.fix_bug_keywords = ['erc', 'token', 'transfer', 'access', 'ownable']
+
+        # 没有直接匹配到DASP关键词时，按上下文推断类别，按顺序取第一个匹配的
+        self.dasp_context_keywords = {
+            '算术问题': ['burn', 'mint', 'transfer', 'balance'],
+            '访问控制问题': ['owner', 'admin', 'role', 'access'],
+            '未知函数调用': ['proxy', 'delegate', 'upgrade'],
+            '拒绝服务': ['gas', 'memory', 'storage']
+        }
+
+        # 增强置信度时使用的关键词
+        self.contract_keywords = ['erc20', 'erc721', 'erc1155', 'safemath']
+        self.category_boost_keywords = {
+            '重入攻击': ['callback', 'external call'],
+            '算术问题': ['overflow', 'safemath', 'calculation'],
+            '访问控制问题': ['admin', 'owner', 'authorize']
+        }
+
+        # 所有关键词编译进一个KeywordMatcher，每个标题只扫描一遍就得到各组的匹配结果
+        self.matcher = KeywordMatcher(self.keyword_groups())
+
+    def keyword_groups(self):
+        """把各类关键词整理为{(类型, 组名): [关键词, ...]}"""
+        groups = {}
+        for category, keywords in self.non_bug_keywords.items():
+            groups[('non_bug', category)] = keywords
+        for level, keywords in self.bug_keywords.items():
+            groups[('bug', level)] = keywords
+        for category, keywords in self.dasp_keywords.items():
+            groups[('dasp', category)] = keywords
+        for category, keywords in self.dasp_context_keywords.items():
+            groups[('dasp_context', category)] = keywords
+        for category, keywords in self.category_boost_keywords.items():
+            groups[('boost', category)] = keywords
+        groups[('rule', 'fix')] = ['fix']
+        groups[('rule', 'fix_non_bug')] = self.fix_non_bug_keywords
+        groups[('rule', 'fix_bug')] = self.fix_bug_keywords
+        groups[('rule', 'security')] = ['security']
+        groups[('rule', 'doc')] = ['doc']
+        groups[('rule', 'doc_security')] = ['security', 'vulnerability', 'attack']
+        groups[('rule', 'bug_or_fix')] = ['bug', 'fix']
+        groups[('rule', 'contract')] = self.contract_keywords
+        return groups
+
+    def scan(self, title_lower):
+        """扫描一遍小写标题，返回{(类型, 组名): 出现的关键词列表}"""
+        return self.matcher.match(title_lower)
+
+    def classify_bug_related(self, title, source, found=None):
+        """判断issue是否与bug相关，found为标题的扫描结果，未给出时现扫描"""
         title_lower = title.lower()
 
         # 已知bug标记的直接判定为bug相关
         if source == 'bug':
             return True
 
+        if found is None:
+            found = self.scan(title_lower)
+
         # 检查非bug关键词
-        non_bug_match = False
-        for category, keywords in self.non_bug_keywords.items():
-            if any(keyword in title_lower for keyword in keywords):
-                non_bug_match = True
-                break
+        non_bug_match = any(('non_bug', category) in found for category in self.non_bug_keywords)
 
         # 检查bug关键词，同时考虑严重性
         bug_match = False
         severity = 'none'
-        for level, keywords in self.bug_keywords.items():
-            if any(keyword in title_lower for keyword in keywords):
+        for level in self.bug_keywords:
+            if ('bug', level) in found:
                 bug_match = True
                 severity = level
                 break
 
         # 特殊处理"fix"关键词的含糊案例
-        if 'fix' in title_lower and not bug_match and not non_bug_match:
-            if any(pattern in title_lower for pattern in ['typo', 'comment', 'doc', 'test', 'format']):
+        if ('rule', 'fix') in found and not bug_match and not non_bug_match:
+            if ('rule', 'fix_non_bug') in found:
                 return False
-            elif any(pattern in title_lower for pattern in ['erc', 'token', 'transfer', 'access', 'ownable']):
+            elif ('rule', 'fix_bug') in found:
                 return True
             else:
                 return True
 
         # 分析判断结果优先级
-        if bug_match and (severity in ['critical', 'high'] or 'security' in title_lower):
+        if bug_match and (severity in ['critical', 'high'] or ('rule', 'security') in found):
             return True
         elif bug_match and not non_bug_match:
             return True
         elif bug_match and non_bug_match:
-            if 'doc' in title_lower and not any(
-                    word in title_lower for word in ['security', 'vulnerability', 'attack']):
+            if ('rule', 'doc') in found and ('rule', 'doc_security') not in found:
                 return False
             else:
                 return True
         else:
             return False
 
-    def classify_dasp_category(self, title, is_bug_related):
-        """对bug相关的issue进行DASP分类"""
+    def classify_dasp_category(self, title, is_bug_related, found=None):
+        """对bug相关的issue进行DASP分类，found为标题的扫描结果，未给出时现扫描"""
         if not is_bug_related:
             return "非Bug相关", 0
 
-        title_lower = title.lower()
+        if found is None:
+            found = self.scan(title.lower())
 
         # 直接关键词匹配
         matches = {}
-        for category, keywords in self.dasp_keywords.items():
-            matches[category] = sum(1 for keyword in keywords if keyword in title_lower)
+        for category in self.dasp_keywords:
+            matches[category] = len(found.get(('dasp', category), []))
 
         # 找出匹配最多的类别
         if any(matches.values()):
@@ -113,99 +174,168 @@ class IssueClassifier:
             return best_category[0], best_category[1]
 
         # 基于上下文的智能匹配
-        if any(word in title_lower for word in ['burn', 'mint', 'transfer', 'balance']):
-            return "算术问题", 1
-        elif any(word in title_lower for word in ['owner', 'admin', 'role', 'access']):
-            return "访问控制问题", 1
-        elif any(word in title_lower for word in ['proxy', 'delegate', 'upgrade']):
-            return "未知函数调用", 1
-        elif any(word in title_lower for word in ['gas', 'memory', 'storage']):
-            return "拒绝服务", 1
+        for category in self.dasp_context_keywords:
+            if ('dasp_context', category) in found:
+                return category, 1
 
         # 如果没有匹配，标记为未分类
         return "未分类", 0
 
-    def enhance_confidence(self, row):
-        """增强分类置信度评估"""
+    def enhance_confidence(self, row, found=None):
+        """增强分类置信度评估，found为title_lower的扫描结果，未给出时现扫描"""
         category = row['dasp_category']
         confidence = row['confidence']
-        title = row['title_lower']
+        if found is None:
+            found = self.scan(row['title_lower'])
 
         # 检查是否有明确问题描述
-        if 'bug' in title or 'fix' in title:
+        if ('rule', 'bug_or_fix') in found:
             confidence += 0.5
 
         # 在标题中明确提到某个合约名称增加置信度
-        for contract in ['erc20', 'erc721', 'erc1155', 'safemath']:
-            if contract in title:
-                confidence += 0.5
-                break
+        if ('rule', 'contract') in found:
+            confidence += 0.5
 
         # 类别特定增强
-        if category == '重入攻击' and any(w in title for w in ['callback', 'external call']):
-            confidence += 1
-        elif category == '算术问题' and any(w in title for w in ['overflow', 'safemath', 'calculation']):
-            confidence += 1
-        elif category == '访问控制问题' and any(w in title for w in ['admin', 'owner', 'authorize']):
+        if ('boost', category) in found:
             confidence += 1
 
         return confidence
 
-    def classify_issues(self, df):
-        """对所有issues进行分类"""
-        # 添加分类列
-        df['is_bug_related'] = df.apply(lambda row: self.classify_bug_related(
-            row['title'], row.get('source', '')), axis=1)
-
-        # 只对bug相关的进行DASP分类
-        dasp_results = df.apply(
-            lambda row: self.classify_dasp_category(row['title'], row['is_bug_related']),
-            axis=1
-        )
-        df['dasp_category'] = [result[0] for result in dasp_results]
-        df['confidence'] = [result[1] for result in dasp_results]
-
-        # 增强置信度评估
-        df['confidence'] = df.apply(self.enhance_confidence, axis=1)
+    def classify_issues(self, df, workers=1):
+        """对所有issues进行分类
+
+        标题列只扫描一遍，得到每行各组关键词的命中个数，再用NumPy按与逐行方法相同的规则
+        推出是否bug相关、DASP类别和置信度。workers大于1时把df按行切片，由多个进程并行分类后按原顺序合并
+        """
+        if workers > 1:
+            classified = map_frame(classify_chunk, self, df, workers)
+            for column in ('is_bug_related', 'dasp_category', 'confidence'):
+                df[column] = classified[column].to_numpy()
+            return df
+
+        counts = self.matcher.group_counts(text_column(df, 'title'))
+        found = {group: count > 0 for group, count in counts.items()}
+        sources = df['source'].to_numpy() if 'source' in df.columns else np.full(len(df), '', dtype=object)
+
+        # 是否bug相关，规则与classify_bug_related相同
+        non_bug_match = np.logical_or.reduce([found[('non_bug', category)] for category in self.non_bug_keywords])
+        bug_match = np.logical_or.reduce([found[('bug', level)] for level in self.bug_keywords])
+        severe = found[('bug', 'critical')] | found[('bug', 'high')]
+        ambiguous_fix = found[('rule', 'fix')] & ~bug_match & ~non_bug_match
+        doc_only = found[('rule', 'doc')] & ~found[('rule', 'doc_security')]
+        is_bug_related = np.where(
+            ambiguous_fix,
+            ~found[('rule', 'fix_non_bug')],
+            bug_match & (severe | found[('rule', 'security')] | ~non_bug_match | ~doc_only)
+        ) | (sources == 'bug')
+
+        # DASP分类，规则与classify_dasp_category相同: 取匹配关键词最多的类别（并列时取靠前的），
+        # 没有直接匹配时按上下文关键词推断
+        categories = list(self.dasp_keywords)
+        dasp_counts = np.column_stack([counts[('dasp', category)] for category in categories])
+        best = dasp_counts.argmax(axis=1)
+        best_count = dasp_counts.max(axis=1)
+        dasp_category = np.array(categories, dtype=object)[best]
+        confidence = best_count.copy()
+        undecided = best_count == 0
+        dasp_category[undecided] = "未分类"
+        for category in reversed(list(self.dasp_context_keywords)):
+            context = undecided & found[('dasp_context', category)]
+            dasp_category[context] = category
+            confidence[context] = 1
+        dasp_category[~is_bug_related] = "非Bug相关"
+        confidence[~is_bug_related] = 0
+
+        # 增强置信度评估，规则与enhance_confidence相同，扫描的是title_lower列
+        lower_found = self.matcher.match_column(text_column(df, 'title_lower'))
+        half_points = lower_found[('rule', 'bug_or_fix')].astype(np.int64) + lower_found[('rule', 'contract')]
+        for category in self.category_boost_keywords:
+            confidence += (dasp_category == category) & lower_found[('boost', category)]
+
+        df['is_bug_related'] = is_bug_related
+        df['dasp_category'] = dasp_category
+        # 逐行计算时加过0.5的值是浮点数，整列因此为浮点型；都没有加过时保持整数
+        if half_points.any():
+            df['confidence'] = confidence + 0.5 * half_points
+        else:
+            df['confidence'] = confidence
 
         return df
 
-    def save_classification(self, df, output_file="classified_issues.csv"):
-        """保存分类结果"""
-        df.to_csv(output_file, index=False)
+    def save_classification(self, df, output_file=CLASSIFIED_FILE, export_csv=True):
+        """保存分类结果，export_csv为True时另外导出CSV（标题特征展开为has_xxx、op_xxx列）"""
+        output_file = write_stage(df, output_file, export_csv, expand_feature_column)
         print(f"分类结果已保存至 {output_file}")
         return output_file
 
-    def classify_pipeline(self, input_file, output_file="classified_issues.csv"):
-        """执行完整的分类流水线"""
+    def classify_chunks(self, chunks, workers=1):
+        """逐块分类，按输入顺序产出分类后的块
+
+        workers大于1时用多个进程并行分类，分类器在每个进程启动时传入一次；同时处理中的块不超过2*workers个，
+        读取进度不会远远领先于写出进度，内存占用与块大小成正比
+        """
+        return imap_ordered(classify_chunk, self, chunks, workers)
+
+    def classify_pipeline(self, input_file, output_file=CLASSIFIED_FILE, chunksize=None, workers=1, export_csv=True):
+        """执行完整的分类流水线
+
+        chunksize为None时整个文件一次读入；给出时按块流式读取、分类并追加写入输出文件，
+        内存占用只与块大小有关。workers大于1时多个进程并行分类，输出顺序与输入一致。
+        export_csv为True时另外导出CSV（标题特征展开为has_xxx、op_xxx列）
+        """
         if not os.path.exists(input_file):
             raise ValueError(f"输入文件 {input_file} 不存在")
 
-        # 读取输入数据
-        df = pd.read_csv(input_file)
+        if chunksize is None:
+            # 读取输入数据
+            df = read_stage(input_file)
+
+            # 执行分类
+            classified_df = self.classify_issues(df, workers)
+
+            # 保存结果
+            return self.save_classification(classified_df, output_file, export_csv)
+
+        chunks = iter_stage(input_file, chunksize)
+        total = 0
+        with StageWriter(output_file, export_csv, expand_feature_column) as writer:
+            for classified in self.classify_chunks(chunks, workers):
+                # 各块单独推断类型，置信度统一写成浮点数，避免不同块的格式不一致
+                classified['confidence'] = classified['confidence'].astype(float)
+                writer.write(classified)
+                total += len(classified)
+                print(f"已分类 {total} 个issue")
+            if total == 0:
+                # 输入没有数据行时仍然写出带表头的空结果
+                writer.write(self.classify_issues(read_stage(input_file)))
+        output_file = writer.file_path
+        print(f"分类结果已保存至 {output_file}")
+        return output_file
 
-        # 执行分类
-        classified_df = self.classify_issues(df)
 
-        # 保存结果
-        return self.save_classification(classified_df, output_file)
+def classify_chunk(classifier, chunk):
+    """在工作进程中分类一块数据"""
+    return classifier.classify_issues(chunk)
 
 
 # 如果作为独立脚本运行
 if __name__ == "__main__":
-    import sys
-
     if len(sys.argv) > 1:
         input_file = sys.argv[1]
     else:
-        input_file = "processed_issues.csv"
+        input_file = PROCESSED_FILE
 
     if len(sys.argv) > 2:
         output_file = sys.argv[2]
     else:
-        output_file = "classified_issues.csv"
+        output_file = CLASSIFIED_FILE
+
+    # 第3、4个参数为流式读取的块大小和并行进程数，块大小不指定或为0时整个文件一次读入
+    chunksize = int(sys.argv[3]) or None if len(sys.argv) > 3 else None
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 1
 
     classifier = IssueClassifier()
-    result_file = classifier.classify_pipeline(input_file, output_file)
+    result_file = classifier.classify_pipeline(input_file, output_file, chunksize=chunksize, workers=workers)
 
     print(f"分类完成，结果保存在 {result_file}")
\ No newline at end of file
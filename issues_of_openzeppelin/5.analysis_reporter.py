@@ -8,8 +8,18 @@ import matplotlib as mpl
 from matplotlib.font_manager import FontProperties
 import time
 import warnings
+import sys
 import numpy as np
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.feature_bits import FEATURE_COLUMN, TITLE_FEATURES, expand_feature_column
+from common.keyword_matcher import KeywordMatcher
+from common.scoring import text_column
+from common.stage_io import read_stage, stage_file
+
+# 分类阶段输出的数据文件（Parquet，未安装pyarrow时为CSV）
+CLASSIFIED_FILE = stage_file("classified_issues")
+
 # 忽略matplotlib的字体警告
 warnings.filterwarnings("ignore", category=UserWarning, module="matplotlib")
 
@@ -18,7 +28,7 @@ class AnalysisReporter:
     def __init__(self, classified_file=None):
         self.df = None
         if classified_file and os.path.exists(classified_file):
-            self.df = pd.read_csv(classified_file)
+            self.df = read_stage(classified_file)
 
         # 设置中文字体支持
         self.set_chinese_font()
@@ -65,12 +75,12 @@ class AnalysisReporter:
                 print(f"设置中文字体失败: {e}")
                 self.chinese_font = None
 
-    def load_data(self, file_path):
-        """加载分类后的数据"""
+    def load_data(self, file_path, columns=None):
+        """加载分类后的数据（Parquet或CSV），columns给出时只读取这些列"""
         if not os.path.exists(file_path):
             raise ValueError(f"文件 {file_path} 不存在")
 
-        self.df = pd.read_csv(file_path)
+        self.df = read_stage(file_path, columns)
         return self.df
 
     def filter_text_issues(self):
@@ -90,27 +100,29 @@ class AnalysisReporter:
             'update readme', 'update docs', 'fix typo', 'improve docs'
         ]
 
+        # 文本类关键词和代码块标记编译进一个KeywordMatcher，每列只在其中不同的词上匹配一遍
+        text_matcher = KeywordMatcher({'text': text_keywords, 'code': ['```']})
+
         # 创建mask来识别文本类issues
         text_masks = []
 
         # 标题中的关键词
-        title_mask = self.df['title_lower'].str.contains('|'.join(text_keywords), na=False, regex=True)
+        title_hits = text_matcher.match_column(text_column(self.df, 'title_lower'))
+        title_mask = pd.Series(title_hits['text'], index=self.df.index)
         text_masks.append(title_mask)
 
         # 如果有正文列
         if 'body' in self.df.columns:
             # 检查是否没有代码块同时包含文档关键词
-            body_lower = self.df['body'].str.lower()
-            body_mask = (
-                    ~body_lower.str.contains('```', na=False, regex=False) &
-                    body_lower.str.contains('|'.join(text_keywords), na=False, regex=True)
-            )
+            body_hits = text_matcher.match_column(text_column(self.df, 'body'))
+            body_mask = pd.Series(~body_hits['code'] & body_hits['text'], index=self.df.index)
             text_masks.append(body_mask)
 
         # 如果有标签列
         if 'labels' in self.df.columns:
-            labels_lower = self.df['labels'].str.lower()
-            labels_mask = labels_lower.str.contains('documentation|docs|typo|enhancement', na=False, regex=True)
+            label_matcher = KeywordMatcher({'text': ['documentation', 'docs', 'typo', 'enhancement']})
+            labels_mask = pd.Series(label_matcher.match_column(text_column(self.df, 'labels'))['text'],
+                                    index=self.df.index)
             text_masks.append(labels_mask)
 
         # 合并所有mask
@@ -133,9 +145,9 @@ class AnalysisReporter:
 
         print(f"已将 {filtered_count} 个文本类issues从bug相关中过滤出去")
 
-        # 保存过滤后的csv用于查看
+        # 保存过滤后的csv用于查看，标题特征展开为原来的has_xxx、op_xxx列
         try:
-            self.df.to_csv("filtered_issues.csv", index=False, encoding='utf-8')
+            expand_feature_column(self.df).to_csv("filtered_issues.csv", index=False, encoding='utf-8')
             print("过滤后的数据已保存至 filtered_issues.csv")
         except Exception as e:
             print(f"保存过滤后数据时出错: {e}")
@@ -150,7 +162,8 @@ class AnalysisReporter:
         # 提取置信度低的bug相关issue
         low_conf = self.df[(self.df['is_bug_related']) & (self.df['confidence'] <= threshold)].copy()
 
-        # 添加人工审核列
+        # 标题特征展开为布尔列，添加人工审核列
+        low_conf = expand_feature_column(low_conf)
         low_conf.loc[:, 'manual_review'] = ''
         low_conf.loc[:, 'correct_category'] = ''
         low_conf.loc[:, 'notes'] = ''
@@ -203,8 +216,10 @@ class AnalysisReporter:
 
         for contract in contract_types:
             try:
-                # 首先尝试使用特征列
-                if f'has_{contract}' in self.df.columns:
+                # 首先尝试使用特征位掩码或特征列
+                if FEATURE_COLUMN in self.df.columns:
+                    contract_issues = self.df[TITLE_FEATURES.has(self.df[FEATURE_COLUMN], f'has_{contract}')]
+                elif f'has_{contract}' in self.df.columns:
                     contract_issues = self.df[self.df[f'has_{contract}']]
                 else:
                     # 回退到标题搜索
@@ -495,7 +510,7 @@ class AnalysisReporter:
                 self.df[(self.df['is_bug_related']) & (self.df['confidence'] <= 1.5)].shape[0])
 
         # 输出高置信度的分类结果
-        high_conf_bugs = self.df[(self.df['is_bug_related']) & (self.df['confidence'] > 2.0)]
+        high_conf_bugs = expand_feature_column(self.df[(self.df['is_bug_related']) & (self.df['confidence'] > 2.0)])
         try:
             high_conf_bugs.to_csv("high_confidence_bugs.csv", index=False, encoding='utf-8')
             print(f"已将 {len(high_conf_bugs)} 个高置信度的bug相关issues保存至 high_confidence_bugs.csv")
@@ -503,9 +518,9 @@ class AnalysisReporter:
             print(f"保存高置信度bug数据时出错: {e}")
 
         # 输出中等置信度的分类结果
-        med_conf_bugs = self.df[(self.df['is_bug_related']) &
-                                (self.df['confidence'] > 1.5) &
-                                (self.df['confidence'] <= 2.0)]
+        med_conf_bugs = expand_feature_column(self.df[(self.df['is_bug_related']) &
+                                                      (self.df['confidence'] > 1.5) &
+                                                      (self.df['confidence'] <= 2.0)])
         try:
             med_conf_bugs.to_csv("medium_confidence_bugs.csv", index=False, encoding='utf-8')
             print(f"已将 {len(med_conf_bugs)} 个中等置信度的bug相关issues保存至 medium_confidence_bugs.csv")
@@ -514,7 +529,7 @@ class AnalysisReporter:
 
         return report
 
-    def analysis_pipeline(self, input_file="classified_issues.csv", report_file="classification_report.json"):
+    def analysis_pipeline(self, input_file=CLASSIFIED_FILE, report_file="classification_report.json"):
         """执行完整的分析流水线"""
         # 加载数据
         self.load_data(input_file)
@@ -554,15 +569,13 @@ class AnalysisReporter:
 
 # 如果作为独立脚本运行
 if __name__ == "__main__":
-    import sys
-
     # 忽略matplotlib的字体警告
     warnings.filterwarnings("ignore", category=UserWarning, module="matplotlib")
 
     if len(sys.argv) > 1:
         input_file = sys.argv[1]
     else:
-        input_file = "classified_issues.csv"
+        input_file = CLASSIFIED_FILE
 
     reporter = AnalysisReporter()
     reporter.analysis_pipeline(input_file)
@@ -0,0 +1,292 @@
+"""向量化评分与原来逐行评分的一致性检查
+
+baseline_confidence按各脚本原来的calculate_bug_fix_confidence逐行计算（关键词表和分数照抄原来的脚本，
+关键词子串匹配、找到一个即停、issue引用的正则忽略大小写），对仓库中保存的各数据集和随机生成的行，
+ScoringEngine的结果都应与之相同
+"""
+import os
+import random
+import re
+import sys
+import time
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from common.bug_fix_scoring import (DATASETS, DATASET_SHEET, PROFILES, WEIGHTS,  # noqa: E402
+                                    calculate_bug_fix_confidence, get_engine, score_frames, score_shard,
+                                    score_with_engine)
+from common.parallel import map_frame  # noqa: E402
+from common.score_cache import LOOKUP_BATCH, ScoreCache  # noqa: E402
+
+
+# 各脚本原来calculate_bug_fix_confidence中写死的关键词表，照原样抄录，与common.bug_fix_scoring中的配置无关，
+# 配置被改动时这里的结果不会跟着变
+ORIGINAL_TITLE_HIGH = ['fix', 'bug', 'issue', 'error', 'crash', 'incorrect',
+                       'wrong', 'vulnerability', 'exploit', 'security', 'problem',
+                       'resolve', 'patch', 'overflow', 'underflow']
+ORIGINAL_TITLE_MEDIUM = ['update', 'improve', 'adjust', 'address', 'correct',
+                         'handle', 'prevent', 'validate', 'edge case']
+ORIGINAL_BODY_HIGH = ['fixes #', 'closes #', 'resolves #', 'bugfix', 'fixed a bug',
+                      'edge case', 'race condition', 'overflow', 'underflow',
+                      'security vulnerability', 'incorrect calculation',
+                      'off-by-one', 'rounding error']
+ORIGINAL_NEGATIVE = ['feature', 'enhancement', 'add', 'implement', 'introduce',
+                     'support', 'documentation', 'docs', 'refactor', 'cleanup',
+                     'style', 'formatting', 'typo', 'test']
+ORIGINAL_CONTRACT = ['contract', 'solidity', 'function', 'variable', 'struct',
+                     'library', 'interface', 'inheritance', 'gas', 'optimiz']
+ORIGINAL_ISSUE_PATTERNS = [
+    r'(?:fix|fixes|fixed|close|closes|closed|resolve|resolves|resolved)\s+#(\d+)',
+    r'(?:fix|fixes|fixed|close|closes|closed|resolve|resolves|resolved)\s+\w+/\w+#(\d+)'
+]
+
+# 协议 -> {组名: 关键词表}，label_bonus为协议特有的标签加分[(关键词, 分数), ...]
+ORIGINAL_RULES = {
+    'uniswap_v3': {
+        'label_bonus': [],
+        'label_high': ['bug', 'fix', 'security', 'vulnerability'],
+        'label_medium': ['enhancement', 'improvement'],
+        'label_low': ['documentation', 'refactor', 'style', 'test'],
+        'title_high': ORIGINAL_TITLE_HIGH,
+        'title_medium': ORIGINAL_TITLE_MEDIUM,
+        'body_high': ORIGINAL_BODY_HIGH,
+        'negative': ORIGINAL_NEGATIVE,
+        'protocol': ['v3', 'v3-core', 'pool', 'tick', 'sqrt price', 'fee tier',
+                     'concentrated liquidity', 'range', 'position', 'oracle',
+                     'swap', 'mint', 'burn', 'flash'],
+        'contract': ORIGINAL_CONTRACT,
+    },
+    'aave': {
+        'label_bonus': [],
+        'label_high': ['bug', 'fix', 'security', 'vulnerability'],
+        'label_medium': ['enhancement', 'improvement'],
+        'label_low': ['documentation', 'refactor', 'style', 'test'],
+        'title_high': ORIGINAL_TITLE_HIGH,
+        'title_medium': ORIGINAL_TITLE_MEDIUM,
+        'body_high': ORIGINAL_BODY_HIGH,
+        'negative': ORIGINAL_NEGATIVE,
+        'protocol': ['aave', 'lending', 'pool', 'borrow', 'deposit', 'flash loan',
+                     'liquidation', 'collateral', 'interest rate', 'reserve',
+                     'oracle', 'governance', 'staking', 'lendingpool'],
+        'contract': ORIGINAL_CONTRACT,
+    },
+    'synthetix': {
+        'label_bonus': [(['sip'], 5), (['bug', 'bugfix', 'fix'], 25)],
+        'label_high': ['bug', 'fix', 'security', 'vulnerability', 'critical'],
+        'label_medium': ['enhancement', 'improvement', 'contracts'],
+        'label_low': ['documentation', 'refactor', 'style', 'test', 'chore'],
+        'title_high': ORIGINAL_TITLE_HIGH + ['revert'],
+        'title_medium': ORIGINAL_TITLE_MEDIUM,
+        'body_high': ORIGINAL_BODY_HIGH + ['revert'],
+        'negative': ORIGINAL_NEGATIVE,
+        'protocol': ['synthetix', 'synth', 'snx', 'staking', 'collateral',
+                     'oracle', 'exchange', 'liquidation', 'debt', 'fee',
+                     'reward', 'eth collateral', 'l2', 'optimism', 'chainlink',
+                     'proxy', 'sip', 'keeper', 'havven', 'susd', 'seth'],
+        'contract': ORIGINAL_CONTRACT,
+    },
+    'openzeppelin': {
+        'label_bonus': [(['security'], 30), (['bug', 'bugfix', 'fix'], 25)],
+        'label_high': ['bug', 'fix', 'security', 'vulnerability', 'critical', 'bugfix'],
+        'label_medium': ['enhancement', 'improvement'],
+        'label_low': ['documentation', 'refactor', 'style', 'test', 'chore'],
+        'title_high': ORIGINAL_TITLE_HIGH + ['revert', 'unsafe'],
+        'title_medium': ORIGINAL_TITLE_MEDIUM,
+        'body_high': ORIGINAL_BODY_HIGH + ['reentrancy', 'double spend'],
+        'negative': ORIGINAL_NEGATIVE,
+        'protocol': ['openzeppelin', 'erc20', 'erc721', 'erc1155', 'token',
+                     'access control', 'ownable', 'safemath', 'cryptography',
+                     'security', 'upgradeable', 'proxy', 'governance', 'access',
+                     'pausable', 'reentrancy', 'eip', 'modifier', 'abstract'],
+        'contract': ORIGINAL_CONTRACT,
+    },
+    'uniswap_v2': {
+        # v2不看标签，也没有协议和合约相关的加分
+        'label_bonus': [],
+        'label_high': [],
+        'label_medium': [],
+        'label_low': [],
+        'title_high': ['fix', 'bug', 'issue', 'error', 'crash', 'incorrect',
+                       'wrong', 'vulnerability', 'exploit', 'security', 'problem',
+                       'resolve', 'patch'],
+        'title_medium': ['update', 'improve', 'adjust', 'address', 'correct',
+                         'handle', 'prevent', 'validate'],
+        'body_high': ['fixes #', 'closes #', 'resolves #', 'bugfix', 'fixed a bug',
+                      'edge case', 'race condition', 'overflow', 'underflow',
+                      'security vulnerability', 'incorrect calculation'],
+        'negative': ['feature', 'enhancement', 'add', 'implement', 'introduce',
+                     'support', 'documentation', 'docs', 'refactor', 'cleanup',
+                     'style', 'formatting', 'typo'],
+        'protocol': [],
+        'contract': [],
+    },
+}
+
+
+def baseline_confidence(row, profile):
+    """原来逐行计算的置信度，关键词表和分数照抄原来的脚本"""
+    def text(column):
+        value = row.get(column, '')
+        return str(value).lower() if pd.notna(value) else ''
+
+    def found(keywords, *texts):
+        return any(keyword in value for keyword in keywords for value in texts)
+
+    title, body, labels = text('title'), text('body'), text('labels')
+    rules = ORIGINAL_RULES[profile]
+    confidence = 0
+
+    for keywords, weight in rules['label_bonus']:
+        if found(keywords, labels):
+            confidence += weight
+    for group, weight, texts in [('label_high', 25, [labels]), ('label_medium', 10, [labels]),
+                                 ('label_low', -15, [labels]), ('title_high', 20, [title]),
+                                 ('title_medium', 10, [title]), ('body_high', 15, [body]),
+                                 ('negative', -15, [title]), ('protocol', 2, [title, body]),
+                                 ('contract', 2, [title, body])]:
+        if found(rules[group], *texts):
+            confidence += weight
+    if any(re.findall(pattern, body, re.IGNORECASE) for pattern in ORIGINAL_ISSUE_PATTERNS):
+        confidence += 25
+
+    if pd.notna(row.get('additions', 0)) and pd.notna(row.get('deletions', 0)):
+        changes = row.get('additions', 0) + row.get('deletions', 0)
+        if changes < 10:
+            confidence += 10
+        elif changes > 100:
+            confidence -= 10
+    if pd.notna(row.get('changed_files', 0)):
+        changed_files = row.get('changed_files', 0)
+        if changed_files == 1:
+            confidence += 5
+        elif changed_files > 5:
+            confidence -= 5
+    return max(0, min(confidence, 100))
+
+
+def random_frame(rows, seed=0):
+    """由各配置的关键词、普通单词和容易出错的字符随机拼成的PR表"""
+    rng = random.Random(seed)
+    words = sorted({keyword for rules in ORIGINAL_RULES.values() for group, keywords in rules.items()
+                    if group != 'label_bonus' for keyword in keywords})
+    words += ['Fixes #12', 'CLOSES #7', 'cloſes #5', 'reſolve #2', 'resolved owner/repo#3', 'FİX', 'İssue',
+              'Kelvin', 'ß', '中文', 'the', 'a', 'and', 'contract', '\n', '#', '  ']
+
+    def sentence():
+        return ' '.join(rng.choice(words) for _ in range(rng.randint(0, 8)))
+
+    def maybe(value):
+        return value if rng.random() > 0.1 else np.nan
+
+    return pd.DataFrame({
+        'title': [maybe(sentence()) for _ in range(rows)],
+        'body': [maybe(sentence()) for _ in range(rows)],
+        'labels': [maybe(str([rng.choice(words) for _ in range(rng.randint(0, 2))])) for _ in range(rows)],
+        'additions': [maybe(float(rng.randint(0, 200))) for _ in range(rows)],
+        'deletions': [maybe(float(rng.randint(0, 50))) for _ in range(rows)],
+        'changed_files': [maybe(float(rng.randint(0, 8))) for _ in range(rows)],
+    })
+
+
+@pytest.mark.parametrize('profile', list(PROFILES))
+def test_matches_rowwise_scorer(profile):
+    df = random_frame(2000, seed=len(profile))
+    expected = [baseline_confidence(row, profile) for row in df.to_dict('records')]
+    assert calculate_bug_fix_confidence(df, profile).tolist() == expected
+
+
+def test_faster_than_rowwise_apply():
+    """与原来各脚本用DataFrame.apply逐行评分相比至少快10倍"""
+    df = random_frame(30000)
+    start = time.perf_counter()
+    expected = df.apply(baseline_confidence, axis=1, profile='openzeppelin')
+    rowwise = time.perf_counter() - start
+
+    vectorized = []
+    for _ in range(3):
+        start = time.perf_counter()
+        confidence = calculate_bug_fix_confidence(df, 'openzeppelin')
+        vectorized.append(time.perf_counter() - start)
+    assert confidence.tolist() == expected.tolist()
+    assert rowwise / min(vectorized) >= 10, f"逐行 {rowwise:.2f}s，向量化 {min(vectorized):.2f}s"
+
+
+def test_sharded_scoring_matches_single_process():
+    """按行切片、多个进程并行评分的结果与单进程评分完全相同，行的顺序和索引不变"""
+    frames = {'synthetix': random_frame(1001, seed=3), 'openzeppelin': random_frame(500, seed=4)}
+    # 打乱后的索引，分片按位置切分，拼接后的索引仍应与输入一致
+    for df in frames.values():
+        df.index = np.random.default_rng(0).permutation(len(df)) * 3
+    expected = score_with_engine(frames)
+    sharded = score_with_engine(frames, workers=3)
+    for name, df in frames.items():
+        pd.testing.assert_series_equal(sharded[name], expected[name])
+        assert sharded[name].index.equals(df.index)
+        # 分片比进程多时，结果仍按分片的原始顺序拼接
+        small_shards = map_frame(partial(score_shard, profile=name), get_engine(), df, workers=2, shard_rows=97)
+        pd.testing.assert_series_equal(small_shards, expected[name])
+
+
+def test_issue_reference_is_case_insensitive():
+    # ſ（U+017F）转小写后不变，只有忽略大小写匹配时才与s相同
+    df = pd.DataFrame({'title': ['x'] * 3, 'body': ['cloſes #5', 'reſolve #2', 'see #5'], 'labels': [''] * 3})
+    confidence = calculate_bug_fix_confidence(df, 'uniswap_v2').tolist()
+    assert confidence[0] == confidence[1] == confidence[2] + WEIGHTS['issue_reference']
+
+
+def read_dataset(profile):
+    return pd.read_excel(os.path.join(ROOT, DATASETS[profile]), sheet_name=DATASET_SHEET)
+
+
+# 仓库中保存了结果的数据集（openzeppelin的结果没有提交）
+SAVED_DATASETS = [profile for profile, path in DATASETS.items() if os.path.exists(os.path.join(ROOT, path))]
+
+
+@pytest.mark.parametrize('profile', SAVED_DATASETS)
+def test_matches_saved_datasets(profile):
+    df = read_dataset(profile)
+    confidence = calculate_bug_fix_confidence(df, profile)
+    assert confidence.tolist() == df['bug_fix_confidence'].tolist()
+
+
+@pytest.mark.parametrize('profile', list(PROFILES))
+def test_matches_rowwise_scorer_on_saved_rows(profile):
+    """用保存的各数据集中真实的PR按每个协议的配置评分，包括没有保存结果的openzeppelin"""
+    if not SAVED_DATASETS:
+        pytest.skip("仓库中没有保存的数据集")
+    df = pd.concat([read_dataset(name) for name in SAVED_DATASETS], ignore_index=True)
+    expected = [baseline_confidence(row, profile) for row in df.to_dict('records')]
+    assert calculate_bug_fix_confidence(df, profile).tolist() == expected
+
+
+def test_score_cache_returns_same_scores(tmp_path):
+    frames = {'synthetix': random_frame(300, seed=1), 'openzeppelin': random_frame(200, seed=2)}
+    cache_db = str(tmp_path / 'scores.db')
+    with ScoreCache(cache_db) as cache:
+        cache.store('stale', [b'x'], [1])
+    first = score_frames(frames, cache_db=cache_db)
+    second = score_frames(frames, cache_db=cache_db)
+    with ScoreCache(cache_db) as cache:
+        assert cache.count() == sum(len(df) for df in frames.values())
+    for name, df in frames.items():
+        expected = [baseline_confidence(row, name) for row in df.to_dict('records')]
+        assert first[name].tolist() == expected
+        assert second[name].tolist() == expected
+
+
+def test_score_cache_lookup_in_batches_and_prune(tmp_path):
+    hashes = [bytes([i % 256, i // 256]) for i in range(LOOKUP_BATCH * 2 + 7)]
+    with ScoreCache(str(tmp_path / 'scores.db')) as cache:
+        cache.store('old', hashes[:10], [1] * 10)
+        cache.store('new', hashes[::2], range(0, len(hashes), 2))
+        confidence = cache.lookup('new', hashes + [b'missing'])
+        expected = [float(i) if i % 2 == 0 else np.nan for i in range(len(hashes))] + [np.nan]
+        np.testing.assert_array_equal(confidence, expected)
+
+        assert cache.prune(['new']) == 10
+        assert np.isnan(cache.lookup('old', hashes[:10])).all()
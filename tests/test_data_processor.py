@@ -0,0 +1,50 @@
+"""多进程读取输入文件与顺序读取的一致性检查"""
+import importlib.util
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ISSUES_DIR = os.path.join(ROOT, 'issues_of_openzeppelin')
+sys.path.insert(0, ROOT)
+
+
+def load_processor_module():
+    """脚本文件名以数字开头，不能直接import；注册到sys.modules后工作进程才能按名称找到其中的函数"""
+    spec = importlib.util.spec_from_file_location('data_processor', os.path.join(ISSUES_DIR, '3.data_processor.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+data_processor = load_processor_module()
+
+
+@pytest.fixture
+def input_files(tmp_path, monkeypatch):
+    """格式各不相同、issue编号互相重叠的几个输入文件"""
+    monkeypatch.chdir(tmp_path)
+    pd.DataFrame({'number': [5, 4, 3], 'title': ['Fix ERC20 transfer', 'Bug in mint', '修复 proxy']}).to_csv(
+        'fix.csv', index=False)
+    pd.DataFrame({'number': [4, 2, 2], 'title': ['Duplicate', 'Bug; with semicolon', 'again']}).to_csv(
+        'bug.csv', index=False, sep=';', encoding='utf-8-sig')
+    pd.DataFrame({'id': [7, 1], 'summary': ['No number column', 'Ownable problem']}).to_excel(
+        'problem.xlsx', index=False)
+    return [('fix.csv', 'fix'), ('bug.csv', 'bug'), ('missing.csv', 'missing'), ('problem.xlsx', 'problem')]
+
+
+def merged(input_files, workers):
+    processor = data_processor.DataProcessor()
+    for file_path, label in input_files:
+        processor.add_input_file(file_path, label)
+    return processor.merge_datasets(workers).reset_index(drop=True)
+
+
+def test_parallel_read_matches_sequential(input_files):
+    sequential = merged(input_files, workers=1)
+    assert sequential['number'].tolist() == [7, 5, 4, 3, 2, 1]
+    assert sequential['source'].tolist() == ['problem', 'fix', 'fix', 'fix', 'bug', 'problem']
+    pd.testing.assert_frame_equal(merged(input_files, workers=3), sequential)
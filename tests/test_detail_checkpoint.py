@@ -0,0 +1,93 @@
+"""PR详情检查点的检查: 中途崩溃后只请求剩余的PR，全部获取成功后清空检查点"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from common.detail_checkpoint import DetailCheckpoint  # noqa: E402
+from common.fake_github import FakeGitHubServer  # noqa: E402
+from common.github_client import GitHubClient, fetch_pr_details  # noqa: E402
+from test_github_graphql import OWNER, REPO, synthetic_prs  # noqa: E402
+
+DETAIL_FIELDS = ['body', 'additions', 'deletions', 'changed_files']
+BATCH_SIZE = 10
+PR_COUNT = 50
+
+
+class Crash(Exception):
+    """模拟获取详情的过程中进程被中断"""
+
+
+@pytest.fixture
+def server():
+    server = FakeGitHubServer()
+    server.add_pulls(OWNER, REPO, synthetic_prs(PR_COUNT))
+    server.start()
+    yield server
+    server.stop()
+
+
+def fetch_details(server, checkpoint_file, crash_after=None):
+    """与各分析脚本获取PR详情的流程相同，返回(从检查点恢复的详情, 本次请求的详情)"""
+    checkpoint = DetailCheckpoint(checkpoint_file, DETAIL_FIELDS, batch_size=BATCH_SIZE)
+    completed = checkpoint.load()
+    pr_urls = [(number, f'{server.base_url}/repos/{OWNER}/{REPO}/pulls/{number}')
+               for number in range(1, PR_COUNT + 1) if number not in completed]
+    fetched = {}
+    failed = 0
+    with GitHubClient(max_retries=3, retry_delay=0.01, max_rate=1000, base_url=server.base_url) as client:
+        for done, (pr_number, pr_detail) in enumerate(fetch_pr_details(client, pr_urls), start=1):
+            if pr_detail is None:
+                failed += 1
+            else:
+                fetched[pr_number] = pr_detail
+                checkpoint.add(pr_number, pr_detail)
+            if done == crash_after:
+                raise Crash()
+            if done % BATCH_SIZE == 0 or done == len(pr_urls):
+                checkpoint.flush()
+    if failed == 0:
+        checkpoint.reset()
+    return completed, fetched
+
+
+def test_resume_after_crash_mid_batch(tmp_path, server):
+    checkpoint_file = str(tmp_path / 'pr_details_checkpoint.jsonl')
+    # 第3批攒到一半时崩溃，前两批已经写入检查点
+    with pytest.raises(Crash):
+        fetch_details(server, checkpoint_file, crash_after=2 * BATCH_SIZE + 5)
+    assert os.path.exists(checkpoint_file)
+    # 崩溃时正在追加的一批只写了一半
+    checkpoint = DetailCheckpoint(checkpoint_file, DETAIL_FIELDS)
+    data = checkpoint.log.encode(3, [{'number': 0, 'body': 'x' * 100}])
+    with open(checkpoint_file, 'ab') as f:
+        f.write(data[:len(data) // 2])
+
+    requests = server.stats[200]
+    completed, fetched = fetch_details(server, checkpoint_file)
+    assert len(completed) == 2 * BATCH_SIZE
+    # 已经写入检查点的PR不再请求
+    assert not set(completed) & set(fetched)
+    assert set(completed) | set(fetched) == set(range(1, PR_COUNT + 1))
+    assert server.stats[200] - requests == PR_COUNT - 2 * BATCH_SIZE
+    prs = {pr['number']: pr for pr in synthetic_prs(PR_COUNT)}
+    for pr_number, detail in completed.items():
+        assert detail == {'number': pr_number, **{field: prs[pr_number][field] for field in DETAIL_FIELDS}}
+
+    # 全部获取成功后检查点已清空，下次运行重新获取全部详情
+    assert not os.path.exists(checkpoint_file)
+    completed, fetched = fetch_details(server, checkpoint_file)
+    assert completed == {}
+    assert len(fetched) == PR_COUNT
+
+
+def test_reset_discards_checkpoint(tmp_path):
+    checkpoint = DetailCheckpoint(str(tmp_path / 'checkpoint.jsonl'), DETAIL_FIELDS, batch_size=2)
+    for pr_number in (1, 2, 3):
+        checkpoint.add(pr_number, {'body': f'body {pr_number}', 'additions': pr_number})
+    assert checkpoint.batches == 1
+    assert checkpoint.reset() == {}
+    assert checkpoint.pending == []
+    assert checkpoint.load() == {}
@@ -0,0 +1,75 @@
+"""GraphQL后端与REST后端在替身服务器上的一致性检查"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from common.fake_github import FakeGitHubServer  # noqa: E402
+from common.github_client import GitHubClient, fetch_pr_details, fetch_pull_pages  # noqa: E402
+from common.github_graphql import LABELS_PER_PAGE, fetch_merged_pulls_graphql, fetch_updated_pulls_graphql  # noqa: E402
+
+OWNER, REPO = 'example', 'protocol'
+
+
+def synthetic_prs(count):
+    """每3个PR中有一个未合并，第7号PR的标签超过一页"""
+    prs = []
+    for number in range(1, count + 1):
+        labels = [{'name': f'label-{i}'} for i in range(LABELS_PER_PAGE * 2 + 5 if number == 7 else number % 3)]
+        prs.append({
+            'number': number,
+            'title': f'Fix issue {number}',
+            'html_url': f'https://github.com/{OWNER}/{REPO}/pull/{number}',
+            'state': 'closed',
+            'created_at': f'2024-01-01T00:{number // 60:02d}:{number % 60:02d}Z',
+            'updated_at': f'2024-02-01T00:{(count - number) // 60:02d}:{(count - number) % 60:02d}Z',
+            'merged_at': None if number % 3 == 0 else f'2024-01-02T00:00:{number % 60:02d}Z',
+            'body': f'body {number}',
+            'user': {'login': f'user{number % 5}'},
+            'labels': labels,
+            'additions': number,
+            'deletions': number % 7,
+            'changed_files': number % 4,
+        })
+    return prs
+
+
+@pytest.fixture
+def server():
+    server = FakeGitHubServer(error_rate=0.05, seed=3)
+    server.add_pulls(OWNER, REPO, synthetic_prs(230))
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_graphql_matches_rest(server):
+    with GitHubClient(max_retries=8, retry_delay=0.01, max_rate=1000, base_url=server.base_url) as client:
+        rest = [pr for _, prs in fetch_pull_pages(client, OWNER, REPO) for pr in prs if pr.get('merged_at')]
+        details = dict(fetch_pr_details(client, [(pr['number'], pr['url']) for pr in rest]))
+        graphql = [pr for _, prs in fetch_merged_pulls_graphql(client, OWNER, REPO) for pr in prs]
+
+    assert sorted(pr['number'] for pr in graphql) == sorted(pr['number'] for pr in rest)
+    by_number = {pr['number']: pr for pr in graphql}
+    for pr in rest:
+        detail = details[pr['number']]
+        converted = by_number[pr['number']]
+        assert converted['labels'] == [{'name': label['name']} for label in pr['labels']]
+        for field in ('title', 'html_url', 'created_at', 'updated_at', 'merged_at', 'body', 'additions',
+                      'deletions', 'changed_files', 'user'):
+            assert converted[field] == detail[field], field
+    assert len(by_number[7]['labels']) == LABELS_PER_PAGE * 2 + 5
+
+
+def test_graphql_incremental_sync_stops_at_since(server):
+    with GitHubClient(max_retries=8, retry_delay=0.01, max_rate=1000, base_url=server.base_url) as client:
+        pages = list(fetch_updated_pulls_graphql(client, OWNER, REPO, since='2024-02-01T00:01:00Z', per_page=20))
+
+    prs = [pr for _, prs in pages for pr in prs]
+    updated = [pr['updated_at'] for pr in prs]
+    assert updated == sorted(updated, reverse=True)
+    # 最后一页之前的页都不早于since，遇到早于since的PR所在页后停止翻页
+    assert all(pr['updated_at'] >= '2024-02-01T00:01:00Z' for _, prs in pages[:-1] for pr in prs)
+    assert len(pages) < 8
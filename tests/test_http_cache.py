@@ -0,0 +1,69 @@
+"""HTTP响应缓存的检查: /rate_limit不经过缓存，长期未使用和超出大小上限的条目被清理"""
+import os
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from common.fake_github import FakeGitHubServer  # noqa: E402
+from common.github_client import GitHubClient, fetch_pull_pages  # noqa: E402
+from common.http_cache import HttpCache  # noqa: E402
+from test_github_graphql import OWNER, REPO, synthetic_prs  # noqa: E402
+
+
+def remaining(client):
+    response = client.get(f'{client.base_url}/rate_limit')
+    assert response.status_code == 200
+    return response.json()['resources']['core']['remaining']
+
+
+def test_rate_limit_is_not_cached(tmp_path):
+    server = FakeGitHubServer()
+    server.add_pulls(OWNER, REPO, synthetic_prs(30))
+    server.start()
+    try:
+        cache = HttpCache(str(tmp_path / 'http_cache'))
+        with GitHubClient(max_retries=3, retry_delay=0.01, max_rate=1000, base_url=server.base_url,
+                          cache=cache) as client:
+            before = remaining(client)
+            pages = list(fetch_pull_pages(client, OWNER, REPO, per_page=10))
+            after = remaining(client)
+    finally:
+        server.stop()
+
+    assert before - after == len(pages) == 3
+    assert cache.lookup(f'{server.base_url}/rate_limit') is None
+    # 只缓存了3个列表页，每页一个元数据文件和一个响应体文件
+    assert len(os.listdir(cache.cache_dir)) == 2 * len(pages)
+
+
+def store_entry(cache, url, size, used):
+    """保存一个响应体为size字节的条目，并把最后使用时间设为used"""
+    request = httpx.Request('GET', url)
+    cache.store(url, None, httpx.Response(200, headers={'ETag': f'"{url}"'}, content=b'x' * size, request=request))
+    for path in cache._paths(cache.make_key(url)):
+        os.utime(path, (used, used))
+
+
+def test_prune_removes_expired_then_least_recently_used(tmp_path):
+    cache_dir = str(tmp_path / 'http_cache')
+    cache = HttpCache(cache_dir, max_age=None, max_bytes=None)
+    now = time.time()
+    store_entry(cache, 'https://api.github.com/expired', 100, now - 10 * 3600)
+    store_entry(cache, 'https://api.github.com/old', 1000, now - 3 * 3600)
+    store_entry(cache, 'https://api.github.com/recent', 1000, now - 2 * 3600)
+    store_entry(cache, 'https://api.github.com/newest', 1000, now - 1 * 3600)
+    # 查找会刷新最后使用时间
+    assert cache.lookup('https://api.github.com/old') is not None
+    with open(os.path.join(cache_dir, cache.make_key('https://api.github.com/crashed') + '.body.1.tmp'), 'wb') as f:
+        f.write(b'partial')
+    os.utime(f.name, (now - 10 * 3600, now - 10 * 3600))
+
+    # 超过5小时未使用的条目和写了一半的临时文件先删除，剩下的总大小超过2500字节时删除最久未使用的recent
+    cache = HttpCache(cache_dir, max_age=5 * 3600, max_bytes=2500)
+    kept = [name for name in ('expired', 'old', 'recent', 'newest')
+            if cache.lookup(f'https://api.github.com/{name}') is not None]
+    assert kept == ['old', 'newest']
+    assert len(os.listdir(cache_dir)) == 4
@@ -0,0 +1,121 @@
+"""按列分类与原来逐行分类的一致性检查
+
+baseline_scan用原来的"keyword in title_lower"逐个关键词判断各组是否出现，交给IssueClassifier的逐行方法
+得到原来的分类结果；classify_issues对仓库中保存的processed_issues.csv和随机生成的标题都应与之相同
+"""
+import filecmp
+import importlib.util
+import os
+import random
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ISSUES_DIR = os.path.join(ROOT, 'issues_of_openzeppelin')
+sys.path.insert(0, ROOT)
+from common.stage_io import csv_path, stage_file  # noqa: E402
+
+
+def load_classifier_module():
+    """脚本文件名以数字开头，不能直接import；注册到sys.modules后工作进程才能按名称找到其中的函数"""
+    spec = importlib.util.spec_from_file_location('issue_classifier', os.path.join(ISSUES_DIR, '4.issue_classifier.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+issue_classifier = load_classifier_module()
+
+
+def baseline_scan(classifier, title_lower):
+    """原来逐个关键词做子串判断的扫描结果，格式与IssueClassifier.scan相同"""
+    found = {}
+    for group, keywords in classifier.keyword_groups().items():
+        matched = [keyword for keyword in keywords if keyword in title_lower]
+        if matched:
+            found[group] = matched
+    return found
+
+
+def baseline_classify(classifier, df):
+    """按原来classify_issues的逐行流程分类，返回(是否bug相关, DASP类别, 置信度)列表"""
+    results = []
+    for row in df.to_dict('records'):
+        title = row['title'] if pd.notna(row['title']) else ''
+        title_lower = row['title_lower'] if pd.notna(row['title_lower']) else ''
+        is_bug = classifier.classify_bug_related(title, row['source'], found=baseline_scan(classifier, title.lower()))
+        category, confidence = classifier.classify_dasp_category(title, is_bug,
+                                                                 found=baseline_scan(classifier, title.lower()))
+        row = {'dasp_category': category, 'confidence': confidence, 'title_lower': title_lower}
+        confidence = classifier.enhance_confidence(row, found=baseline_scan(classifier, title_lower))
+        results.append((bool(is_bug), category, float(confidence)))
+    return results
+
+
+def random_titles(classifier, rows, seed=0):
+    """由分类器的关键词、普通单词和容易出错的字符随机拼成的issue表"""
+    rng = random.Random(seed)
+    words = sorted({keyword for keywords in classifier.keyword_groups().values() for keyword in keywords if keyword})
+    words += ['Fix', 'BUG', 'ERC20', 'Ownable', 'İssue', 'ß', '中文', 'the', 'a', 'contract', '#', '  ']
+
+    def title():
+        return ' '.join(rng.choice(words) for _ in range(rng.randint(0, 6)))
+
+    titles = [title() for _ in range(rows)]
+    return pd.DataFrame({
+        'number': range(rows),
+        'title': titles,
+        'source': [rng.choice(['bug', 'fix', 'problem', '']) for _ in range(rows)],
+        'title_lower': [value.lower() for value in titles],
+    })
+
+
+def classified_rows(df):
+    return list(zip(df['is_bug_related'].astype(bool), df['dasp_category'], df['confidence'].astype(float)))
+
+
+def test_matches_rowwise_classifier():
+    classifier = issue_classifier.IssueClassifier()
+    df = random_titles(classifier, 3000)
+    expected = baseline_classify(classifier, df)
+    assert classified_rows(classifier.classify_issues(df.copy())) == expected
+
+
+def test_matches_saved_classification():
+    processed = os.path.join(ISSUES_DIR, 'processed_issues.csv')
+    classified = os.path.join(ISSUES_DIR, 'classified_issues.csv')
+    if not (os.path.exists(processed) and os.path.exists(classified)):
+        pytest.skip("仓库中没有保存的分类结果")
+    df = pd.read_csv(processed)
+    expected = pd.read_csv(classified)
+    result = issue_classifier.IssueClassifier().classify_issues(df)
+    assert result['is_bug_related'].tolist() == expected['is_bug_related'].tolist()
+    assert result['dasp_category'].tolist() == expected['dasp_category'].tolist()
+    assert np.array_equal(result['confidence'].to_numpy(dtype=float), expected['confidence'].to_numpy(dtype=float))
+
+
+def test_saved_classification_csv_is_reproducible(tmp_path):
+    """保存分类结果时导出的CSV（没有pyarrow时就是阶段文件本身）与仓库中保存的相同，标题特征展开为布尔列"""
+    processed = os.path.join(ISSUES_DIR, 'processed_issues.csv')
+    classified = os.path.join(ISSUES_DIR, 'classified_issues.csv')
+    if not (os.path.exists(processed) and os.path.exists(classified)):
+        pytest.skip("仓库中没有保存的分类结果")
+    classifier = issue_classifier.IssueClassifier()
+    output_file = classifier.save_classification(classifier.classify_issues(pd.read_csv(processed)),
+                                                 str(tmp_path / stage_file('classified_issues')))
+    assert filecmp.cmp(csv_path(output_file), classified, shallow=False)
+
+
+def test_chunked_parallel_pipeline_matches_saved_classification(tmp_path):
+    """按小块流式读取、两个进程并行分类后追加写出的结果与仓库中保存的分类结果相同"""
+    processed = os.path.join(ISSUES_DIR, 'processed_issues.csv')
+    classified = os.path.join(ISSUES_DIR, 'classified_issues.csv')
+    if not (os.path.exists(processed) and os.path.exists(classified)):
+        pytest.skip("仓库中没有保存的分类结果")
+    output_file = issue_classifier.IssueClassifier().classify_pipeline(
+        processed, str(tmp_path / stage_file('classified_issues')), chunksize=37, workers=2)
+    assert filecmp.cmp(csv_path(output_file), classified, shallow=False)
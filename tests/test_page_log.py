@@ -0,0 +1,84 @@
+"""抓取日志在崩溃后恢复的检查: 截掉写了一半的最后一页，从之后的页继续抓取"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from common.fake_github import FakeGitHubServer  # noqa: E402
+from common.github_client import GitHubClient, fetch_pull_pages  # noqa: E402
+from common.page_log import ZSTD_AVAILABLE, PageLog  # noqa: E402
+from test_github_graphql import OWNER, REPO, synthetic_prs  # noqa: E402
+
+LOG_NAMES = ['pages.jsonl', pytest.param('pages.jsonl.zst', marks=pytest.mark.skipif(
+    not ZSTD_AVAILABLE, reason="没有安装zstandard"))]
+
+
+def write_pages(page_log, pages, truncated=None):
+    """逐页写入日志，truncated为(页码, 记录)时再追加这一页的前一半，模拟写到一半时崩溃"""
+    for page, records in pages:
+        page_log.append_page(page, records)
+    if truncated is not None:
+        data = page_log.encode(*truncated)
+        with open(page_log.path, 'ab') as f:
+            f.write(data[:len(data) // 2])
+
+
+@pytest.mark.parametrize('name', LOG_NAMES)
+def test_recover_truncates_partial_last_page(tmp_path, name):
+    page_log = PageLog(str(tmp_path / name))
+    pages = [(page, [{'number': page * 10 + i, 'title': f'第{page}页 #{i}'} for i in range(3)]) for page in (1, 2, 3)]
+    write_pages(page_log, pages, truncated=(4, [{'number': 40, 'title': 'x' * 200}]))
+
+    # 读取时在写了一半的内容处停止
+    assert [page for page, _ in page_log.iter_pages()] == [1, 2, 3]
+    assert page_log.corrupted
+
+    assert page_log.recover() == 3
+    assert not page_log.corrupted
+    with open(page_log.path, 'rb') as f:
+        assert f.read() == b''.join(page_log.encode(page, records) for page, records in pages)
+    assert list(page_log.iter_records()) == [record for _, records in pages for record in records]
+
+    # 恢复后可以继续追加
+    page_log.append_page(4, [{'number': 40}])
+    assert [page for page, _ in page_log.iter_pages()] == [1, 2, 3, 4]
+    assert not page_log.corrupted
+
+
+@pytest.mark.parametrize('name', LOG_NAMES)
+def test_recover_without_log_or_damage(tmp_path, name):
+    page_log = PageLog(str(tmp_path / name))
+    assert page_log.recover() == 0
+    assert not page_log.exists()
+
+    write_pages(page_log, [(1, [{'number': 1}]), (2, [])])
+    size = os.path.getsize(page_log.path)
+    assert page_log.recover() == 2
+    assert os.path.getsize(page_log.path) == size
+
+
+@pytest.mark.parametrize('name', LOG_NAMES)
+def test_resume_fetch_from_page_after_recovered(tmp_path, name):
+    """中断的全量抓取从恢复出的最后一页之后继续，合并后与一次完整抓取得到的PR相同"""
+    server = FakeGitHubServer()
+    server.add_pulls(OWNER, REPO, synthetic_prs(95))
+    server.start()
+    try:
+        with GitHubClient(max_retries=3, retry_delay=0.01, max_rate=1000, base_url=server.base_url) as client:
+            full = {page: prs for page, prs in fetch_pull_pages(client, OWNER, REPO, per_page=20)}
+            # 第1、2页完整写入，第3页写到一半时崩溃
+            page_log = PageLog(str(tmp_path / name))
+            write_pages(page_log, [(page, full[page]) for page in (1, 2)], truncated=(3, full[3]))
+
+            start_page = page_log.recover() + 1
+            assert start_page == 3
+            resumed = list(page_log.iter_records())
+            pages = dict(fetch_pull_pages(client, OWNER, REPO, per_page=20, start_page=start_page))
+    finally:
+        server.stop()
+
+    assert sorted(pages) == [3, 4, 5]
+    resumed += [pr for page in sorted(pages) for pr in pages[page]]
+    assert [pr['number'] for pr in resumed] == [pr['number'] for page in sorted(full) for pr in full[page]]